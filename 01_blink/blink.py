@@ -17,6 +17,17 @@ from litex.build.generic_platform import *
 # In the case of the icebitsy it is a Lattice ICE40KUP5 so we import
 # "Lattice" build flow which uses the YosysHQ tools.
 from litex.build.lattice import LatticePlatform
+#
+# The build helpers live in ../tools and the Migen modules shared
+# between the examples in ../gateware
+#
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from tools import cli
+from tools.fastforward import Until
+from gateware.ticks import TickGenerator
+from gateware.crg import CRG, describe
 
 #
 # Step four here is building a "platform" (note that Litex-boards already
@@ -108,9 +119,29 @@ class Icebitsy(LatticePlatform):
 	# the specific Lattice FPGA we are using and its package (which affects
 	# mapping pin numbers to FPGA I/Os.
 	#
-	def __init__(self, toolchain="icestorm"):
+	def __init__(self, toolchain="icestorm", sys_freq=None):
 		LatticePlatform.__init__(self, "ice40-up5k-sg48", _io, 
 														toolchain=toolchain)
+		#
+		# To run faster than 12 MHz give it a 'sys_freq' (in Hz) and the
+		# sys clock comes from the PLL instead (see ../gateware/crg.py).
+		# The CRG is made here, before the design, because it changes
+		# default_clk_period to the frequency the PLL really makes and
+		# the TickGenerator needs to see that. It gets added to the
+		# design in finalize() below.
+		#
+		self.crg = CRG(self, sys_freq) if sys_freq is not None else None
+
+	#
+	# This is where LiteX adds its own clock domain (straight off the
+	# clock pin) when the design doesn't have one, so ours has to go in
+	# first.
+	#
+	def finalize(self, fragment, *args, **kwargs):
+		if self.crg is not None and not fragment.clock_domains:
+			fragment += self.crg.get_fragment()
+		LatticePlatform.finalize(self, fragment, *args, **kwargs)
+
 #	The litex platforms include this do_finalize method but I'm not really
 #	sure who calls them or for what reason. It adds a constraint for 
 #	timing analysis. Sadly it 
@@ -119,14 +150,13 @@ class Icebitsy(LatticePlatform):
 		LatticePlatform.do_finalize(self, fragment)
 		self.add_period_constraint(self.lookup_request("clk12mhz", loose=True),
  												Icebitsy.default_clk_period)
+		# and the PLL's output, so nextpnr checks the sys clock too
+		if self.crg is not None and self.crg.config is not None:
+			self.add_period_constraint(self.crg.cd_sys.clk,
+												self.default_clk_period)
 
 #
 # And now the "design" (sort of like the 'behavioural' clause of VHDL)
-#
-# First off create a Platform instance ...
-#
-platform = Icebitsy()
-
 #
 # Now we define a module that is a "blinker" (basically an LED, a
 # counter/divider, and a clock source). We'll see later that this is
@@ -147,46 +177,51 @@ platform = Icebitsy()
 # It is possible to create additional clock domains but that is not
 # needed for this simple example.
 #
+# The platform is passed in rather than being a global so that you can
+# import this file and make a Blink without building anything.
+#
 class Blink(Module):
 	"""
-		Blink the USER leds on the Icebitsy
+		Blink the USER leds on the Icebitsy. 'ppm' and 'dsp' are handed
+		to the TickGenerator.
 	"""
-	def __init__(self, blink_freq):
+	def __init__(self, platform, blink_freq, ppm=None, dsp=False):
 		#
 		# Now we "request", which is equivalent to fetching the constraints
 		# for, the two LEDs on this platform.
 		#
-		red_led = platform.request("user_led_red")
-		green_led = platform.request("user_led_green")
+		self.red_led = red_led = platform.request("user_led_red")
+		self.green_led = green_led = platform.request("user_led_green")
 		
 		#
 		# Grab the user button as a signal.
 		#
-		button = platform.request("user_button")
+		self.button = button = platform.request("user_button")
 
 		# 
 		# To create a delay, we need a "divide-by-n" counter, and we're going
 		# to pass in the desired blink frequency when we instantiate this
-		# module. Since the clock rate is 12 MHz, and we'll not really want
-		# to go any slower than, say half a hertz, we can use a 24 bit counter.
+		# module. This used to be a 24 bit counter right here, but every
+		# example needs one of these so it now lives in a module of its own,
+		# the TickGenerator in ../gateware/ticks.py. We ask it for a 'tick'
+		# and it gives us a signal that is high for one clock cycle, at the
+		# rate we asked for.
 		#
-		counter = Signal(24)
-
+		# The LED has to toggle twice per blink (on, then off) so we ask for
+		# a tick at twice the blink frequency. The tick generator does the
+		# grunt work of figuring out how many clock cycles that is from the
+		# platform's clock period (in nanoseconds), basically
 		#
-		# This is an example of how you can use python to do some grunt work
-		# for you. (there are better examples later). Basically calculate
-		# how many 'ticks' are in one half period of the blink frequency.
+		#	1e9 / (2 * blink_freq * period)
 		#
-		# Since period is in nanoseconds, The delay in 'ticks' would be 
-		# (((1e9 * 1/blink_freq) / period) / 2) - 1
-		#             \              \       \    \--- zero based period
-		#              \              \       \------- half the period 
-		#               \              \-------------- period in ns
-		#                \---------------------------- The blink period in ns
+		# and sizes its counter to fit. When that doesn't divide evenly
+		# and you want it exact, give it a tolerance in 'ppm' and it uses
+		# an NCO instead (--tick-ppm). With 'dsp' (--dsp) the counter goes
+		# in one of the UP5K's DSP blocks instead of logic cells.
 		#
-		# As a simplification 1e9 / 2 is 500e6 (a bit of algebra)
-		# 
-		ticks = int(500e6 / (blink_freq * platform.default_clk_period)) - 1
+		self.submodules.ticks = TickGenerator(platform.default_clk_period, ppm,
+												dsp)
+		toggle = self.ticks.tick(2 * blink_freq)
 
 		#
 		# This code is the "synchronous" stuff going on in the FPGA
@@ -196,22 +231,17 @@ class Blink(Module):
 		# "when positive edge of the clock, do ..." kind of block.
 		#
 		self.sync += [
-			# in FHDL we use .eq() on a signal to assign it a value.
-			# In this case we are incrementing the counter by 1. This
-			# happens on every clock cycle, so 12 million times a second.
-			counter.eq(counter + 1),
 			# the next statement is an "if" statement. The way this works
 			# is if the condition (first argument) evaluates to 'true' then
 			# the statements that follow should be executed. 
 			#
-			# The condition checks to see if the count is equal to 1/2 the
-			# number of clock ticks in the blink frequency. Note that this
-			# is statically computed, this module doesn't vary its blink
-			# speed once instantiated.
-			If(counter == ticks,
-				# when true, the counter is reset to 0 and the red LED is
-				# toggled to it's alternate state
-				counter.eq(0),
+			# The condition is our tick, which is only true for one clock
+			# out of every half period of the blink frequency. Note that
+			# this is statically computed, this module doesn't vary its
+			# blink speed once instantiated.
+			If(toggle,
+				# when true, the red LED is toggled to it's alternate state.
+				# in FHDL we use .eq() on a signal to assign it a value.
 				red_led.eq(~red_led),
 			)
 			# and that is all there is to it, the LED blinks at 'blink_rate'
@@ -239,16 +269,76 @@ class Blink(Module):
 		]
 
 #
-# So this bit of code instantiates the Blink module.
+# A testbench for --sim (and tools/simsuite.py). It is a Python generator
+# that is stepped along with the design: 'yield signal' reads a signal,
+# 'yield signal.eq(value)' sets one, a bare 'yield' is one clock, and
+# 'yield Until([signals], limit)' lets the clock run until one of the
+# signals changes (see tools/fastforward.py). The clock is slowed down to
+# 48 Hz for simulation so the LED toggles every 8 clocks instead of every
+# two million (unless you ask for --real-clock).
 #
-led_module = Blink(3);
+SIM_CLK_PERIOD = 1e9 / (8 * 2 * 3)
 
-#
-# And finally, we "build" it which takes the module structure as defined
-# and combines it with the platform to synthesize a design. The output
-# of the build stream is a bit file that we can load into the board
-# (see the makefile)
-#
+def testbench(top):
+	"""
+		Check the red LED toggles at the right rate and that the green
+		LED follows it, or its opposite while the button is pressed.
+	"""
+	# Blink(platform, 3) toggles the LED 6 times a second
+	gap = top.ticks.cycles[2 * 3]
+	for toggle in range(10):
+		if toggle == 5:
+			yield top.button.eq(1)
+		n = yield Until([top.red_led], 2 * gap)
+		# (the first toggle is a clock or so late, the tick starts at reset)
+		if toggle and abs(n - gap) > 2 * top.ticks.jitter[2 * 3]:
+			raise AssertionError(f"red LED toggled after {n} clocks, "
+									f"not {gap:g}")
+		red = yield top.red_led
+		green = yield top.green_led
+		button = yield top.button
+		if green != (red ^ button):
+			raise AssertionError(f"green is {green} with red {red} and "
+									f"the button at {button}")
+
+def probes(top):
+	"""
+		The signals --trace records (see tools/trace.py)
+	"""
+	return {"red": top.red_led, "green": top.green_led, "button": top.button}
+
+def main(argv=None):
+	parser = cli.parser("Blink the LEDs on the icebitsy")
+	parser.add_argument("--sys-freq", type=float, default=None,
+						help="run the sys clock at this many MHz from the "
+								"PLL (default 12 MHz from the clock pin)")
+	args = parser.parse_args(argv)
+
+	#
+	# First off create a Platform instance ...
+	#
+	platform = Icebitsy(sys_freq=args.sys_freq and args.sys_freq * 1e6)
+	if platform.crg is not None and platform.crg.config is not None:
+		print(describe(platform.crg.config, args.sys_freq * 1e6))
+
+	#
+	# And then hand it, and a way to instantiate the Blink module, to the
+	# command line code in tools/cli.py. By default that "builds" it which
+	# takes the module structure as defined and combines it with the
+	# platform to synthesize a design. The output of the build stream is a
+	# bit file that we can load into the board (see the makefile)
+	#
+	# It doesn't call platform.build(...) directly, it goes through
+	# cached_build(), which does the same thing but skips yosys and nextpnr
+	# when the Verilog and constraints they would see haven't changed since
+	# the last time (see tools/buildcache.py). You can also ask it for
+	# just the Verilog (--verilog) or to simulate the design (--sim).
+	#
+	return cli.run(platform, lambda: Blink(platform, 3, args.tick_ppm, args.dsp),
+					args=args,
+					testbench=testbench, sim_clk_period=SIM_CLK_PERIOD,
+					probes=probes, name="blink")
 
-platform.build(led_module)
+if __name__ == "__main__":
+	main()
 
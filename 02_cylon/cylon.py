@@ -15,12 +15,17 @@ from litex.build.generic_platform import *
 # platform from litex_boards.platform
 #
 from litex_boards.platforms.icebreaker_bitsy import Platform
-
 #
-# Create an instance of an icebitsy from it. This has the various LEDs
-# and connectors pre-defined.
+# The build helpers live in ../tools and the Migen modules shared
+# between the examples in ../gateware
 #
-icebitsy = Platform()
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from tools import cli
+from tools.fastforward import Until
+from gateware.ticks import TickGenerator
+from tools.compare import compare
 
 #
 # Using python to automate some typing.
@@ -56,18 +61,28 @@ def gen_led8(pmod_port, num):
 	return tuple(led8)
 
 #
-# Two LED8 Pmods are attached, one to PMOD1 and one to PMOD2.
-# The gen_led8 code creates a tuple that defines an "extension." Module
-# code can then request that extension from the platform later and that
-# is what we do in this code. We add a different unit number to them so
-# that we can pick which one we want to wire up in our module code.
+# Create an instance of an icebitsy from it. This has the various LEDs
+# and connectors pre-defined.
+#
+# An LED8 Pmod is attached to each PMOD port in 'pmods', by default one
+# to PMOD1 and one to PMOD2. The gen_led8 code creates a tuple that
+# defines an "extension." Module code can then request that extension
+# from the platform later and that is what we do in this code. We add a
+# different unit number to each (0 for the first port in the list, 1
+# for the next, ...) so that we can pick which one we want to wire up
+# in our module code.
 #
-icebitsy.add_extension([gen_led8("PMOD1", 0)])
-icebitsy.add_extension([gen_led8("PMOD2", 1)])
+PMODS = ("PMOD1", "PMOD2")
+
+def icebitsy_with_leds(pmods=PMODS):
+	icebitsy = Platform()
+	for num, pmod_port in enumerate(pmods):
+		icebitsy.add_extension([gen_led8(pmod_port, num)])
+	return icebitsy
 
 #
 # At this point we have an augmented platform with extensions describing
-# the connection to two LED8 PMODs. At this point then we define a top
+# the connection to the LED8 PMODs. At this point then we define a top
 # level module like we did in Blink to send some data to them.
 #
 # If you don't understand why it's called 'Cylon' look up Battlestar
@@ -76,108 +91,132 @@ icebitsy.add_extension([gen_led8("PMOD2", 1)])
 #
 class Cylon(Module):
 	"""
-		A module that has an LED bouncing back and forth on two LED8
-		PMODs connected to PMOD port 1 and PMOD port 2
+		A module that has an LED bouncing back and forth on the LED8
+		PMODs connected to the PMOD ports in 'pmods', eight LEDs for
+		each, the first port's at the bottom. Pass it a platform from
+		icebitsy_with_leds() with the same 'pmods' (or one with the same
+		extensions added). 'bounce' picks how it finds the ends, "bit"
+		looks at the end LED and "compare" compares the whole display
+		with the LED being there, the way this example first did it.
+		'ppm' and 'dsp' are handed to the TickGenerator.
 	"""
 
-	def __init__(self, blink_freq):
+	def __init__(self, icebitsy, blink_freq, ppm=None, dsp=False,
+					pmods=PMODS, bounce="bit"):
 		#
 		# As with the Blink example, we "request" the signals associated
-		# with the name "led8" because we're going to be talking to them.
+		# with the name "led8" because we're going to be talking to them,
+		# one for each PMOD.
 		#
-		leds = icebitsy.request("led8", 0)
-		more_leds = icebitsy.request("led8", 1)
+		led8s = [icebitsy.request("led8", num) for num in range(len(pmods))]
+		width = 8 * len(pmods)
 		#
 		# Now we define a 'display' register which will hold the state
-		# of 16 LEDs and we add the parameter 'reset=1' which means that
-		# the reset state will set the value to 0b0000000000000001
-		display = Signal(16, reset=1)
+		# of all the LEDs and we add the parameter 'reset=1' which means
+		# that the reset state will set the value to 0b000...0001
+		self.display = display = Signal(width, reset=1)
 
 		#
-		# Direction remembers if we are going left or right.
+		# Direction remembers if we are going left (1) or right (0).
 		#
 		direction = Signal(1)
 
 		#
-		# Same counter/ticks like we used in Blink, look at the comments
-		# in that code for why 24 is enough bits of counter or how we
-		# compute ticks.
-		counter = Signal(24)
-		ticks = int(500e6 / (blink_freq * icebitsy.default_clk_period)) - 1
+		# Same tick generator like we used in Blink, look at the comments
+		# in that code for how it works. The chaser takes a step twice
+		# per 'blink'.
+		self.submodules.ticks = TickGenerator(icebitsy.default_clk_period, ppm,
+												dsp)
+		step = self.ticks.tick(2 * blink_freq)
 
 
 		#
-		# And this is a contrived example (in a planned example they would have
-		# been defined this way) but it demonstrates an FHDL function i
-		# 'Cat(...)' which is short for concatenate.
+		# This demonstrates an FHDL function 'Cat(...)' which is short
+		# for concatenate.
 		#
-		# This code is essentially punning (symlinking?) the 16 leds in the
-		# two LED8 PMODs into a single bus called "all_leds" which has a 'shape'
-		# of 16. What that means is we can assign a 16 bit value to this bus
-		# and it will change all of the LEDs at once. (We don't need to turn
-		# each one on individually). Now this example is just adding them in
-		# order, but the nice thing here is that you could combine a bunch of
-		# signals into a single bus for easier assignment or reading.
+		# This code is essentially punning (symlinking?) the LEDs in all
+		# of the LED8 PMODs into a single bus called "all_leds" which has
+		# a 'shape' of 8 times the number of PMODs. What that means is we
+		# can assign a value to this bus and it will change all of the
+		# LEDs at once. (We don't need to turn each one on individually).
+		# Now this example is just adding them in order, but the nice
+		# thing here is that you could combine a bunch of signals into a
+		# single bus for easier assignment or reading.
 		#
-		all_leds = Cat(
-				leds.led0, leds.led1, leds.led2, leds.led3,
-				leds.led4, leds.led5, leds.led6, leds.led7,
-				more_leds.led0, more_leds.led1, more_leds.led2, more_leds.led3,
-				more_leds.led4, more_leds.led5, more_leds.led6, more_leds.led7,
-		)
+		# With two PMODs this used to be typed out by hand,
+		#
+		#	Cat(leds.led0, leds.led1, ..., more_leds.led7)
+		#
+		# but Cat() takes any number of signals, so Python can make the
+		# list for us, led0 to led7 of the first PMOD, then of the next.
+		#
+		all_leds = Cat(*[getattr(led8, f"led{i}") for led8 in led8s
+							for i in range(8)])
 
 		#
 		# Now for the synchronous part.
 		#
-		# When enough ticks have gone by (the If() statement) the code does
+		# When the tick comes around (the If() statement) the code does
 		# the following:
 		#
 		#	if the direction is LEFT then
-		#		if the display is 0b1000...0 then
+		#		if the LED is at the left end then
 		#			set the direction to RIGHT
+		#			move it one to the right
 		#		else
-		#			rotate the display one bit left
+		#			move it one to the left
 		#	else
-		#		if the display is 0b000...1 then
+		#		if the LED is at the right end then
 		#			set the direction to LEFT
+		#			move it one to the left
 		#		else
-		#			rotate the display one bit right
+		#			move it one to the right
 		#
 		# Many will immediately recognize that this is the algorithm for
 		# having a light ping pong from one end of a string of lights to
 		# the other.
 		#
+		# How do we know the LED is at an end? The first version of this
+		# compared the whole display with 0b1000000000000000 and 0b1.
+		# That is a 16 bit compare, and with three PMODs it would be a 24
+		# bit one, each a tree of LUTs that gets deeper the wider it is.
+		# But only one LED is ever lit, so the LED is at the left end
+		# exactly when the leftmost bit is set, and that is all we need
+		# to look at however many LEDs there are.
+		#
+		if bounce == "bit":
+			at_left, at_right = display[-1], display[0]
+		elif bounce == "compare":
+			at_left, at_right = display == 1 << (width - 1), display == 1
+		else:
+			raise ValueError(f"unknown bounce {bounce}")
+
+		#
+		# Both branches come down to "which way does it move on this
+		# step", so we work that out first (as 'left') and then there is
+		# only one shift to pick for each bit of the display, from the
+		# bit on its left or the one on its right.
+		#
+		left = Signal()
+		self.comb += If(direction == 1,
+			left.eq(~at_left)
+		).Else(
+			left.eq(at_right)
+		)
 		self.sync += [
-			counter.eq(counter + 1),
-			If(counter == ticks,
-				counter.eq(0),
-				#
-				# This is the chaser code, it combines remembering
-				# what direction the chaser is running, resetting the
-				# display when it gets to the end, and then changing
-				# the direction.
-				#
-				If(direction == 1,
-					If (display == 0b1000000000000000,
-						display.eq(0b0100000000000000),
-						direction.eq(0),
-					).Else(
-						display.eq(display << 1)
-					)
+			If(step,
+				direction.eq(left),
+				If(left,
+					display.eq(display << 1)
 				).Else(
-					If (display == 0b1,
-						display.eq(0b10),
-						direction.eq(1)
-					).Else(
-						display.eq(display >> 1)
-					)
+					display.eq(display >> 1)
 				)
 			)
 		]
 		#
 		# This is the combinatorial code. 
 		# This code sends the state of the display register to
-		# all 16 LEDs.
+		# all of the LEDs.
 		# 
 		#
 		self.comb += [
@@ -185,7 +224,8 @@ class Cylon(Module):
 			#
 			# While writing this code I learned of several things that
 			# didn't work in Migen/FHDL. I've left them in so that you
-			# can see what my guesses looked like.
+			# can see what my guesses looked like (from when there were
+			# always two PMODs, 'leds' and 'more_leds').
 			#
 			# This doesn't work, it was my first attempt. Remember how I
 			# named all of those subsignals so that I could refer to
@@ -206,19 +246,7 @@ class Cylon(Module):
 			#
 #			leds.led0.eq(display[0]),
 #			leds.led1.eq(display[1]),
-#			leds.led2.eq(display[2]),
-#			leds.led3.eq(display[3]),
-#			leds.led4.eq(display[4]),
-#			leds.led5.eq(display[5]),
-#			leds.led6.eq(display[6]),
-#			leds.led7.eq(display[7]),
-#			more_leds.led0.eq(display[8]),
-#			more_leds.led1.eq(display[9]),
-#			more_leds.led2.eq(display[10]),
-#			more_leds.led3.eq(display[11]),
-#			more_leds.led4.eq(display[12]),
-#			more_leds.led5.eq(display[13]),
-#			more_leds.led6.eq(display[14]),
+#			...
 #			more_leds.led7.eq(display[15]),
 			#
 			# This works AND it is easier to read.
@@ -231,12 +259,77 @@ class Cylon(Module):
 		]
 
 #
-# now we instantiate our LED chaser.
+# The testbench for --sim (see 01_blink for how they work). With the
+# clock slowed down to 200 Hz the chaser takes a step every 4 clocks.
 #
-led_module = Cylon(25);
+SIM_CLK_PERIOD = 1e9 / (4 * 2 * 25)
 
-#
-# And "build" this into a bit file
-#
-icebitsy.build(led_module)
+def testbench(top):
+	"""
+		Follow the lit LED for two trips up and down the display and
+		check it moves one place per step and turns around at both ends.
+	"""
+	# Cylon(icebitsy, 25) takes 50 steps a second
+	gap = top.ticks.cycles[2 * 25]
+	width = len(top.display)
+	position, direction, turns = 0, 1, []
+	for step in range(4 * (width - 1) + 2):
+		n = yield Until([top.display], 2 * gap)
+		display = yield top.display
+		if step and abs(n - gap) > 2 * top.ticks.jitter[2 * 25]:
+			raise AssertionError(f"step {step} came after {n} clocks, "
+									f"not {gap:g}")
+		if not 0 <= position + direction < width:
+			direction = -direction
+			turns.append(position)
+		position += direction
+		if display != 1 << position:
+			raise AssertionError(f"step {step}: display is {display:0{width}b}, "
+									f"the LED should be at {position}")
+	if turns[:3] != [width - 1, 0, width - 1]:
+		raise AssertionError(f"turned around at {turns}")
+
+def probes(top):
+	"""
+		The signals --trace records (see tools/trace.py)
+	"""
+	return {"display": top.display}
+
+def main(argv=None):
+	bounces = ("bit", "compare")
+	parser = cli.parser("LED chaser on LED8 PMODs")
+	parser.add_argument("--pmods", default=",".join(PMODS),
+						help=f"the PMOD ports with an LED8 on them, bottom "
+								f"first (default {','.join(PMODS)})")
+	parser.add_argument("--bounce", choices=bounces, default="bit",
+						help="how the ends are found (default bit)")
+	parser.add_argument("--compare", action="store_true",
+						help="build 8, 16 and 24 LED chasers each way of "
+								"finding the ends and compare LCs and fmax")
+	args = parser.parse_args(argv)
+	pmods = args.pmods.split(",")
+
+	if args.compare:
+		def variant(pmods, bounce):
+			icebitsy = icebitsy_with_leds(pmods)
+			return icebitsy, Cylon(icebitsy, 25, pmods=pmods, bounce=bounce)
+		ports = ("PMOD1", "PMOD2", "PMOD3")
+		variants = {f"{8 * n}-{bounce}":
+						lambda n=n, bounce=bounce: variant(ports[:n], bounce)
+					for n in (1, 2, 3) for bounce in bounces}
+		return compare(variants, os.path.join(args.build_dir, "compare"))
+
+	icebitsy = icebitsy_with_leds(pmods)
+	#
+	# now we instantiate our LED chaser, and "build" this into a bit file
+	# (or just write the Verilog, or simulate it, see tools/cli.py)
+	#
+	return cli.run(icebitsy, lambda: Cylon(icebitsy, 25, args.tick_ppm,
+												args.dsp, pmods, args.bounce),
+					args=args, testbench=testbench,
+					sim_clk_period=SIM_CLK_PERIOD, probes=probes,
+					name="cylon")
+
+if __name__ == "__main__":
+	main()
 
@@ -7,6 +7,20 @@ from migen import *
 from litex.build.generic_platform import *
 from litex_boards.platforms.icebreaker_bitsy import Platform
 #
+# The build helpers live in ../tools, the Migen modules shared between
+# the examples in ../gateware and the PMOD modules in ../pmod
+#
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+								"..", "pmod"))
+from tools import cli
+from gateware.ticks import TickGenerator
+from gateware.dabble import BinaryToBCD
+from tools.compare import compare
+from tools import simsuite
+#
 # This cleans up the code significantly. Here we have abstracted the
 # seven segment LED display PMOD into its own module. When we instantiate
 # it in our design we will wire it to signals in the design and tell
@@ -14,28 +28,29 @@ from litex_boards.platforms.icebreaker_bitsy import Platform
 #
 from led7segment import SevenSegmentLedDisplay
 
-# we'll call it a bitsy of type Platform()
-bitsy = Platform()
-
 
 class Counter(Module):
 	"""
 		This is a binary coded decimal counter module. When it counts up
 		at 'count_speed' counts per second it goes from 00 to 99 and rolls
-		over.
+		over. With datapath="binary" it counts in plain binary instead
+		and converts that to BCD for the display. 'ppm' and 'dsp' are
+		handed to the TickGenerator.
 	"""
-	def __init__(self, count_speed):
+	def __init__(self, bitsy, count_speed, datapath="bcd", brightness=None,
+					ppm=None, dsp=False):
 		#
 		# This is going to be our count
 		#
-		count = Signal(8)
+		self.count = count = Signal(8)
 		gled = bitsy.request("user_ledg_n")
 
 		#
-		# The 'standard' divide by n clock divider
+		# The 'standard' divide by n clock divider, shared with the
+		# display module(s) below so there is only one prescaler.
 		#
-		divisor = Signal(24)
-		ticks = int((500e6/(count_speed * bitsy.default_clk_period))) - 1
+		self.submodules.ticks = TickGenerator(bitsy.default_clk_period, ppm, dsp)
+		step = self.ticks.tick(2 * count_speed)
 
 		#
 		# The sequential logic increments the counter in 'count' at a rate
@@ -46,21 +61,42 @@ class Counter(Module):
 		# a binary coded decimal counter and the display shows 00 -> 99 before
 		# rolling over again.
 		#
-		self.sync += [
-			divisor.eq(divisor + 1),
-			If(divisor == ticks,
-				divisor.eq(0),
+		if datapath == "bcd":
+			self.sync += [
+				If(step,
+					gled.eq(~gled),
+					If(count == 0x99,
+						count.eq(0)
+					).Elif(count[:4] == 9,
+						count.eq(count + 0x7)
+					).Else(
+						count.eq(count + 1)
+					)
+				),
+			]
+		#
+		# The other way to do it is to count in binary (0 to 99) and then
+		# convert that to BCD with the double dabble converter from
+		# ../gateware/dabble.py. The counter is then just an adder, and
+		# the converter is pipelined so it doesn't slow the clock down.
+		#
+		elif datapath == "binary":
+			binary = Signal(bits_for(99))
+			self.sync += If(step,
 				gled.eq(~gled),
-				If(count == 0x99,
-					count.eq(0)
-				).Elif(count[:4] == 9,
-					count.eq(count + 0x7)
+				If(binary == 99,
+					binary.eq(0)
 				).Else(
-					count.eq(count + 1)
+					binary.eq(binary + 1)
 				)
-			),
-		]
-		self.comb += [ ]
+			)
+			self.submodules.dabble = BinaryToBCD(len(binary), 2)
+			self.comb += [
+				self.dabble.binary.eq(binary),
+				count.eq(self.dabble.bcd),
+			]
+		else:
+			raise ValueError(f"unknown datapath {datapath}")
 		#
 		# This bit instantiates the SevenSegmentLedDisplay module and
 		# "connects" the count signal to the signal 'value' in the
@@ -70,17 +106,72 @@ class Counter(Module):
 		# into a single module and then optimizes by eliminating dead
 		# branches and redundant code, Etc.
 		#
-		self.submodules += [SevenSegmentLedDisplay(bitsy, "PMOD1", 
-															value=count)]
-#
-# Now instantiate a counter, which instantiates an LED display
-# sub-module which is showing the count.
-#
-count_module = Counter(5);
+		self.submodules.display = SevenSegmentLedDisplay(bitsy, "PMOD1",
+												value=count, ticks=self.ticks,
+												brightness=brightness)
+
 
 #
-# And "build" this into a bit file
+# The testbench for --sim (see 01_blink for how they work). With the
+# clock slowed down to 20 Hz the display switches digits every clock
+# and the count goes up every other clock, so it gets all the way round
+# to 99 and back to 00 in a few hundred clocks.
 #
+SIM_CLK_PERIOD = 1e9 / 20
+
+def testbench(top):
+	"""
+		Check every step of the count, the roll over, and that the
+		display shows the count.
+	"""
+	# the count steps on the 2 * count_speed tick, Counter(bitsy, 5)
+	per_count = top.ticks.cycles[2 * 5]
+	yield from simsuite.check_counter(top.count, 2, per_count,
+						[(top.display.disp, 0)],
+						jitter=top.ticks.jitter[2 * 5])
+
+def probes(top):
+	"""
+		The signals --trace records (see tools/trace.py)
+	"""
+	pins = top.display.disp
+	return {"count": top.count, "sel": pins.sel, "num": pins.num}
+
+def main(argv=None):
+	parser = cli.parser("Two digit BCD counter on a seven segment PMOD")
+	parser.add_argument("--datapath", choices=("bcd", "binary"),
+						default="bcd", help="how to count (default bcd)")
+	parser.add_argument("--brightness", type=int, default=None,
+						help="display brightness, 1 to 16 (default full)")
+	parser.add_argument("--compare", action="store_true",
+						help="build both datapaths and compare LCs and fmax "
+								"(with --dsp, each with and without DSP blocks)")
+	args = parser.parse_args(argv)
+
+	if args.compare:
+		def variant(datapath, dsp=False):
+			bitsy = Platform()
+			return bitsy, Counter(bitsy, 5, datapath, dsp=dsp)
+		variants = {d: lambda d=d: variant(d) for d in ("bcd", "binary")}
+		if args.dsp:
+			variants.update({f"{d}+dsp": lambda d=d: variant(d, True)
+								for d in ("bcd", "binary")})
+		return compare(variants, os.path.join(args.build_dir, "compare"))
+
+	# we'll call it a bitsy of type Platform()
+	bitsy = Platform()
 
-bitsy.build(count_module)
+	#
+	# Now instantiate a counter, which instantiates an LED display
+	# sub-module which is showing the count, and "build" this into a
+	# bit file (or just write the Verilog, or simulate it, see
+	# tools/cli.py)
+	#
+	return cli.run(bitsy,
+				lambda: Counter(bitsy, 5, args.datapath, args.brightness,
+								args.tick_ppm, args.dsp),
+				args=args, testbench=testbench, sim_clk_period=SIM_CLK_PERIOD,
+				probes=probes, name="display")
 
+if __name__ == "__main__":
+	main()
@@ -6,30 +6,102 @@
 from migen import *
 from litex.build.generic_platform import *
 from litex_boards.platforms.icebreaker_bitsy import Platform
-from led7segment import SevenSegmentLedDisplay
-
-# we'll call it a bitsy of type Platform()
-bitsy = Platform()
+#
+# The build helpers live in ../tools, the Migen modules shared between
+# the examples in ../gateware and the PMOD modules in ../pmod
+#
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+								"..", "pmod"))
+from tools import cli
+from gateware.ticks import TickGenerator
+from gateware.bcd import BCDCounter
+from gateware.dabble import BinaryToBCD
+from tools.compare import compare
+from tools import simsuite
+from led7segment import SevenSegmentScanner
 
 
 class Counter(Module):
-	def __init__(self, count_speed):
+	"""
+		A four digit BCD counter shown on two seven segment PMODs.
+		'datapath' picks how the count is done, "bcd" uses the digit at
+		a time BCDCounter from ../gateware/bcd.py, "chain" is the
+		original If/Elif chain below, and "binary" counts in plain
+		binary and converts that to BCD for the display. 'ppm' and 'dsp'
+		are handed to the TickGenerator.
+	"""
+	def __init__(self, bitsy, count_speed, datapath="bcd", ppm=None,
+					dsp=False):
 		#
 		# This is going to be our count (now 16 bits wide)
 		#
-		count = Signal(16)
+		self.count = count = Signal(16)
 		gled = bitsy.request("user_ledg_n")
 
 		#
-		# The 'standard' divide by n clock divider
+		# The 'standard' divide by n clock divider, shared with the
+		# display module(s) below so there is only one prescaler.
 		#
-		divisor = Signal(24)
-		ticks = int((500e6/(count_speed * bitsy.default_clk_period))) - 1
+		self.submodules.ticks = TickGenerator(bitsy.default_clk_period, ppm, dsp)
+		step = self.ticks.tick(2 * count_speed)
 
+		if datapath == "bcd":
+			#
+			# The BCD counter works out the carries for each digit
+			# separately, so it doesn't get any slower with more digits.
+			# Its 'carry' is the roll over from 9999 to 0000.
+			#
+			self.submodules.bcd = BCDCounter(4, ce=step)
+			self.comb += count.eq(self.bcd.count)
+			self.sync += If(self.bcd.carry, gled.eq(~gled))
+		elif datapath == "chain":
+			self._chain(count, step, gled)
+		elif datapath == "binary":
+			self._binary(count, step, gled)
+		else:
+			raise ValueError(f"unknown datapath {datapath}")
+
+		#
+		# we will put the 'upper' two digits on PMOD1 and the 'lower' two
+		# digits on PMOD2. This used to be two SevenSegmentLedDisplay
+		# modules, one per PMOD, but the scanner drives both of them with
+		# a single glyph decoder. A third display on PMOD3 would just be
+		# one more entry in each list.
+		#
+		self.submodules.display = SevenSegmentScanner(bitsy,
+										["PMOD1", "PMOD2"],
+										[count[8:], count[:8]],
+										ticks=self.ticks)
+
+	def _binary(self, count, step, gled):
+		#
+		# An ordinary binary counter (which yosys builds out of the iCE40
+		# carry chain) from 0 to 9999, fed through the pipelined double
+		# dabble converter from ../gateware/dabble.py to get the digits.
+		# The display is a few clocks behind the count, which nobody is
+		# going to notice.
+		#
+		binary = Signal(bits_for(9999))
+		self.sync += If(step,
+			If(binary == 9999,
+				gled.eq(~gled),
+				binary.eq(0)
+			).Else(
+				binary.eq(binary + 1)
+			)
+		)
+		self.submodules.dabble = BinaryToBCD(len(binary), 4)
+		self.comb += [
+			self.dabble.binary.eq(binary),
+			count.eq(self.dabble.bcd),
+		]
+
+	def _chain(self, count, step, gled):
 		self.sync += [
-			divisor.eq(divisor + 1),
-			If(divisor == ticks,
-				divisor.eq(0),
+			If(step,
 				#
 				# We have to add several new tests for roll over in the 
 				# hundreds and thousands places, as well as a new reset
@@ -49,24 +121,74 @@ class Counter(Module):
 				)
 			),
 		]
-		self.comb += [ ]
-		# we will put the 'upper' two digits on PMOD1
-		self.submodules += [SevenSegmentLedDisplay(bitsy, "PMOD1", 
-															value=count[8:])]
-		# and the 'lower' two digits on PMOD2
-		self.submodules += [SevenSegmentLedDisplay(bitsy, "PMOD2", 
-															value=count[:8])]
 
 
 #
-# Now instantiate a counter, which instantiates an LED display
-# sub-module which is showing the count.
+# The testbench for --sim (see 01_blink for how they work). With the
+# clock slowed down to 40 Hz the display switches digits every clock
+# and the count goes up every other clock, so it gets all the way round
+# to 9999 and back to 0000 in a few thousand clocks.
 #
-count_module = Counter(10);
+SIM_CLK_PERIOD = 1e9 / 40
 
-#
-# And "build" this into a bit file
-#
+def testbench(top):
+	"""
+		Check every step of the count, the roll over, and that the
+		display shows the count.
+	"""
+	# the count steps on the 2 * count_speed tick, Counter(bitsy, 10)
+	per_count = top.ticks.cycles[2 * 10]
+	yield from simsuite.check_counter(top.count, 4, per_count,
+						[(top.display.displays[0], 8),
+						 (top.display.displays[1], 0)],
+						jitter=top.ticks.jitter[2 * 10])
+
+def probes(top):
+	"""
+		The signals --trace records (see tools/trace.py), the pins of
+		each display are sel0, num0, sel1, ...
+	"""
+	signals = {"count": top.count}
+	for i, pins in enumerate(top.display.displays):
+		signals[f"sel{i}"] = pins.sel
+		signals[f"num{i}"] = pins.num
+	return signals
+
+def main(argv=None):
+	datapaths = ("bcd", "chain", "binary")
+	parser = cli.parser("Four digit BCD counter on two seven segment PMODs")
+	parser.add_argument("--datapath", choices=datapaths, default="bcd",
+						help="how to count (default bcd)")
+	parser.add_argument("--compare", action="store_true",
+						help="build each datapath and compare LCs and fmax "
+								"(with --dsp, each with and without DSP blocks)")
+	args = parser.parse_args(argv)
+
+	if args.compare:
+		def variant(datapath, dsp=False):
+			bitsy = Platform()
+			return bitsy, Counter(bitsy, 10, datapath, dsp=dsp)
+		variants = {d: lambda d=d: variant(d) for d in datapaths}
+		if args.dsp:
+			variants.update({f"{d}+dsp": lambda d=d: variant(d, True)
+								for d in datapaths})
+		return compare(variants, os.path.join(args.build_dir, "compare"))
+
+	# we'll call it a bitsy of type Platform()
+	bitsy = Platform()
 
-bitsy.build(count_module)
+	#
+	# Now instantiate a counter, which instantiates an LED display
+	# sub-module which is showing the count, and "build" this into a
+	# bit file (or just write the Verilog, or simulate it, see
+	# tools/cli.py)
+	#
+	return cli.run(bitsy,
+					lambda: Counter(bitsy, 10, args.datapath, args.tick_ppm,
+									args.dsp),
+					args=args, testbench=testbench,
+					sim_clk_period=SIM_CLK_PERIOD, probes=probes,
+					name="display_two")
 
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,6 @@
+#
+# Migen modules that more than one of the examples use. Unlike the
+# things in ../pmod these aren't tied to a particular piece of hardware
+# plugged into the board, they are building blocks (clock dividers,
+# counters, that kind of thing).
+#
@@ -0,0 +1,92 @@
+#
+# Written for the icebitsy-with-litex examples.
+#
+# A binary coded decimal (BCD) counter with any number of digits.
+#
+# The counters in 03_display and 04_display_two work by spotting the
+# "all the low digits are 9" cases one at a time (0x9999, then 0x999,
+# then 0x99, then 0x9) and adding the right magic number (0x667, 0x67,
+# 0x7) to the whole count. Every digit you add makes that If/Elif chain
+# one longer and the adder wider, so the logic gets slower as it grows.
+#
+# This one treats every digit on its own, the way you would count on
+# paper. A digit steps when everything below it is a 9 (that is the
+# "carry" into it), and a digit that steps while it is 9 goes back to 0.
+# Whether a digit is 9 only depends on that digit, so all the carries
+# can be worked out at the same time (carry-lookahead) instead of rippling
+# through the digits, and each digit only needs a 4 bit incrementer.
+#
+# You can run its simulation check from the top of the repository with
+#
+#	python3 -m gateware.bcd [digits]
+#
+import sys
+from functools import reduce
+from operator import and_
+
+from migen import *
+from migen.sim import run_simulation
+
+class BCDCounter(Module):
+	"""
+		An N digit BCD up counter. 'count' holds the digits, least
+		significant digit in the low four bits. It counts up by one on
+		every clock where 'ce' is high (every clock if no 'ce' is given)
+		and goes from 99..9 back to 0, 'carry' is high for the cycle
+		where that happens.
+	"""
+	def __init__(self, digits, ce=None):
+		self.count = Signal(4 * digits)
+		self.carry = Signal()
+		if ce is None:
+			ce = C(1)
+
+		digit = [self.count[4 * i:4 * (i + 1)] for i in range(digits)]
+		nine = [d == 9 for d in digit]
+
+		#
+		# The carry into digit i is 'ce' and every lower digit being 9.
+		# Each one is its own AND (rather than carry[i - 1] & nine[i - 1])
+		# so that synthesis builds them side by side as shallow trees.
+		#
+		for i in range(digits):
+			carry = reduce(and_, nine[:i], ce)
+			self.sync += If(carry,
+				If(nine[i],
+					digit[i].eq(0)
+				).Else(
+					digit[i].eq(digit[i] + 1)
+				)
+			)
+		self.comb += self.carry.eq(reduce(and_, nine, ce))
+
+def to_bcd(n):
+	"""
+		The BCD form of the integer n, for checking against.
+	"""
+	return int(str(n), 16)
+
+def check(digits=4):
+	"""
+		Simulate a 'digits' digit counter through every value and back
+		to zero, and check each one. Returns the number of cycles run.
+	"""
+	dut = BCDCounter(digits)
+	errors = []
+	def bench():
+		for n in range(10**digits + 1):
+			value = yield dut.count
+			if value != to_bcd(n % 10**digits):
+				errors.append(f"cycle {n}: {value:x} should be {n}")
+			carry = yield dut.carry
+			if carry != (n % 10**digits == 10**digits - 1):
+				errors.append(f"cycle {n}: carry is {carry}")
+			yield
+	run_simulation(dut, bench())
+	if errors:
+		raise AssertionError("\n".join(errors[:10]))
+	return 10**digits + 1
+
+if __name__ == "__main__":
+	digits = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+	print(f"{digits} digit BCD counter: {check(digits)} cycles checked, OK")
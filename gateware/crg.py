@@ -0,0 +1,219 @@
+#
+# Written for the icebitsy-with-litex examples.
+#
+# A clock and reset generator (CRG) that can run the design faster than
+# the 12 MHz oscillator on the board.
+#
+# When a design doesn't make its own clock domains LiteX wires the
+# default clock pin straight to the 'sys' domain, so everything runs at
+# 12 MHz. The UP5K has a PLL (the SB_PLL40) that can make anything from
+# 16 to 275 MHz out of that. It works like this:
+#
+#	12 MHz -> divide by DIVR+1 -> multiply by DIVF+1 -> divide by 2^DIVQ
+#	          (the "PFD", which   (the "VCO", which     -> sys clock
+#	          has to stay in      has to stay in
+#	          10 to 133 MHz)      533 to 1066 MHz)
+#
+# pll_config() tries every setting and keeps the one closest to the
+# frequency you ask for. Most frequencies can't be hit exactly (48 MHz
+# can, 50 MHz comes out as 50.25), and what matters is the frequency you
+# really get: CRG sets the platform's default_clk_period to it, so that
+# TickGenerator and everything else that counts clocks off it (and the
+# period constraint nextpnr checks) uses the real number. That means
+# the CRG has to be made before the design, see Icebitsy in
+# 01_blink/blink.py.
+#
+# Nothing runs until the PLL has locked, and then only after a power on
+# reset count, and the reset is let go of on a clock edge (through an
+# AsyncResetSynchronizer) so every register comes out of reset on the
+# same clock.
+#
+# You can check the PLL search, and that a CRG elaborates into Verilog
+# with the PLL in it, from the top of the repository with
+#
+#	python3 -m gateware.crg [MHz]
+#
+import sys
+
+from migen import *
+from migen.genlib.resetsync import AsyncResetSynchronizer
+
+PFD_RANGE = (10e6, 133e6)
+VCO_RANGE = (533e6, 1066e6)
+OUT_RANGE = (16e6, 275e6)
+
+def _filter_range(pfd):
+	# the loop filter setting for the PFD frequency (from icepll)
+	for limit, setting in ((17e6, 1), (26e6, 2), (44e6, 3), (66e6, 4),
+							(101e6, 5)):
+		if pfd < limit:
+			return setting
+	return 6
+
+def pll_config(clk_freq, freq):
+	"""
+		The SB_PLL40 setting that makes the nearest frequency to 'freq'
+		out of 'clk_freq' (both in Hz). Returns a dictionary of the
+		DIVR, DIVF, DIVQ and FILTER_RANGE parameters, the frequency it
+		'achieved' and its 'error' (in Hz) and 'ppm'.
+	"""
+	best = None
+	for divr in range(16):
+		pfd = clk_freq / (divr + 1)
+		if not PFD_RANGE[0] <= pfd <= PFD_RANGE[1]:
+			continue
+		for divf in range(128):
+			vco = pfd * (divf + 1)
+			if not VCO_RANGE[0] <= vco <= VCO_RANGE[1]:
+				continue
+			for divq in range(1, 7):
+				out = vco / 2**divq
+				if not OUT_RANGE[0] <= out <= OUT_RANGE[1]:
+					continue
+				# the first (smallest DIVR, fastest PFD) wins a tie
+				if best is None or abs(out - freq) < abs(best["achieved"] - freq):
+					best = {"DIVR": divr, "DIVF": divf, "DIVQ": divq,
+							"FILTER_RANGE": _filter_range(pfd), "achieved": out}
+	if best is None:
+		raise ValueError(f"the PLL can't make anything near {freq / 1e6:g} MHz "
+							f"from {clk_freq / 1e6:g} MHz")
+	best["error"] = best["achieved"] - freq
+	best["ppm"] = 1e6 * best["error"] / freq
+	return best
+
+class CRG(Module):
+	"""
+		The 'sys' clock domain, from the platform's default clock pin
+		either directly or (if 'sys_freq' in Hz is given and isn't the
+		pin's frequency) through the PLL. It sets the platform's
+		default_clk_period to the sys clock it really makes, so make it
+		before the modules that use that. 'config' is the PLL setting
+		(None without the PLL), 'sys_freq' the frequency achieved.
+		'por_cycles' is how long (in sys clocks) the design is held in
+		reset after the PLL locks.
+	"""
+	def __init__(self, platform, sys_freq=None, por_cycles=2**16 - 1):
+		clk_freq = 1e9 / platform.default_clk_period
+		clk = platform.request(platform.default_clk_name)
+		# named outright, newer Pythons break Migen's guess from the
+		# variable name
+		self.clock_domains.cd_sys = ClockDomain("sys")
+		self.clock_domains.cd_por = ClockDomain("por", reset_less=True)
+
+		self.config = None
+		self.locked = Signal()
+		if sys_freq is None or sys_freq == clk_freq:
+			self.sys_freq = clk_freq
+			self.comb += [
+				self.cd_sys.clk.eq(clk),
+				self.locked.eq(1),
+			]
+		else:
+			self.config = config = pll_config(clk_freq, sys_freq)
+			self.sys_freq = config["achieved"]
+			#
+			# The PLL_PAD version takes the clock straight from the pin,
+			# which works as the board's oscillator is on the pin the
+			# UP5K's PLL has its input on (35 on the SG48 package)
+			#
+			self.specials += Instance("SB_PLL40_PAD",
+				p_FEEDBACK_PATH="SIMPLE",
+				p_DIVR=config["DIVR"],
+				p_DIVF=config["DIVF"],
+				p_DIVQ=config["DIVQ"],
+				p_FILTER_RANGE=config["FILTER_RANGE"],
+				i_PACKAGEPIN=clk,
+				i_RESETB=1,
+				i_BYPASS=0,
+				o_PLLOUTGLOBAL=self.cd_sys.clk,
+				o_LOCK=self.locked,
+			)
+		platform.default_clk_period = 1e9 / self.sys_freq
+
+		#
+		# The power on reset counts down on the sys clock (it has no
+		# reset of its own, it starts out full when the FPGA loads) and
+		# holds sys in reset until it gets to zero with the PLL locked.
+		#
+		por = Signal(bits_for(por_cycles), reset=por_cycles)
+		self.por_done = Signal()
+		self.comb += [
+			self.cd_por.clk.eq(self.cd_sys.clk),
+			self.por_done.eq(por == 0),
+		]
+		self.sync.por += If(~self.por_done, por.eq(por - 1))
+		self.specials += AsyncResetSynchronizer(self.cd_sys,
+									~self.por_done | ~self.locked)
+
+def describe(config, freq):
+	"""
+		A line about the PLL setting pll_config() picked for 'freq'.
+	"""
+	return (f"PLL: {freq / 1e6:g} MHz asked for, {config['achieved'] / 1e6:.4f} "
+			f"MHz achieved ({config['ppm']:+.0f} ppm), DIVR {config['DIVR']} "
+			f"DIVF {config['DIVF']} DIVQ {config['DIVQ']} FILTER_RANGE "
+			f"{config['FILTER_RANGE']}")
+
+def _elaborate(sys_freq):
+	#
+	# Write the Verilog for a CRG at 'sys_freq' on the Icebitsy with a
+	# counter in the sys domain, check the PLL is in it when it should
+	# be and the clock period is the one the PLL makes
+	#
+	from litex_boards.platforms.icebreaker_bitsy import Platform
+	platform = Platform()
+	top = Module()
+	top.submodules.crg = crg = CRG(platform, sys_freq)
+	counter = Signal(8)
+	top.sync += counter.eq(counter + 1)
+	verilog = str(platform.get_verilog(top))
+	if ("SB_PLL40_PAD" in verilog) != (crg.config is not None):
+		raise AssertionError(f"{sys_freq / 1e6:g} MHz: the PLL is "
+								f"{'missing from' if crg.config else 'in'} "
+								"the Verilog")
+	if platform.default_clk_period != 1e9 / crg.sys_freq:
+		raise AssertionError(f"{sys_freq / 1e6:g} MHz: the clock period is "
+								f"{platform.default_clk_period:g} ns")
+
+def check(clk_freq=12e6):
+	"""
+		Check pll_config() for every whole MHz the PLL can make from
+		'clk_freq': every setting within the PLL's limits, the frequency
+		it claims the one it really makes, and no worse than the best
+		any setting could do. Then elaborate a CRG with and without the
+		PLL. Returns the number of frequencies checked.
+	"""
+	# everything the PLL can make, the long way round
+	outputs = {clk_freq / (r + 1) * (f + 1) / 2**q
+				for r in range(16) for f in range(128) for q in range(1, 7)
+				if PFD_RANGE[0] <= clk_freq / (r + 1) <= PFD_RANGE[1]
+				and VCO_RANGE[0] <= clk_freq / (r + 1) * (f + 1) <= VCO_RANGE[1]
+				and OUT_RANGE[0] <= clk_freq / (r + 1) * (f + 1) / 2**q
+						<= OUT_RANGE[1]}
+	freqs = range(int(OUT_RANGE[0] / 1e6), int(OUT_RANGE[1] / 1e6) + 1)
+	for mhz in freqs:
+		freq = mhz * 1e6
+		c = pll_config(clk_freq, freq)
+		pfd = clk_freq / (c["DIVR"] + 1)
+		vco = pfd * (c["DIVF"] + 1)
+		if not (PFD_RANGE[0] <= pfd <= PFD_RANGE[1] and
+				VCO_RANGE[0] <= vco <= VCO_RANGE[1]):
+			raise AssertionError(f"{mhz} MHz: PFD {pfd:g} or VCO {vco:g} "
+									"out of range")
+		if vco / 2**c["DIVQ"] != c["achieved"]:
+			raise AssertionError(f"{mhz} MHz: the setting makes "
+									f"{vco / 2**c['DIVQ']:g}, not {c['achieved']:g}")
+		nearest = min(abs(out - freq) for out in outputs)
+		if abs(c["error"]) > nearest:
+			raise AssertionError(f"{mhz} MHz: {c['error']:g} Hz off, it can "
+									f"be {nearest:g}")
+	for sys_freq in (None, 48e6):
+		_elaborate(sys_freq)
+	return len(freqs)
+
+if __name__ == "__main__":
+	if len(sys.argv) > 1:
+		freq = float(sys.argv[1]) * 1e6
+		print(describe(pll_config(12e6, freq), freq))
+	else:
+		print(f"PLL settings for {check()} frequencies checked, OK")
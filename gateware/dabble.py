@@ -0,0 +1,104 @@
+#
+# Written for the icebitsy-with-litex examples.
+#
+# Binary to BCD conversion with the "double dabble" (shift and add 3)
+# algorithm, built as a pipeline.
+#
+# The idea is that you shift the binary number into a row of BCD digits
+# one bit at a time, most significant bit first. Shifting left doubles
+# the digits, and a digit that is 5 or more would go past 9 when doubled,
+# so before each shift any digit that is 5 or more gets 3 added to it
+# (which makes the doubled value carry into the next digit the way a
+# decimal digit should). After all the bits are in, the digits hold the
+# number in BCD.
+#
+# Here each of those shift steps is a stage of logic with a register
+# after it, so a new binary value can go in every clock and its BCD form
+# comes out 'latency' clocks later. The registers are only as wide as
+# they need to be, after k bits have been shifted in the digits can't be
+# more than 2**k - 1, and only the bits not shifted in yet are carried
+# along.
+#
+# You can run its simulation check from the top of the repository with
+#
+#	python3 -m gateware.dabble [width]
+#
+import sys
+
+from migen import *
+from migen.sim import run_simulation
+
+def _digits(n):
+	# how many decimal digits it takes to write n
+	return len(str(n))
+
+class BinaryToBCD(Module):
+	"""
+		Converts 'binary' (width bits) into 'bcd' (digits 4 bit digits,
+		least significant digit in the low bits). There is a register
+		after every 'pipeline' shift steps (pipeline=0 makes it all
+		combinational), 'latency' says how many clocks the result
+		takes to come out.
+	"""
+	def __init__(self, width, digits=None, pipeline=1):
+		digits = digits or _digits(2**width - 1)
+		self.binary = Signal(width)
+		self.bcd = Signal(4 * digits)
+		self.latency = 0
+
+		bits = self.binary
+		bcd = Cat()
+		for step in range(width):
+			#
+			# add 3 to every digit that is 5 or more ...
+			#
+			adjusted = []
+			for i in range(len(bcd) // 4):
+				d = bcd[4 * i:4 * (i + 1)]
+				a = Signal(4)
+				self.comb += a.eq(Mux(d >= 5, d + 3, d))
+				adjusted.append(a)
+			#
+			# ... then shift the top bit of what is left of the binary
+			# number in at the bottom, growing a digit when needed
+			#
+			n = 4 * _digits(2**(step + 1) - 1)
+			shifted = Cat(bits[-1], *adjusted)[:n]
+			rest = bits[:-1]
+			registered = pipeline and (step + 1) % pipeline == 0
+			domain = self.sync if registered else self.comb
+			self.latency += 1 if registered else 0
+
+			bcd = Signal(n)
+			domain += bcd.eq(shifted)
+			if len(rest):
+				bits = Signal(len(rest))
+				domain += bits.eq(rest)
+		self.comb += self.bcd.eq(bcd)
+
+def check(width=14, pipeline=1):
+	"""
+		Push every 'width' bit value through a converter, one per clock,
+		and check what comes out. Returns the number of cycles run.
+	"""
+	dut = BinaryToBCD(width, pipeline=pipeline)
+	errors = []
+	values = list(range(2**width))
+	def bench():
+		for cycle in range(len(values) + dut.latency):
+			if cycle < len(values):
+				yield dut.binary.eq(values[cycle])
+			yield
+			n = cycle - dut.latency
+			if n >= 0:
+				bcd = yield dut.bcd
+				if bcd != int(str(values[n]), 16):
+					errors.append(f"{values[n]} came out as {bcd:x}")
+	run_simulation(dut, bench())
+	if errors:
+		raise AssertionError("\n".join(errors[:10]))
+	return len(values) + dut.latency
+
+if __name__ == "__main__":
+	width = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+	print(f"{width} bit double dabble: {check(width)} cycles checked, OK")
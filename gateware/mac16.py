@@ -0,0 +1,247 @@
+#
+# Written for the icebitsy-with-litex examples.
+#
+# Counting in a DSP block instead of logic cells.
+#
+# The UP5K has eight SB_MAC16 blocks. Each is a 16x16 multiplier with a
+# 32 bit adder and accumulator register behind it, and these designs
+# never multiply anything, so they sit there unused while every counter
+# bit takes a logic cell (LC) of its own, plus a few more to compare the
+# count with where it starts over. The adder and accumulator are all a
+# counter needs though, so MAC16Counter leaves the multiplier out and
+# sets the block up as
+#
+#	acc <= acc + 1		(or acc <= start when OLOAD is high)
+#
+# on every clock its 'ce' is high. The compare is done by where it
+# starts: the accumulator is loaded with
+#
+#	start = 2^31 - (n - 1)
+#
+# so after n - 1 counts it reaches 2^31, and bit 31 of the accumulator
+# (which comes straight out of the block) goes high. That is the 'wrap'
+# output, and it stays high until the next count, which loads 'start'
+# instead of adding 1, so it goes round every n counts with no
+# comparator at all. The load has to wait for that count ('ce'): in a
+# TickGenerator 'ce' is the strobe of a faster tick, high for one clock
+# now and then, and the counter has to sit on its last count until it
+# comes. Reset and the first clock after power up load it as well, as
+# the accumulator powers up as 0 and would have to count all the way up
+# to 2^31 first. Counted from 'start' the accumulator is a 0 to n - 1
+# counter that wraps at n - 1, the same as the ones in gateware/ticks.py,
+# so a design behaves the same clock for clock either way.
+#
+# All that is left in the fabric is a flip flop and a few gates for the
+# load and whatever uses 'wrap'. TickGenerator(dsp=True) uses these for its wide counters
+# (--dsp on the example scripts), and rebuilding a design with and
+# without it shows the LCs saved in the build history (tools/history.py)
+# or side by side with --compare --dsp on the display examples.
+#
+# The simulator doesn't know what an SB_MAC16 is, so tools/cli.py has it
+# use SimMAC16Counter instead, a plain counter that does the same thing.
+# check() also simulates _SimAccumulator, the accumulator and load logic
+# the way the block is set up, against what the counter should do.
+# You can run its check from the top of the repository with
+#
+#	python3 -m gateware.mac16
+#
+from migen import *
+from migen.fhdl.specials import Special
+from migen.sim import run_simulation
+
+# how many the UP5K has
+DSP_BLOCKS = 8
+
+class MAC16Counter(Special):
+	"""
+		A counter that goes round every 'n' clocks that 'ce' is high
+		(every clock without one) in an SB_MAC16. 'wrap' is high while
+		it is on its last count, n - 1. 'count' is the same count as a
+		Signal, but only the simulation (SimMAC16Counter) drives it.
+	"""
+	def __init__(self, n, ce=None):
+		Special.__init__(self)
+		if not 1 < n <= 2**31:
+			raise ValueError(f"a MAC16Counter counts 2 to 2^31, not {n}")
+		self.n = n
+		self.start = 2**31 - (n - 1)
+		self.ce = wrap(ce if ce is not None else 1)
+		self.wrap = Signal()
+		self.count = Signal(bits_for(n - 1))
+		self.clk = ClockSignal()
+		self.rst = ResetSignal()
+
+	def iter_expressions(self):
+		yield self, "ce", SPECIAL_INPUT
+		yield self, "wrap", SPECIAL_OUTPUT
+		yield self, "clk", SPECIAL_INPUT
+		yield self, "rst", SPECIAL_INPUT
+
+	@staticmethod
+	def controls(dr, m, acc):
+		#
+		# The load and clock enable of the accumulator 'acc', in 'm'.
+		# It loads on the count after the wrap, and on reset and the
+		# first clock (when 'first' is still set). Those have to clock
+		# it even when 'ce' isn't high, to come out of them on 'start'.
+		#
+		load = Signal()
+		enable = Signal()
+		first = Signal(reset=1)
+		m.sync += first.eq(0)
+		m.comb += [
+			dr.wrap.eq(acc[31]),
+			load.eq((dr.wrap & dr.ce) | dr.rst | first),
+			enable.eq(dr.ce | dr.rst | first),
+		]
+		return load, enable
+
+	@staticmethod
+	def lower(dr):
+		m = Module()
+		acc = Signal(32)
+		load, enable = MAC16Counter.controls(dr, m, acc)
+		#
+		# The top and bottom 16 bits each add their accumulator to A
+		# (top) and B (bottom), which makes 1, with the bottom's carry
+		# going into the top, and load C and D (start) on OLOAD.
+		#
+		m.specials += Instance("SB_MAC16",
+			p_NEG_TRIGGER=0,
+			p_A_REG=0, p_B_REG=0, p_C_REG=0, p_D_REG=0,
+			p_TOP_8x8_MULT_REG=0, p_BOT_8x8_MULT_REG=0,
+			p_PIPELINE_16x16_MULT_REG1=0, p_PIPELINE_16x16_MULT_REG2=0,
+			p_TOPOUTPUT_SELECT=1,
+			p_TOPADDSUB_LOWERINPUT=0,
+			p_TOPADDSUB_UPPERINPUT=0,
+			p_TOPADDSUB_CARRYSELECT=2,
+			p_BOTOUTPUT_SELECT=1,
+			p_BOTADDSUB_LOWERINPUT=0,
+			p_BOTADDSUB_UPPERINPUT=0,
+			p_BOTADDSUB_CARRYSELECT=0,
+			p_MODE_8x8=0,
+			p_A_SIGNED=0, p_B_SIGNED=0,
+			i_CLK=dr.clk,
+			i_CE=enable,
+			i_A=0,
+			i_B=1,
+			i_C=dr.start >> 16,
+			i_D=dr.start & 0xffff,
+			i_AHOLD=0, i_BHOLD=0, i_CHOLD=0, i_DHOLD=0,
+			i_IRSTTOP=0, i_IRSTBOT=0, i_ORSTTOP=0, i_ORSTBOT=0,
+			i_OLOADTOP=load, i_OLOADBOT=load,
+			i_ADDSUBTOP=0, i_ADDSUBBOT=0,
+			i_OHOLDTOP=0, i_OHOLDBOT=0,
+			i_CI=0, i_ACCUMCI=0, i_SIGNEXTIN=0,
+			o_O=acc,
+		)
+		return m
+
+class SimMAC16Counter:
+	"""
+		What a MAC16Counter does, for the simulator: its accumulator is
+		start + count.
+	"""
+	@staticmethod
+	def lower(dr):
+		m = Module()
+		count = dr.count
+		m.comb += dr.wrap.eq(count == dr.n - 1)
+		m.sync += If(dr.ce,
+			If(dr.wrap,
+				count.eq(0)
+			).Else(
+				count.eq(count + 1)
+			)
+		)
+		return m
+
+class _SimAccumulator:
+	"""
+		What the SB_MAC16 in a MAC16Counter does, clock for clock: a 32
+		bit accumulator that powers up as 0, with the same load and
+		clock enable logic, for check().
+	"""
+	@staticmethod
+	def lower(dr):
+		m = Module()
+		acc = Signal(32)
+		load, enable = MAC16Counter.controls(dr, m, acc)
+		m.sync += If(enable,
+			If(load,
+				acc.eq(dr.start)
+			).Else(
+				acc.eq(acc + 1)
+			)
+		)
+		return m
+
+def _ce(cycles, ce_every):
+	#
+	# 'ce' for check(): every 'ce_every'th clock, then the same with
+	# the gaps one longer and one shorter in turn, then a few clocks on
+	# end, so it comes at all sorts of times against the wraps
+	#
+	pattern = []
+	gap = 0
+	while len(pattern) < cycles:
+		pattern += [0] * (ce_every - 1 + gap % 3 - 1) + [1]
+		gap += 1
+		if gap % 7 == 0:
+			pattern += [1] * 3
+	return pattern[:cycles]
+
+def check(n=5, ce_every=3, cycles=300):
+	"""
+		Check the accumulator arithmetic for 'n' and the longest and
+		shortest counters, that the Verilog has the SB_MAC16 in it, and
+		simulate a counter of 'n' stepping on an irregular 'ce' about
+		every 'ce_every'th clock, both the simulator's SimMAC16Counter
+		and the accumulator the block is set up as, against the count
+		it should be on. Returns the cycles run.
+	"""
+	from migen.fhdl.verilog import convert
+
+	for k in (n, 2, 2**31):
+		start = 2**31 - (k - 1)
+		# bit 31 is high on the last of the k counts and no other
+		if any((start + i) >> 31 for i in range(min(k - 1, 1000))) or \
+				not (start + k - 1) >> 31 or (start + k - 1) >= 2**32:
+			raise AssertionError(f"start {start:#x} doesn't wrap at {k}")
+
+	ce = Signal()
+	dut = MAC16Counter(n, ce)
+	top = Module()
+	top.specials += dut
+	verilog = str(convert(top, ios={ce, dut.wrap}))
+	if "SB_MAC16" not in verilog:
+		raise AssertionError("no SB_MAC16 in the Verilog")
+
+	pattern = _ce(cycles, ce_every)
+	for model in (SimMAC16Counter, _SimAccumulator):
+		ce = Signal()
+		dut = MAC16Counter(n, ce)
+		def bench():
+			count = 0
+			# the accumulator's first clock loads 'start'
+			yield
+			for cycle, level in enumerate(pattern):
+				yield ce.eq(level)
+				yield
+				if model is SimMAC16Counter and (yield dut.count) != count:
+					raise AssertionError(f"clock {cycle}: count "
+											f"{(yield dut.count)}, not {count}")
+				if (yield dut.wrap) != (count == n - 1):
+					raise AssertionError(f"{model.__name__}, clock {cycle}: "
+											f"wrap is wrong on count {count}")
+				if level:
+					count = (count + 1) % n
+		top = Module()
+		top.specials += dut
+		# with a reset for the accumulator's load logic to look at
+		top.clock_domains.cd_sys = ClockDomain("sys")
+		run_simulation(top, bench(), special_overrides={MAC16Counter: model})
+	return cycles
+
+if __name__ == "__main__":
+	print(f"MAC16 counter: {check()} cycles checked, OK")
@@ -0,0 +1,47 @@
+#
+# Written for the icebitsy-with-litex examples.
+#
+# Pulse width modulation (PWM) for dimming LEDs. An LED that is switched
+# on and off faster than your eye can follow looks as bright as the
+# fraction of the time it is on (the "duty cycle").
+#
+# The usual way to do that is a counter that runs from 0 up to its
+# maximum over and over, and a comparator that turns the LED on while the
+# counter is below the brightness you want. The counter is the expensive
+# part and it doesn't care which LED it is dimming, so this module has one
+# counter that everybody shares, and each user just asks for a comparator
+# with compare(level).
+#
+from migen import *
+
+class PWM(Module):
+	"""
+		A shared PWM counter 'bits' wide. It steps on every clock where
+		'ce' is high (every clock if no 'ce' is given), so one period is
+		2**bits steps. compare(level) returns a Signal that is high for
+		'level' steps of every period, 'level' can be a number or a
+		Signal from 0 (always off) to 2**bits (always on).
+	"""
+	def __init__(self, bits=4, ce=None):
+		self.bits = bits
+		self.count = Signal(bits)
+		if ce is None:
+			self.sync += self.count.eq(self.count + 1)
+		else:
+			self.sync += If(ce, self.count.eq(self.count + 1))
+
+	def compare(self, level):
+		"""
+			Return a Signal that is high while the counter is below
+			'level'.
+		"""
+		if isinstance(level, int):
+			if not 0 <= level <= 2**self.bits:
+				raise ValueError(f"level {level} is out of range for "
+									f"{self.bits} bit PWM")
+			# no comparator needed for always on and always off
+			if level in (0, 2**self.bits):
+				return C(level != 0)
+		on = Signal()
+		self.comb += on.eq(self.count < level)
+		return on
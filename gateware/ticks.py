@@ -0,0 +1,295 @@
+#
+# Written for the icebitsy-with-litex examples.
+#
+# Every example started out with its own "divide-by-n" counter: a 24 bit
+# Signal that counts up to 'ticks' and then starts over. That is fine for
+# one of them, but display_two ended up with three of them (one for the
+# count and one in each display), all 24 bits wide and all counting the
+# same 12 MHz clock.
+#
+# The TickGenerator here replaces all of those. Modules ask it for a
+# 'tick' at some frequency and get back a Signal that is high for exactly
+# one clock cycle, that many times a second. Internally there is only one
+# prescaler, running at the fastest rate anybody asked for, and each
+# slower rate is a small counter that counts the ticks of the next faster
+# one. Every counter is only as wide as it needs to be.
+#
+# So for display_two (500 Hz for the display refresh, 20 Hz for the count)
+# instead of three 24 bit counters you get a 15 bit one that divides 12 MHz
+# down to 500 Hz and a 5 bit one that divides that by 25.
+#
+# That only works out when the faster rate is a whole number of the
+# slower one. 7 Hz from 500 Hz would be every 71 ticks, which is 7.04 Hz,
+# where counting 1714285 clocks like the old dividers did is 0.17 ppm
+# off. So a tick that a counter of the faster ticks would get further
+# off than a counter of the clock gets a counter of the clock, its own
+# prescaler, and the ticks slower than it count it in turn.
+#
+# A counter can only divide by a whole number though, so a frequency that
+# doesn't go evenly into the clock comes out a little off (7 Hz from 12
+# MHz is 0.17 ppm fast, and it is different again for every sys clock the
+# PLL can make). Give the TickGenerator a tolerance in 'ppm' and any tick
+# a counter can't get that close to is made by an NCO (numerically
+# controlled oscillator) instead. That is a phase accumulator: every
+# clock (or every tick of the next faster rate) it adds
+#
+#	inc = freq / rate * 2^width
+#
+# to a 'width' bit register and the tick is the carry out of the top.
+# On average that is exactly inc / 2^width of the rate, the catch is that
+# the ticks are a clock early or late now and then (jitter) because the
+# carry can only happen on a clock. The accumulator is made as narrow as
+# it can be for the tolerance, and what each tick really does is printed
+# when the design is finalized.
+#
+# With 'dsp' the counters that are 8 bits or wider go in the UP5K's
+# SB_MAC16 DSP blocks (see gateware/mac16.py), which don't do anything
+# else in these designs, so those bits and their compare stop taking
+# logic cells. The ticks come on the same clocks either way.
+#
+# You can run its simulation check from the top of the repository with
+#
+#	python3 -m gateware.ticks
+#
+import sys
+
+from migen import *
+from migen.sim import run_simulation
+
+from gateware.mac16 import MAC16Counter, DSP_BLOCKS
+
+# the narrowest counter that is worth a DSP block
+DSP_MIN_WIDTH = 8
+
+def _name(freq):
+	return f"tick_{freq:g}hz".replace(".", "_")
+
+class TickGenerator(Module):
+	"""
+		A shared clock divider. Create one with the clock period (in ns,
+		same as platform.default_clk_period), ask it for strobes with
+		tick(freq), and add it as a submodule. The counters are built
+		when the design is finalized, so all the tick() calls have to
+		happen before that (in the __init__ of the modules using it).
+		With 'ppm' a tick a counter can't make to within that many ppm
+		of its frequency is made with an NCO, with 'dsp' the wide
+		counters are MAC16Counters.
+	"""
+	def __init__(self, clk_period, ppm=None, dsp=False):
+		self.clk_period = clk_period
+		self.ppm = ppm
+		self.dsp = dsp
+		self.ticks = {}
+		# the frequency each tick really runs at, how many clocks apart
+		# they are (on average), and how many clocks early or late one
+		# can be, filled in at finalize
+		self.achieved = {}
+		self.cycles = {}
+		self.jitter = {}
+		# the (width, inc) of each tick that is an NCO
+		self.nco = {}
+		# the MAC16Counter of each tick counted in a DSP block
+		self.mac16 = {}
+		# the faster tick each tick counts, None for the ones that count
+		# the clock
+		self.source = {}
+		# the (counter, n) of each counter of the clock, for
+		# tools/fastforward.py
+		self.prescalers = []
+
+	def tick(self, freq):
+		"""
+			Return a Signal that is high for one clock cycle 'freq'
+			times per second. Asking for the same frequency twice gives
+			you the same Signal.
+		"""
+		if self.finalized:
+			raise FinalizeError("ask for ticks before the design is finalized")
+		if freq not in self.ticks:
+			self.ticks[freq] = Signal(name=_name(freq))
+		return self.ticks[freq]
+
+	def _nco(self, rate, freq):
+		#
+		# The narrowest accumulator (and its increment) that counts
+		# 'rate' down to within ppm of 'freq'
+		#
+		for width in range(1, 65):
+			inc = round(freq * 2**width / rate)
+			if 0 < inc < 2**width and \
+					abs(rate * inc / 2**width - freq) <= freq * self.ppm / 1e6:
+				return width, inc
+		raise ValueError(f"no NCO makes {freq:g} Hz to within {self.ppm} ppm")
+
+	def report(self):
+		"""
+			A line about each tick: what it is made with, the frequency
+			it really runs at and its jitter.
+		"""
+		lines = []
+		for freq in sorted(self.ticks, reverse=True):
+			achieved = self.achieved[freq]
+			if freq in self.nco:
+				width, inc = self.nco[freq]
+				how = f"{width} bit NCO adding {inc}"
+			elif freq in self.mac16:
+				how = f"counter in an SB_MAC16, {self.cycles[freq]:.0f} clocks"
+			else:
+				how = f"counter, {self.cycles[freq]:.0f} clocks"
+			lines.append(f"ticks: {freq:g} Hz from a {how}, {achieved:.9g} Hz "
+							f"({(achieved - freq) / freq * 1e6:+.3f} ppm), "
+							f"jitter {self.jitter[freq]:g} clocks "
+							f"({self.jitter[freq] * self.clk_period:.4g} ns)")
+		return lines
+
+	def _divider(self, freq):
+		#
+		# What a counter for 'freq' counts: the slowest of the faster
+		# ticks that gets it as close as any of them, or the clock. Like
+		# the original dividers the clock cycles are truncated, the
+		# ticks are rounded. A tick can't come more often than every
+		# clock (simulations slow the clock right down, see
+		# tools/simsuite.py). Returns the tick (None for the clock) and
+		# how many of them to count.
+		#
+		clock = 1e9 / self.clk_period
+		options = [(f, self.achieved[f], max(1, round(self.achieved[f] / freq)))
+					for f in sorted(self.achieved)]
+		options.append((None, clock, max(1, int(clock / freq))))
+		error = [abs(rate / n - freq) for source, rate, n in options]
+		for (source, rate, n), e in zip(options, error):
+			if e <= min(error) + freq * 1e-9:
+				return source, n
+
+	def do_finalize(self):
+		for freq in sorted(self.ticks, reverse=True):
+			strobe = self.ticks[freq]
+			#
+			# The tick counts the faster tick (or the clock) it divides
+			# into best, and comes as often and as early or late as that
+			# one, 'n' times over
+			#
+			source, n = self._divider(freq)
+			self.source[freq] = source
+			if source is None:
+				enable, rate, cycles, jitter = None, 1e9 / self.clk_period, 1, 0
+			else:
+				enable, rate = self.ticks[source], self.achieved[source]
+				cycles, jitter = self.cycles[source], self.jitter[source]
+			if self.ppm is not None and freq < rate and \
+					abs(rate / n - freq) > freq * self.ppm / 1e6:
+				#
+				# A counter is too far off, the accumulator adds 'inc'
+				# every time the faster tick (or clock) comes round and
+				# the carry out of the top is the tick. Its ticks can be
+				# one of those early or late.
+				#
+				self.nco[freq] = width, inc = self._nco(rate, freq)
+				phase = Signal(width, name=_name(freq) + "_phase")
+				carry = Signal(width + 1)
+				self.comb += carry.eq(phase + inc)
+				step = [phase.eq(carry[:width]), strobe.eq(carry[width])]
+				self.sync += strobe.eq(0)
+				self.sync += step if enable is None else If(enable, *step)
+				jitter += cycles
+				rate = rate * inc / 2**width
+				cycles *= 2**width / inc
+				self.achieved[freq] = rate
+				self.cycles[freq] = cycles
+				self.jitter[freq] = jitter
+				continue
+			rate = rate / n
+			cycles *= n
+			self.achieved[freq] = rate
+			self.cycles[freq] = cycles
+			self.jitter[freq] = jitter
+
+			if n == 1:
+				self.comb += strobe.eq(1 if enable is None else enable)
+			elif self.dsp and bits_for(n - 1) >= DSP_MIN_WIDTH and \
+					len(self.mac16) < DSP_BLOCKS:
+				#
+				# 'wrap' is high on the last count, like count == n - 1
+				# below, so the strobe comes on the same clock
+				#
+				self.mac16[freq] = counter = MAC16Counter(n, enable)
+				self.specials += counter
+				self.sync += strobe.eq(counter.wrap if enable is None
+										else enable & counter.wrap)
+				if enable is None:
+					self.prescalers.append((counter.count, n))
+			else:
+				count = Signal(bits_for(n - 1), name=_name(freq) + "_count")
+				wrap = [
+					If(count == n - 1,
+						count.eq(0),
+						strobe.eq(1)
+					).Else(
+						count.eq(count + 1)
+					)
+				]
+				self.sync += strobe.eq(0)
+				self.sync += wrap if enable is None else If(enable, *wrap)
+				if enable is None:
+					self.prescalers.append((count, n))
+		if self.ppm is not None or self.dsp:
+			for line in self.report():
+				print(line)
+
+def _check_counters(freq, clk_freq=12e6, faster=(500, 1)):
+	#
+	# Without an NCO, a 'freq' Hz tick next to ticks of 'faster' Hz is
+	# as close as a counter of the clock gets it, like the dividers
+	# the TickGenerator replaced
+	#
+	dut = TickGenerator(1e9 / clk_freq)
+	for f in faster + (freq,):
+		dut.tick(f)
+	dut.finalize()
+	for f in faster + (freq,):
+		direct = clk_freq / int(clk_freq / f)
+		if abs(dut.achieved[f] - f) > abs(direct - f) + f * 1e-9:
+			raise AssertionError(f"{f:g} Hz tick at {dut.achieved[f]:.9g} Hz, "
+									f"a counter of the clock makes "
+									f"{direct:.9g} Hz")
+
+def check(freq=7, ppm=0.1, rate=1000, ticks=200):
+	"""
+		Check the counter ticks of 'freq' Hz come as close to it as a
+		counter of the clock would. Then simulate an NCO tick of 'freq'
+		Hz (to within 'ppm') off a clock of 'rate' Hz, next to a counter
+		tick of 'rate' / 8, for 'ticks' ticks. Check they come at the
+		average rate the report says and never further out than its
+		jitter. Returns the cycles run.
+	"""
+	_check_counters(freq)
+	dut = TickGenerator(1e9 / rate, ppm)
+	fast = dut.tick(rate / 8)
+	slow = dut.tick(freq)
+	dut.finalize()
+	if freq not in dut.nco or rate / 8 in dut.nco:
+		raise AssertionError(f"expected an NCO for {freq} Hz only, got "
+								f"{dut.nco}")
+	cycles = int(ticks * dut.cycles[freq]) + 1
+	seen = []
+	def bench():
+		for cycle in range(cycles):
+			if (yield slow):
+				seen.append(cycle)
+			yield
+	run_simulation(dut, bench())
+	period, jitter = dut.cycles[freq], dut.jitter[freq]
+	for i, cycle in enumerate(seen):
+		# (the first tick comes after a full period plus the strobe's clock)
+		expected = seen[0] + i * period
+		if abs(cycle - expected) > 2 * jitter:
+			raise AssertionError(f"tick {i} on clock {cycle}, expected "
+									f"{expected:.1f} +/- {2 * jitter:g}")
+	average = (seen[-1] - seen[0]) / (len(seen) - 1)
+	if abs(average - period) > 2 * jitter / (len(seen) - 1):
+		raise AssertionError(f"ticks {average:.3f} clocks apart, the report "
+								f"says {period:.3f}")
+	return cycles
+
+if __name__ == "__main__":
+	print(f"NCO tick: {check(*map(float, sys.argv[1:]))} cycles checked, OK")
@@ -0,0 +1,165 @@
+#
+# Written for the icebitsy-with-litex examples.
+#
+# Switching to another design without reflashing.
+#
+# The iCE40's configuration flash can hold up to four bitstreams behind
+# a header (a "multiboot" image, see tools/multiboot.py). At power on the
+# FPGA loads the first one, and after that the design itself can ask for
+# any of the four with the SB_WARMBOOT primitive: set S1 and S0 to the
+# image number and raise BOOT, and a few milliseconds later the FPGA has
+# reloaded itself from that image.
+#
+# WarmBoot does that on a long press of the user button. Hold it down
+# for 'hold' seconds (two by default) and let go, and it boots 'image'.
+# Waiting for the button to be let go keeps the next design from seeing
+# a long press of its own straight away, and the press has to be held
+# the whole time, so the button bouncing just starts the count again.
+#
+# The example scripts add one with --warmboot IMAGE, tools/multiboot.py
+# builds each design with it set to the next image along. The simulator
+# has no SB_WARMBOOT, tools/cli.py replaces it with nothing there.
+#
+# You can run its simulation check from the top of the repository with
+#
+#	python3 -m gateware.warmboot
+#
+from migen import *
+from migen.fhdl.specials import Special
+from migen.genlib.cdc import MultiReg
+from migen.sim import run_simulation
+from litex.build.generic_platform import ConstraintError
+
+# the button is called user_button on the platform in 01_blink/blink.py
+# and user_btn_n on the LiteX one, either way it is low when pressed
+BUTTONS = ("user_button", "user_btn_n")
+
+class SBWarmBoot(Special):
+	"""
+		The SB_WARMBOOT primitive, reboots into 'image' (0 to 3) when
+		'boot' goes high.
+	"""
+	def __init__(self, boot, image):
+		Special.__init__(self)
+		if not 0 <= image <= 3:
+			raise ValueError(f"there are images 0 to 3, not {image}")
+		self.boot = wrap(boot)
+		self.image = image
+
+	def iter_expressions(self):
+		yield self, "boot", SPECIAL_INPUT
+
+	@staticmethod
+	def lower(dr):
+		m = Module()
+		m.specials += Instance("SB_WARMBOOT",
+			i_BOOT=dr.boot,
+			i_S1=(dr.image >> 1) & 1,
+			i_S0=dr.image & 1,
+		)
+		return m
+
+class SimSBWarmBoot:
+	"""
+		The simulator can't reboot, 'boot' is there for the testbench.
+	"""
+	@staticmethod
+	def lower(dr):
+		return Module()
+
+def _button(platform):
+	#
+	# The button, even if the design has already requested it (Blink
+	# does)
+	#
+	for name in BUTTONS:
+		button = platform.lookup_request(name, loose=True)
+		if button is not None:
+			return button
+	for name in BUTTONS:
+		try:
+			return platform.request(name)
+		except ConstraintError:
+			pass
+	raise ConstraintError(f"the platform has none of {', '.join(BUTTONS)}")
+
+class WarmBoot(Module):
+	"""
+		Boot multiboot 'image' when the user button on 'platform' has
+		been held down for 'hold' seconds and let go. 'button' is a
+		Signal to use instead, high when pressed. 'boot' goes high for
+		the reboot.
+	"""
+	def __init__(self, platform, image, hold=2.0, button=None):
+		self.image = image
+		self.boot = Signal()
+		if button is None:
+			button = ~_button(platform)
+
+		#
+		# The button isn't on our clock, so it goes through a couple of
+		# registers first (a MultiReg) before anything looks at it
+		#
+		pressed = Signal()
+		self.specials += MultiReg(button, pressed)
+
+		cycles = max(1, int(hold * 1e9 / platform.default_clk_period))
+		held = Signal(max=cycles + 1)
+		self.armed = Signal()
+		self.comb += self.armed.eq(held == cycles)
+		self.sync += [
+			If(pressed,
+				If(~self.armed, held.eq(held + 1))
+			).Elif(self.armed,
+				self.boot.eq(1)
+			).Else(
+				held.eq(0)
+			)
+		]
+		self.specials += SBWarmBoot(self.boot, image)
+
+class _Platform:
+	# enough of a platform for check()
+	def __init__(self, clk_period):
+		self.default_clk_period = clk_period
+
+def check(hold=10, presses=((5, 3), (12, 30), (11, 10), (30, 4))):
+	"""
+		Simulate a WarmBoot that needs the button held 'hold' clocks
+		through 'presses', a list of (clocks pressed, clocks released),
+		and check it boots just after the first press that was long
+		enough is let go of, and not before. Returns the cycles run.
+	"""
+	button = Signal()
+	dut = WarmBoot(_Platform(1e9 / hold), 2, hold=1.0, button=button)
+	schedule = []
+	release = None
+	for down, up in presses:
+		schedule += [1] * down
+		if release is None and down >= hold:
+			release = len(schedule)
+		schedule += [0] * up
+	schedule += [0] * 5
+	booted = []
+
+	def bench():
+		for cycle, level in enumerate(schedule):
+			yield button.eq(level)
+			yield
+			if (yield dut.boot) and not booted:
+				booted.append(cycle)
+	run_simulation(dut, bench(),
+					special_overrides={SBWarmBoot: SimSBWarmBoot})
+	# the button goes through the two MultiReg registers, then 'boot'
+	# is registered as well
+	if release is None:
+		if booted:
+			raise AssertionError(f"booted on clock {booted[0]} without a "
+									"long press")
+	elif booted != [release + 3]:
+		raise AssertionError(f"booted on clock {booted[0] if booted else None}, "
+								f"the long press was let go on clock {release}")
+	return len(schedule)
+
+if __name__ == "__main__":
+	print(f"warm boot: {check()} cycles checked, OK")
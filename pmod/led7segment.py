@@ -11,8 +11,34 @@
 # Note it is mostly a migen module not a part of Litex but we are attaching
 # it to a Litex platform. Separating this is another exercise for later.
 #
+import os
+import sys
+if __name__ == "__main__":
+	# when it is run on its own it needs the top of the repository too
+	sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+									".."))
+
 from migen import *
 from litex.build.generic_platform import *
+from litex.build.io import SDROutput
+from gateware.ticks import TickGenerator
+from gateware.pwm import PWM
+
+def request_led7seg(platform, pmod):
+	"""
+		Add the pins of a seven segment PMOD plugged into 'pmod' to the
+		platform and request them. The result has 'num' (the seven
+		segments, active low) and 'sel' (which digit is lit).
+	"""
+	pins = ""
+	for i in range(6, -1, -1):
+		pins += f"{pmod}:{i} "
+	io_def = ("led7seg", 0,
+			Subsignal("num", Pins(pins)),
+			Subsignal("sel", Pins(f"{pmod}:7")),
+	)
+	platform.add_extension([io_def])
+	return platform.request("led7seg")
 
 class SevenSegmentLedDisplay(Module):
 	"""
@@ -21,7 +47,14 @@ class SevenSegmentLedDisplay(Module):
 		allowances for invoking either one. When you instantiate it
 		you need to pass it the platform (type Platform()), the PMOD
 		you are using (string), and an 8 wire Signal for the 'value'
-		which is displayed on the display.
+		which is displayed on the display. If the design already has a
+		TickGenerator pass it in as 'ticks' and the display will use
+		it instead of making its own. 'blank' is how many clocks the
+		segments stay off after switching digits, and 'io_regs' puts
+		the output registers in the SB_IO pins rather than the fabric.
+		'refresh' is how many times a second each digit is lit, and
+		'brightness' a PWM level for both digits or an (upper, lower)
+		pair, with 'pwm' an optional shared PWM counter.
 	"""
 
 	#
@@ -48,46 +81,280 @@ class SevenSegmentLedDisplay(Module):
 			C(~0b1000111),	# F
 		))
 
-	def __init__(self, platform, pmod, value = Signal(8), rev="1.1"):
-		pins = ""
-		for i in range(6, -1, -1):
-			pins += f"{pmod}:{i} "
-		io_def = ("led7seg", 0,
-				Subsignal("num", Pins(pins)),
-				Subsignal("sel", Pins(f"{pmod}:7")),
-		)
-		platform.add_extension([io_def])
-		disp = platform.request("led7seg")
+	def __init__(self, platform, pmod, value = Signal(8), rev="1.1",
+						ticks=None, blank=0, io_regs=True, refresh=250,
+						brightness=None, pwm=None):
+		self.disp = disp = request_led7seg(platform, pmod)
 		# the active display
 		ad = Signal(1)
-		refresh = Signal(24)
-		
-		# set a 250 Hz refresh rate
-		ticks = int(500e6/(250 * platform.default_clk_period)) - 1
+
+		if ticks is None:
+			self.submodules.ticks = ticks = TickGenerator(
+											platform.default_clk_period)
+		# each digit is lit 'refresh' times a second, so the select
+		# line toggles twice that often
+		self.refresh = refresh
+		switch = ticks.tick(2 * refresh)
 		#
 		# So in the clocked part this code toggles the 'select'
-		# line of the PMOD at 65 Hz
+		# line of the PMOD at 'refresh' Hz (250 Hz unless told otherwise)
 		#
-		self.sync += [
-			refresh.eq(refresh + 1),
-			If(refresh == ticks,
-				refresh.eq(0),
-				ad.eq(~ad),
-				disp.sel.eq(ad)
-			),
-#			If(ad,
-#				disp.num.eq(SevenSegmentLedDisplay.glyphs[value[4:]]),
-#			).Else(
-#				disp.num.eq(SevenSegmentLedDisplay.glyphs[value[:4]])),
-		]
+		self.sync += If(switch, ad.eq(~ad))
+
 		#
-		# In the combinatorial part of the code we just put
-		# the appropriate digit on which ever display is selected
-		# by the select line.
+		# Optionally the segments are blanked (all off) for 'blank'
+		# clocks after every switch, which gives the LEDs of the digit
+		# that was just on time to go dark before the other one lights.
+		#
+		dead = Signal(bits_for(blank))
+		if blank:
+			self.sync += If(switch,
+				dead.eq(blank)
+			).Elif(dead != 0,
+				dead.eq(dead - 1)
+			)
+
 		#
+		# The brightness is a PWM level (see ../gateware/pwm.py), either
+		# one for both digits or an (upper, lower) pair, and each one can
+		# be a number or a Signal the design changes while it runs. The
+		# PWM counter can be shared between displays by passing it in as
+		# 'pwm', otherwise a 4 bit one (16 steps) is made here.
+		#
+		lit = Signal(reset=1)
+		if brightness is not None:
+			if pwm is None:
+				self.submodules.pwm = pwm = PWM(4)
+			if not isinstance(brightness, (tuple, list)):
+				brightness = (brightness, brightness)
+			upper_on, lower_on = (pwm.compare(b) for b in brightness)
+			self.comb += lit.eq(Mux(ad, upper_on, lower_on))
+
+		dark = Signal()
+		self.comb += dark.eq((dead != 0) | ~lit)
+
+		#
+		# In the combinatorial part of the code we work out what the
+		# select line and the segments should be next: the appropriate
+		# digit for whichever display is selected (the select line is
+		# low for the upper digit).
+		#
+		num = Signal(7)
+		sel = Signal()
 		self.comb += [
-			If(ad,
-				disp.num.eq(SevenSegmentLedDisplay.glyphs[value[4:]]),
+			sel.eq(~ad),
+			If(dark,
+				num.eq(0b1111111)
+			).Elif(ad,
+				num.eq(SevenSegmentLedDisplay.glyphs[value[4:]]),
 			).Else(
-				disp.num.eq(SevenSegmentLedDisplay.glyphs[value[:4]])),
+				num.eq(SevenSegmentLedDisplay.glyphs[value[:4]])),
 		]
+
+		#
+		# Both of them then go through a register on the way out, so the
+		# segments and the select line always change on the same clock
+		# edge. (It used to be that 'sel' came straight from a flip flop
+		# while 'num' came out of the glyph lookup logic, so the segments
+		# settled later than the select line and could glitch through
+		# other glyphs on the way.) With io_regs those registers are the
+		# ones built into the iCE40 SB_IO pins, which also gives the same
+		# clock to pin delay on every line.
+		#
+		if io_regs:
+			for i in range(len(num)):
+				self.specials += SDROutput(num[i], disp.num[i])
+			self.specials += SDROutput(sel, disp.sel)
+		else:
+			self.sync += [
+				disp.num.eq(num),
+				disp.sel.eq(sel),
+			]
+
+
+#
+# When there is more than one of these displays in a design, each
+# SevenSegmentLedDisplay brings along its own 'ad' flip flop and its own
+# pair of glyph lookups. The scanner below drives any number of them with
+# one of everything instead.
+#
+# It works like the multiplexing the PMOD already does, just one level
+# up. There is one 'slot' per PMOD, and on every tick the scanner moves
+# on to the next slot, looks up the glyph for the digit that PMOD should
+# show next, and loads it into that PMOD's output registers (along with
+# the matching select line). When it has been around all the PMODs it
+# flips to the other digit. So every PMOD still flips between its two
+# digits at the refresh rate, but there is only one glyph decoder.
+#
+# The 'num' and 'sel' for each PMOD are both registers, loaded on the same
+# clock edge, so the segments and the digit select always change together.
+#
+class SevenSegmentScanner(Module):
+	"""
+		Drive several 1BitSquared seven segment PMODs from one refresh
+		counter and one glyph decoder. 'pmods' is a list of PMOD names
+		("PMOD1", ...) and 'values' a matching list of 8 wire Signals,
+		one per display. 'ticks' is an optional shared TickGenerator
+		and 'refresh' the refresh rate in Hz of each display.
+	"""
+	def __init__(self, platform, pmods, values, ticks=None, refresh=250):
+		if len(pmods) != len(values):
+			raise ValueError("need one value for each PMOD")
+		self.displays = disps = [request_led7seg(platform, pmod)
+													for pmod in pmods]
+
+		if ticks is None:
+			self.submodules.ticks = ticks = TickGenerator(
+											platform.default_clk_period)
+		# every display gets a slot, and each one flips digits twice a cycle
+		scan = ticks.tick(2 * refresh * len(pmods))
+
+		# which display we are loading, and which of its digits (1 = upper)
+		slot = Signal(max=max(len(pmods), 2))
+		upper = Signal()
+
+		#
+		# The one and only glyph decoder, it looks up the digit for the
+		# current slot.
+		#
+		value = Array(values)[slot]
+		glyph = Signal(7)
+		self.comb += glyph.eq(
+			SevenSegmentLedDisplay.glyphs[Mux(upper, value[4:], value[:4])])
+
+		self.sync += If(scan,
+			If(slot == len(pmods) - 1,
+				slot.eq(0),
+				upper.eq(~upper)
+			).Else(
+				slot.eq(slot + 1)
+			),
+			#
+			# load the glyph into whichever display this slot belongs
+			# to, the select line is low for the upper digit
+			#
+			*[If(slot == i,
+				disp.num.eq(glyph),
+				disp.sel.eq(~upper)
+			) for i, disp in enumerate(disps)]
+		)
+
+# which digit each glyph is, for reading the display back in testbenches
+_digits = {g.value & 0x7f: i for i, g in enumerate(SevenSegmentLedDisplay.glyphs)}
+
+def shown(disp):
+	"""
+		For testbenches (use it with 'yield from'): read the pins of a
+		display and return the select line and the digit the segments
+		are showing, or None if they are blank or not a digit.
+	"""
+	sel = yield disp.sel
+	num = yield disp.num
+	return sel, _digits.get(num)
+
+def check(blank=0, io_regs=True, cycles=2000):
+	"""
+		Simulate a display with a sped up refresh (a new digit every 8
+		clocks) and check on every clock that the segments show the
+		digit the select line says is lit, right from the edge where
+		the select line changes, after 'blank' clocks of all segments
+		off. The select line has to switch on every refresh tick too.
+		Returns the number of cycles run.
+	"""
+	from litex_boards.platforms.icebreaker_bitsy import Platform
+	from tools.cli import simulate
+
+	platform = Platform()
+	# 8 clocks per refresh tick instead of 12000
+	per_digit = 8
+	platform.default_clk_period = 1e9 / (per_digit * 2 * 250)
+	value = Signal(8, reset=0x12)
+	dut = SevenSegmentLedDisplay(platform, "PMOD1", value, blank=blank,
+									io_regs=io_regs)
+	glyphs = [g.value & 0x7f for g in SevenSegmentLedDisplay.glyphs]
+	errors = []
+	# how many times the select line switched to each digit
+	switches = [0, 0]
+
+	def bench(dut):
+		v, last, since, changed = value.reset.value, None, None, 0
+		for cycle in range(cycles):
+			# put a new number up now and then
+			if cycle % 100 == 50:
+				v = (v * 7 + 0x35) & 0xff
+				changed = cycle
+				yield value.eq(v)
+			yield
+			sel = yield dut.disp.sel
+			num = yield dut.disp.num
+			if last is not None and sel != last:
+				since = 0
+				switches[sel] += 1
+			elif since is not None:
+				since += 1
+			last = sel
+			# wait for the first switch, and for a new number to get through
+			if since is None or cycle - changed < 3:
+				continue
+			digit = v >> 4 if sel == 0 else v & 0xf
+			want = 0x7f if since < blank else glyphs[digit]
+			if num != want:
+				errors.append(f"cycle {cycle}: sel {sel} shows {num:07b}, "
+								f"should be {want:07b}")
+	simulate(dut, bench)
+	# (give or take the tick's first count and the output registers)
+	if abs(sum(switches) - cycles / per_digit) > 2 or min(switches) == 0:
+		errors.append(f"the select line switched to each digit "
+						f"{switches[0]} and {switches[1]} times, not "
+						f"{cycles / per_digit / 2:g}")
+	if errors:
+		raise AssertionError("\n".join(errors[:10]))
+	return cycles
+
+def measure(refresh=250, brightness=None, blank=0, cycles=4096):
+	"""
+		Simulate a display and measure how often each digit is really
+		lit (in Hz) and the fraction of the time each digit's segments
+		are on, as (refresh, (upper duty, lower duty)). The clock is
+		slowed down so a digit is shown for 32 clocks at a time, so
+		'cycles' covers cycles / 64 refresh periods.
+	"""
+	from litex_boards.platforms.icebreaker_bitsy import Platform
+	from tools.cli import simulate
+
+	platform = Platform()
+	platform.default_clk_period = 1e9 / (32 * 2 * refresh)
+	dut = SevenSegmentLedDisplay(platform, "PMOD1", Signal(8, reset=0x88),
+						blank=blank, refresh=refresh, brightness=brightness)
+	toggles, lit = [], [0, 0]
+
+	def bench(dut):
+		last = None
+		for cycle in range(cycles):
+			yield
+			sel = yield dut.disp.sel
+			num = yield dut.disp.num
+			if last is not None and sel != last:
+				toggles.append(cycle)
+			last = sel
+			if num != 0x7f:
+				lit[sel] += 1
+	simulate(dut, bench)
+	# two toggles of the select line per refresh
+	seconds = (toggles[-1] - toggles[0]) * platform.default_clk_period / 1e9
+	return (len(toggles) - 1) / 2 / seconds, tuple(n / cycles for n in lit)
+
+#
+# You can run the checks from the top of the repository with
+#
+#	python3 pmod/led7segment.py [blank]
+#
+if __name__ == "__main__":
+	blank = int(sys.argv[1]) if len(sys.argv) > 1 else 0
+	for io_regs in (False, True):
+		check(blank, io_regs)
+	print(f"seven segment display, blank {blank}: OK")
+	for refresh, brightness in ((250, None), (100, 8), (60, (16, 4))):
+		hz, (upper, lower) = measure(refresh, brightness, blank)
+		print(f"refresh {refresh} Hz, brightness {brightness}: lit {hz:.1f} "
+				f"times a second, upper {upper:.0%} lower {lower:.0%} on")
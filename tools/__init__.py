@@ -0,0 +1,6 @@
+#
+# Host side helpers for building and checking the examples in this
+# repository. Nothing in here ends up in the FPGA, it is all about
+# driving yosys, nextpnr and icepack in a smarter way than "run it all
+# again every time".
+#
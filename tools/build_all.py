@@ -0,0 +1,160 @@
+#
+# Written for the icebitsy-with-litex examples.
+#
+# Build every example in the repository at the same time. Each of the
+# numbered directories has a Makefile with a DESIGN= line naming its
+# script, that is how we find them. Each design then goes through the
+# same three stages a 'make' would do:
+#
+#	elaborate - run the script's main() to write build/top.v and friends
+#	synth     - yosys
+#	pnr       - nextpnr and icepack
+#
+# The designs are handed to a pool of worker processes so a full rebuild
+# takes about as long as the slowest design instead of all of them added
+# up. The build cache from tools/buildcache.py is used for the synth and
+# pnr stages, so a design that hasn't changed costs next to nothing.
+#
+# Everything a design prints goes into its own build/build_all.log, and
+# when they are all done you get a table of how long each stage took and
+# what changed in each design's resources and timing since the last
+# build (see tools/history.py).
+#
+# Usage (from the top of the repository):
+#
+#	python3 -m tools.build_all [-j 4] [blink cylon ...]
+#
+import os
+import re
+import sys
+import glob
+import time
+import runpy
+import argparse
+from contextlib import redirect_stdout, redirect_stderr
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from tools import buildcache
+from tools import history
+from tools import timing
+
+top = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STAGES = ("elaborate", "synth", "pnr")
+
+def designs(root=top):
+	"""
+		Return a (name, directory, script) tuple for every example
+		directory under 'root'.
+	"""
+	found = []
+	for makefile in sorted(glob.glob(os.path.join(root, "[0-9]*_*", "Makefile"))):
+		with open(makefile) as f:
+			m = re.search(r"^DESIGN\s*=\s*(\S+)", f.read(), re.M)
+		if m is None:
+			continue
+		directory = os.path.dirname(makefile)
+		found.append((m.group(1), directory,
+						os.path.join(directory, m.group(1) + ".py")))
+	return found
+
+def _elaborate(directory, script, argv=("--verilog",)):
+	#
+	# Load the design script and ask its main() for the Verilog only,
+	# the tools are run after. 'argv' is the command line it gets,
+	# tools/multiboot.py adds to it. Returns what main() does, the top
+	# module for the scripts that use tools/cli.py.
+	#
+	# some examples share modules from ../pmod (see 04_display_two/Makefile)
+	sys.path[:0] = [directory, os.path.join(top, "pmod")]
+	modules = set(sys.modules)
+	cwd = os.getcwd()
+	os.chdir(directory)
+	try:
+		return runpy.run_path(script)["main"](list(argv))
+	finally:
+		os.chdir(cwd)
+		del sys.path[:2]
+		# forget its modules, so the next script imports its own
+		for name in set(sys.modules) - modules:
+			del sys.modules[name]
+
+def build(name, directory, script, store=None, policy="fail", margin=0.0):
+	"""
+		Build one design, this is what runs in each worker process.
+		Returns (name, times, status, record) where times maps each
+		stage to seconds, status is the build cache result or an error
+		and record has its resources and timing (see tools/history.py).
+		A design short of the slack 'margin' fails or warns depending on
+		'policy' (see tools/timing.py).
+	"""
+	build_dir = os.path.join(directory, "build")
+	os.makedirs(build_dir, exist_ok=True)
+	log = os.path.join(build_dir, "build_all.log")
+	times = {}
+	record = None
+	with open(log, "w", buffering=1) as f, redirect_stdout(f), \
+												redirect_stderr(f):
+		try:
+			start = time.perf_counter()
+			_elaborate(directory, script)
+			times["elaborate"] = time.perf_counter() - start
+			status = buildcache.run_cached(build_dir, store=store, log=log,
+												times=times)
+			record = history.collect(name, build_dir)
+			timing.check(build_dir, policy=policy, margin=margin)
+		except Exception as e:
+			print(f"build_all: {name} failed: {e}")
+			status = "FAILED"
+	return name, times, status, record
+
+def main():
+	parser = argparse.ArgumentParser(description="Build all the examples")
+	parser.add_argument("names", nargs="*",
+						help="designs to build (default: all of them)")
+	parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+						help="designs to build at once (default: all cores)")
+	parser.add_argument("--timing", choices=timing.POLICIES, default="fail",
+						help="what a design short of its slack margin does "
+								"(default fail)")
+	parser.add_argument("--slack-margin", action="append", default=None,
+						metavar="[CLOCK=]NS",
+						help="slack every clock (or CLOCK) needs, in ns")
+	args = parser.parse_args()
+	margin = timing.margins(args.slack_margin)
+
+	todo = [d for d in designs() if not args.names or d[0] in args.names]
+	results = {}
+	start = time.perf_counter()
+	with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+		jobs = [pool.submit(build, *d, None, args.timing, margin) for d in todo]
+		for job in as_completed(jobs):
+			name, times, status, record = job.result()
+			results[name] = (times, status, record)
+			print(f"{name}: {status} ({sum(times.values()):.1f}s)")
+	wall = time.perf_counter() - start
+
+	print()
+	print(f"{'design':14s}" + "".join(f"{s:>11s}" for s in STAGES) +
+			f"{'total':>11s}  status")
+	for name, directory, script in todo:
+		times, status, record = results[name]
+		print(f"{name:14s}" +
+				"".join(f"{times[s]:10.2f}s" if s in times else f"{'-':>11s}"
+							for s in STAGES) +
+				f"{sum(times.values()):10.2f}s  {status}")
+	serial = sum(sum(t.values()) for t, s, r in results.values())
+	print(f"\nwall clock {wall:.2f}s, one after another would be {serial:.2f}s")
+	# the history is only written from here, never by two workers at once
+	print()
+	for name, directory, script in todo:
+		record = results[name][2]
+		if record is not None:
+			print(history.update(record))
+	failed = [n for n, (t, s, r) in results.items() if s == "FAILED"]
+	for name in failed:
+		print(f"{name} failed, see its build/build_all.log")
+	return 1 if failed else 0
+
+if __name__ == "__main__":
+	sys.exit(main())
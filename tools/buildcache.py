@@ -0,0 +1,186 @@
+#
+# Written for the icebitsy-with-litex examples.
+#
+# A build cache for the icestorm flow. Most of the time when you type
+# 'make' the Verilog that Migen writes out is exactly the same as last
+# time (you fixed a comment, or changed a module in a way that elaborates
+# to the same thing). Running yosys and nextpnr again in that case is
+# just a waste of time.
+#
+# So what we do is let LiteX write the build directory, then hash the
+# things that actually matter to the tools:
+#
+#	synth key = top.v + top.ys + yosys version
+#	pnr key   = synth key + top.pcf + timing constraints + the
+#				nextpnr/icepack command lines and versions
+#
+# If the pnr key is in the store we just copy the old top.bin back. If
+# only the synth key is there (you moved a pin, or changed a clock
+# constraint) we copy the old top.json back and only run nextpnr and
+# icepack. Otherwise everything runs and the results are saved.
+#
+# The yosys log (top.rpt) and nextpnr's top_report.json are kept with
+# them and copied back too, so the resource and timing numbers (see
+# tools/history.py) are there even when nothing was run.
+#
+import os
+import time
+import shutil
+import hashlib
+from contextlib import contextmanager
+
+from tools import flow
+from tools import seeds as seed_search
+
+#
+# Where the artifacts live, you can point it somewhere else with the
+# ICEBITSY_CACHE environment variable.
+#
+default_store = os.environ.get("ICEBITSY_CACHE",
+					os.path.join(os.path.expanduser("~"), ".cache", "icebitsy"))
+
+def _digest(*parts):
+	h = hashlib.sha256()
+	for part in parts:
+		if isinstance(part, str):
+			part = part.encode()
+		# length prefix so ("ab", "c") and ("a", "bc") hash differently
+		h.update(len(part).to_bytes(8, "little"))
+		h.update(part)
+	return h.hexdigest()
+
+def _read(path):
+	if not os.path.exists(path):
+		return b""
+	with open(path, "rb") as f:
+		return f.read()
+
+def _save(src, dst):
+	#
+	# Copy into the store through a temporary name so that two builds
+	# running at the same time never see half a file.
+	#
+	os.makedirs(os.path.dirname(dst), exist_ok=True)
+	tmp = f"{dst}.{os.getpid()}"
+	shutil.copyfile(src, tmp)
+	os.replace(tmp, dst)
+
+def _restore(src, dst):
+	#
+	# Copy a log back out of the store. Entries from before the logs
+	# were kept don't have them, so don't leave an old one behind either.
+	#
+	if os.path.exists(src):
+		shutil.copyfile(src, dst)
+	elif os.path.exists(dst):
+		os.remove(dst)
+
+def _verilog(path):
+	#
+	# LiteX stamps the date into the header of top.v, so leave the
+	# comment lines out or nothing would ever hit.
+	#
+	return b"\n".join(line for line in _read(path).splitlines()
+					if not line.lstrip().startswith(b"//"))
+
+def keys(build_dir="build", build_name="top", seeds=1):
+	"""
+		Compute the (synth, pnr) cache keys for an already generated
+		build directory. Searching over several nextpnr seeds gives a
+		different bitstream, so the number of seeds is part of the key.
+	"""
+	steps = flow.read_script(build_dir, build_name)
+	base = os.path.join(build_dir, build_name)
+	#
+	# The yosys script has the absolute path of top.v in it, take that
+	# out so that the same design in a different checkout still hits.
+	#
+	ys = _read(base + ".ys").replace(
+				os.path.abspath(build_dir).encode(), b".")
+	synth = _digest("synth", _verilog(base + ".v"), ys,
+					"\n".join(steps["synth"]), flow.tool_version("yosys"))
+	pnr = _digest("pnr", synth, _read(base + ".pcf"),
+					_read(base + "_pre_pack.py"),
+					"\n".join(steps["pnr"]), "\n".join(steps["pack"]),
+					flow.tool_version("nextpnr-ice40"),
+					flow.tool_version("icepack"), str(seeds))
+	return synth, pnr
+
+def cached_build(platform, fragment, build_dir="build", build_name="top",
+						store=None, log=None, seeds=1, jobs=None, times=None,
+						strategy="default", **kwargs):
+	"""
+		Drop in replacement for platform.build(fragment) which only runs
+		the parts of the flow whose inputs changed. Returns "hit", "pnr"
+		or "miss" depending on how much work had to be done. With
+		seeds > 1 nextpnr is run that many times in parallel and the
+		placement with the best timing is kept (see tools/seeds.py).
+		'strategy' is the synthesis strategy (see tools/flow.py), it
+		changes the yosys script and build script the keys are made
+		from. See run_cached() for 'times'.
+	"""
+	with _timed(times, "verilog"):
+		flow.generate(platform, fragment, build_dir, build_name, **kwargs)
+		flow.apply_strategy(strategy, build_dir, build_name)
+	return run_cached(build_dir, build_name, store, log, seeds, jobs, times)
+
+@contextmanager
+def _timed(times, stage):
+	start = time.perf_counter()
+	yield
+	if times is not None:
+		times[stage] = times.get(stage, 0) + time.perf_counter() - start
+
+def run_cached(build_dir="build", build_name="top", store=None, log=None,
+						seeds=1, jobs=None, times=None):
+	"""
+		The second half of cached_build(), for a build directory that
+		has already been generated. If 'times' is a dictionary the
+		seconds spent in "synth" and "pnr" (which includes icepack) are
+		added to it.
+	"""
+	store = store or default_store
+	steps = flow.read_script(build_dir, build_name)
+	synth_key, pnr_key = keys(build_dir, build_name, seeds)
+
+	base = os.path.join(build_dir, build_name)
+	stored_json = os.path.join(store, "synth", synth_key + ".json")
+	stored_rpt = os.path.join(store, "synth", synth_key + ".rpt")
+	stored_bin = os.path.join(store, "bin", pnr_key + ".bin")
+	stored_report = os.path.join(store, "bin", pnr_key + "_report.json")
+
+	#
+	# An entry from before the reports were kept is no good to the
+	# timing gate (tools/timing.py), nextpnr runs again to make one
+	#
+	if os.path.exists(stored_bin) and os.path.exists(stored_report):
+		shutil.copyfile(stored_bin, base + ".bin")
+		_restore(stored_rpt, base + ".rpt")
+		_restore(stored_report, base + "_report.json")
+		print(f"build cache: hit {pnr_key[:12]}, restored {base}.bin")
+		return "hit"
+
+	if os.path.exists(stored_json):
+		shutil.copyfile(stored_json, base + ".json")
+		_restore(stored_rpt, base + ".rpt")
+		print(f"build cache: netlist {synth_key[:12]} unchanged, "
+				"running nextpnr only")
+		status = "pnr"
+	else:
+		with _timed(times, "synth"):
+			flow.run_stage(steps, "synth", build_dir, log)
+		_save(base + ".json", stored_json)
+		if os.path.exists(base + ".rpt"):
+			_save(base + ".rpt", stored_rpt)
+		status = "miss"
+
+	with _timed(times, "pnr"):
+		if seeds > 1:
+			seed_search.explore(build_dir, build_name, seeds, jobs, log)
+		else:
+			flow.run_stage(steps, "pnr", build_dir, log)
+			flow.run_stage(steps, "pack", build_dir, log)
+	_save(base + ".bin", stored_bin)
+	if os.path.exists(base + "_report.json"):
+		_save(base + "_report.json", stored_report)
+	return status
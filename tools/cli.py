@@ -0,0 +1,271 @@
+#
+# Written for the icebitsy-with-litex examples.
+#
+# The command line every example script shares. Each script defines its
+# design as a Module class (so other code can import it without kicking
+# off a build) and then has a small main() that hands the platform and a
+# function that makes the top module to run() below.
+#
+# From the command line you then get:
+#
+#	./cylon.py              build the bitstream (through the build cache),
+#	                        add its numbers to the build history and
+#	                        check it meets timing (see tools/timing.py)
+#	./cylon.py --verilog    just write build/top.v and the constraints
+#	./cylon.py --sim        run the design in the Migen simulator
+#
+# and each of them tells you how long its steps took.
+#
+# At 12 MHz it takes millions of clocks for an LED to blink, which would
+# take the simulator hours. So a design can give run() a much slower
+# 'sim_clk_period' to use when simulating (--real-clock turns that off),
+# the TickGenerator then counts far fewer clocks for each tick and the
+# testbench sees the same behaviour in a few thousand cycles.
+# --fast-forward (see tools/fastforward.py) skips over the clocks where
+# nothing but the prescaler is counting, which makes even the real clock
+# (--real-clock) quick to simulate. And --backend verilator runs the
+# simulation on Verilator instead of the Migen simulator (see
+# tools/cosim.py), with the same testbench. --trace records the signals
+# a script's probes() picks out to a compact trace file (see
+# tools/trace.py), which is a lot smaller than --vcd.
+#
+# Builds and the Verilog use the synthesis strategy tools/sweep.py
+# recorded as the best for the design, if it has been swept, and
+# --strategy picks another one ("default" is LiteX's own).
+#
+import os
+import sys
+import time
+import argparse
+
+from migen import Module
+from migen.sim import run_simulation
+from litex.build.io import SDROutput
+
+from tools import flow
+from tools import history
+from tools import timing
+from tools import sweep
+from tools.buildcache import cached_build
+from tools.fastforward import Stepper, Until
+from gateware.mac16 import MAC16Counter, SimMAC16Counter
+from gateware.warmboot import WarmBoot, SBWarmBoot, SimSBWarmBoot
+
+def _report(times):
+	print("timing: " + ", ".join(f"{stage} {t:.2f}s" for stage, t in times.items()))
+
+#
+# The simulator can't run the iCE40 primitives, so the SB_IO output
+# registers become ordinary registers for it, the DSP block counters
+# plain counters, and SB_WARMBOOT goes.
+#
+class _SimSDROutput:
+	@staticmethod
+	def lower(dr):
+		m = Module()
+		m.sync += dr.o.eq(dr.i)
+		return m
+
+sim_overrides = {
+	SDROutput: _SimSDROutput,
+	MAC16Counter: SimMAC16Counter,
+	SBWarmBoot: SimSBWarmBoot,
+}
+
+def simulate(top, testbench=None, cycles=1000, vcd=None, fast=False,
+				backend="migen", build_dir="build", times=None, tracer=None):
+	"""
+		Run 'top' in the Migen simulator, or with backend="verilator"
+		on Verilator. 'testbench' is a function that takes the top
+		module and returns a generator, without one the design just
+		runs for 'cycles' clocks. 'fast' skips over the idle clocks (see
+		tools/fastforward.py). Returns the Stepper, which counted the
+		clocks, and how long the simulation took. The time Verilator
+		took to build the design goes in 'times'. A 'tracer' (see
+		tools/trace.py) records a trace as it goes.
+	"""
+	def idle(top):
+		yield Until(limit=cycles)
+	stepper = Stepper(top, fast, native=backend == "verilator", tracer=tracer)
+	generator = stepper.run((testbench or idle)(top))
+	if backend == "verilator":
+		from tools import cosim
+		if vcd is not None:
+			raise ValueError("the Verilator backend can't write a VCD")
+		start = time.perf_counter()
+		library, ns = cosim.build(top, build_dir, sim_overrides)
+		if times is not None:
+			times["verilate"] = time.perf_counter() - start
+		start = time.perf_counter()
+		with cosim.Simulation(library, ns) as sim:
+			sim.run(generator)
+	else:
+		start = time.perf_counter()
+		run_simulation(top, generator, vcd_name=vcd,
+						special_overrides=sim_overrides)
+	return stepper, time.perf_counter() - start
+
+def _strategy(name):
+	# --strategy is "recorded" or a strategy flow.parse_strategy() knows
+	if name != "recorded":
+		try:
+			flow.parse_strategy(name)
+		except ValueError as e:
+			raise argparse.ArgumentTypeError(str(e))
+	return name
+
+def parser(description=None):
+	"""
+		The argument parser run() uses, for scripts that want to add
+		some options of their own.
+	"""
+	p = argparse.ArgumentParser(description=description)
+	mode = p.add_mutually_exclusive_group()
+	mode.add_argument("--verilog", action="store_true",
+						help="only write the Verilog and constraints")
+	mode.add_argument("--sim", action="store_true",
+						help="run the design in the Migen simulator")
+	p.add_argument("--real-clock", action="store_true",
+					help="simulate with the real clock, not the sped up one")
+	p.add_argument("--fast-forward", action="store_true",
+					help="skip the clocks where only the prescaler counts")
+	p.add_argument("--backend", choices=("migen", "verilator"),
+					default="migen", help="the simulator --sim uses")
+	p.add_argument("--cycles", type=int, default=1000,
+					help="cycles to simulate when there is no testbench")
+	p.add_argument("--vcd", default=None,
+					help="write a VCD trace of the simulation to this file")
+	p.add_argument("--trace", default=None,
+					help="record the design's probes to this file")
+	p.add_argument("--trace-signals", default=None,
+					help="only trace these probes (comma separated)")
+	p.add_argument("--trace-tick", type=float, default=None,
+					help="only sample the probes on the design's tick of "
+							"this many Hz")
+	p.add_argument("--tick-ppm", type=float, default=None,
+					help="make ticks a counter can't get within this many "
+							"ppm of with an NCO (see gateware/ticks.py)")
+	p.add_argument("--dsp", action="store_true",
+					help="count the wide tick counters in SB_MAC16 DSP "
+							"blocks (see gateware/mac16.py)")
+	p.add_argument("--warmboot", type=int, default=None, metavar="IMAGE",
+					help="boot this multiboot image on a long press of the "
+							"user button (see gateware/warmboot.py)")
+	p.add_argument("--build-dir", default="build")
+	p.add_argument("--strategy", type=_strategy, default="recorded",
+					help="synthesis strategy, like abc9+sa or default "
+							"(default: the one tools/sweep.py recorded)")
+	p.add_argument("--seeds", type=int, default=1,
+					help="try this many nextpnr seeds and keep the best")
+	p.add_argument("--jobs", type=int, default=None,
+					help="parallel nextpnr runs for --seeds")
+	p.add_argument("--timing", choices=timing.POLICIES, default="fail",
+					help="what a clock short of its slack margin does to "
+							"the build (default fail)")
+	p.add_argument("--slack-margin", action="append", default=None,
+					metavar="[CLOCK=]NS",
+					help="slack every clock (or CLOCK) needs, in ns "
+							"(default 0)")
+	return p
+
+#
+# The Stepper and seconds of the last simulation run() did, for
+# tools/simsuite.py
+#
+last_sim = None
+
+def _tracer(top, args, probes, clk_period):
+	#
+	# The Tracer for --trace, 'probes' is the script's function that
+	# picks out the signals worth tracing
+	#
+	from tools.trace import Tracer
+	if probes is None:
+		raise ValueError("this design has no probes to trace")
+	signals = probes(top)
+	if args.trace_signals is not None:
+		names = args.trace_signals.split(",")
+		missing = [name for name in names if name not in signals]
+		if missing:
+			raise ValueError(f"no probe called {', '.join(missing)}, there "
+								f"is {', '.join(signals)}")
+		signals = {name: signals[name] for name in names}
+	strobe = None
+	if args.trace_tick is not None:
+		ticks = top.ticks.ticks
+		freq = args.trace_tick
+		if freq not in ticks:
+			raise ValueError(f"no {freq:g} Hz tick, there is "
+								f"{', '.join(f'{f:g}' for f in sorted(ticks))}")
+		strobe = ticks[freq]
+	return Tracer(args.trace, signals, strobe, clk_period)
+
+def run(platform, design, argv=None, testbench=None, description=None,
+			args=None, sim_clk_period=None, probes=None, name=None):
+	"""
+		Parse the command line and either build, write the Verilog for,
+		or simulate the module returned by design(). When simulating,
+		'testbench' is handed to simulate() and the platform's clock
+		period is set to 'sim_clk_period' (if given) before design() is
+		called. 'probes' is a function that returns a dictionary of the
+		top module's signals worth tracing, for --trace. 'name' is the
+		design's name as tools/build_all.py knows it (its script's name),
+		for the recorded strategy and the build history; without it the
+		name of the script being run is used.
+	"""
+	global last_sim
+	if args is None:
+		args = parser(description).parse_args(argv)
+	if name is None:
+		name = os.path.splitext(os.path.basename(sys.argv[0]))[0]
+
+	if args.sim and sim_clk_period is not None and not args.real_clock:
+		platform.default_clk_period = sim_clk_period
+
+	times = {}
+	start = time.perf_counter()
+	top = design()
+	if args.warmboot is not None:
+		top.submodules.warmboot = WarmBoot(platform, args.warmboot)
+	times["construct"] = time.perf_counter() - start
+
+	if args.sim:
+		tracer = None
+		if args.trace:
+			tracer = _tracer(top, args, probes, platform.default_clk_period)
+		stepper = None
+		try:
+			stepper, t = simulate(top, testbench, args.cycles, args.vcd,
+									args.fast_forward, args.backend,
+									args.build_dir, times, tracer)
+		finally:
+			if tracer is not None:
+				tracer.close(stepper and stepper.cycles)
+		last_sim = (stepper, t)
+		times["simulate"] = t
+		_report(times)
+		print(f"simulated {stepper.cycles} cycles ({stepper.stepped} "
+				f"stepped), {stepper.cycles / t:.0f} cycles/s")
+		if tracer is not None:
+			print(f"traced {tracer.events} changes to {args.trace}")
+		return top
+
+	strategy = sweep.lookup(name, args.strategy)
+	start = time.perf_counter()
+	if args.verilog:
+		flow.generate(platform, top, args.build_dir)
+		flow.apply_strategy(strategy, args.build_dir)
+		times["verilog"] = time.perf_counter() - start
+		print(f"wrote {args.build_dir}/top.v")
+	else:
+		status = cached_build(platform, top, args.build_dir, seeds=args.seeds,
+								jobs=args.jobs, times=times, strategy=strategy)
+		times["build"] = time.perf_counter() - start
+		print(f"build cache: {status}")
+		record = history.collect(name, args.build_dir)
+		if record is not None:
+			print(history.update(record))
+		timing.check(args.build_dir, policy=args.timing,
+						margin=timing.margins(args.slack_margin))
+	_report(times)
+	return top
@@ -0,0 +1,45 @@
+#
+# Written for the icebitsy-with-litex examples.
+#
+# Build several versions of a design side by side and compare how many
+# logic cells they use and how fast they will run. This is how we check
+# that a "better" way of doing something really is better once yosys and
+# nextpnr are done with it.
+#
+# Each variant gets its own directory under build/compare. The Python
+# side (elaboration) has to run here, but the tool runs go to a pool of
+# worker processes so they happen at the same time.
+#
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from tools import flow
+
+def _place(build_dir):
+	steps = flow.read_script(build_dir)
+	start = time.perf_counter()
+	log = os.path.join(build_dir, "compare.log")
+	for stage in flow.STAGES:
+		flow.run_stage(steps, stage, build_dir, log)
+	rep, lcs, fmax = flow.report(build_dir)
+	return lcs, fmax, time.perf_counter() - start
+
+def compare(variants, build_dir="build/compare", jobs=None):
+	"""
+		'variants' maps a label to a function returning a (platform,
+		top module) pair. Each one is built and a table of logic cells
+		and fmax is printed. Returns {label: (lcs, fmax, seconds)}.
+	"""
+	dirs = {}
+	for label, make in variants.items():
+		platform, top = make()
+		dirs[label] = os.path.join(build_dir, label)
+		flow.generate(platform, top, dirs[label])
+	with ProcessPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+		results = dict(zip(dirs, pool.map(_place, dirs.values())))
+
+	print(f"{'variant':16s}{'LCs':>8s}{'fmax':>12s}{'build':>9s}")
+	for label, (lcs, fmax, t) in results.items():
+		print(f"{label:16s}{lcs:8d}{fmax:8.2f} MHz{t:8.1f}s")
+	return results
@@ -0,0 +1,151 @@
+//
+// Written for the icebitsy-with-litex examples.
+//
+// The C++ half of the Verilator backend (see tools/cosim.py). Verilator
+// turns top.v into a C++ class, Vtop, and this file wraps it in a handful
+// of plain C functions so Python can load the lot as a shared library
+// with ctypes and never has to know anything about C++.
+//
+// Signals are found by name through Verilator's VPI (the Verilog
+// simulator's standard C interface), which is why the Verilog is built
+// with --vpi --public-flat-rw. That keeps every signal Migen named,
+// lets us read and write any of them, and re-evaluates the logic that
+// depends on a signal when we write it.
+//
+#include <cstdint>
+#include <cstring>
+#include <vector>
+
+#include "verilated.h"
+#include "verilated_syms.h"
+#include "verilated_vpi.h"
+#include "Vtop.h"
+
+struct Sim {
+	VerilatedContext *context;
+	Vtop *top;
+};
+
+extern "C" {
+
+void *sim_new(void)
+{
+	Sim *sim = new Sim;
+	sim->context = new VerilatedContext;
+	sim->top = new Vtop(sim->context);
+	sim->top->sys_clk = 0;
+	sim->top->eval();
+	return sim;
+}
+
+void sim_free(void *p)
+{
+	Sim *sim = (Sim *)p;
+	sim->top->final();
+	delete sim->top;
+	delete sim->context;
+	delete sim;
+}
+
+//
+// A handle for the signal 'name' (TOP.top.<name>), NULL if Verilator
+// doesn't have it
+//
+void *sim_handle(void *p, const char *name)
+{
+	return vpi_handle_by_name((PLI_BYTE8 *)name, NULL);
+}
+
+//
+// Where Verilator keeps the value of 'name' (in the top module), and
+// how many bytes of it there are, for sim_until()
+//
+void *sim_pointer(void *p, const char *name, int *size)
+{
+	Sim *sim = (Sim *)p;
+	const VerilatedScope *scope = sim->context->scopeFind("TOP.top");
+	VerilatedVar *var = scope ? scope->varFind(name) : NULL;
+	if (!var)
+		return NULL;
+	*size = var->entSize();
+	return var->datap();
+}
+
+int sim_width(void *h)
+{
+	return vpi_get(vpiSize, (vpiHandle)h);
+}
+
+//
+// The value of a signal as 32 bit words, least significant first
+//
+void sim_get(void *h, uint32_t *words, int n)
+{
+	s_vpi_value v;
+	v.format = vpiVectorVal;
+	vpi_get_value((vpiHandle)h, &v);
+	for (int i = 0; i < n; i++)
+		words[i] = v.value.vector[i].aval;
+}
+
+//
+// Writes take effect straight away, call sim_settle() after the last
+// one to update the logic that depends on them.
+//
+void sim_set(void *h, const uint32_t *words, int n)
+{
+	std::vector<s_vpi_vecval> vector(n);
+	for (int i = 0; i < n; i++) {
+		vector[i].aval = words[i];
+		vector[i].bval = 0;
+	}
+	s_vpi_value v;
+	v.format = vpiVectorVal;
+	v.value.vector = vector.data();
+	vpi_put_value((vpiHandle)h, &v, NULL, vpiNoDelay);
+}
+
+void sim_settle(void *p)
+{
+	((Sim *)p)->top->eval();
+}
+
+//
+// One clock, a rising edge and then a falling one
+//
+void sim_clock(void *p)
+{
+	Sim *sim = (Sim *)p;
+	sim->top->sys_clk = 1;
+	sim->top->eval();
+	sim->top->sys_clk = 0;
+	sim->top->eval();
+}
+
+//
+// Run the clock until one of the 'n' values at 'pointers' (from
+// sim_pointer) changes, or 'limit' clocks go by (limit < 0 for no
+// limit). This is Until() from tools/fastforward.py without going back
+// to Python every clock. Returns the clocks it ran.
+//
+int64_t sim_until(void *p, void **pointers, const int *sizes, int n,
+					int64_t limit)
+{
+	std::vector<std::vector<uint8_t>> before;
+	for (int i = 0; i < n; i++) {
+		uint8_t *value = (uint8_t *)pointers[i];
+		before.emplace_back(value, value + sizes[i]);
+	}
+
+	int64_t waited = 0;
+	while (limit < 0 || waited < limit) {
+		sim_clock(p);
+		waited++;
+		for (int i = 0; i < n; i++)
+			if (memcmp(pointers[i], before[i].data(), sizes[i]))
+				return waited;
+	}
+	return waited;
+}
+
+}
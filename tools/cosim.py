@@ -0,0 +1,264 @@
+#
+# Written for the icebitsy-with-litex examples.
+#
+# A second simulator for the examples: Verilator.
+#
+# The Migen simulator is written in Python and interprets the design one
+# statement at a time, which works out at a few thousand clocks a second.
+# That is fine for the sped up clocks --sim normally uses, but a full lap
+# of the display_two counter at the real 12 MHz is twelve billion clocks.
+#
+# Verilator compiles Verilog into C++, and the Verilog Migen writes for
+# the build is the same design the Migen simulator runs. So here we
+# convert the top module to Verilog (the same way the simulator sees it,
+# with tools/cli.py's sim_overrides), have Verilator build it into a
+# shared library along with the small C wrapper in cosim.cpp, and load
+# that with ctypes.
+#
+# Simulation.run() then steps a testbench generator against the library
+# exactly the way run_simulation() would: 'yield signal' reads a signal
+# (or any expression of them), 'yield signal.eq(value)' writes one on the
+# next clock edge (over the top of whatever the design would have put
+# there), and a bare 'yield' is one clock. So the testbenches in the
+# example scripts, and the Stepper from tools/fastforward.py that runs
+# them, work unchanged. It also takes Until() commands itself and runs
+# them in C, which is where most of the speed comes from.
+#
+# Verilator takes the best part of a minute to build a design, so the
+# libraries go in the build cache's store (see tools/buildcache.py),
+# keyed by the Verilog, cosim.cpp and the Verilator version.
+#
+# To use it give the example scripts --sim --backend verilator. It needs
+# verilator on the PATH ('pip install verilator' will do) and a C++
+# compiler.
+#
+import os
+import ctypes
+import shutil
+import subprocess
+
+from migen import Signal, Cat
+from migen.fhdl.structure import _Statement
+from migen.fhdl.verilog import convert
+from migen.sim.core import Evaluator
+
+from tools import flow
+from tools.buildcache import default_store, _digest, _read, _save
+from tools.fastforward import Until
+
+_harness = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cosim.cpp")
+
+def available():
+	"""
+		True if there is a verilator to build with.
+	"""
+	return shutil.which("verilator") is not None
+
+def build(top, build_dir="build", overrides={}, store=default_store):
+	"""
+		Convert 'top' to Verilog (with the special 'overrides') and
+		build it with Verilator, unless the store already has it.
+		Returns the path of the library and Migen's namespace, which
+		has the name of every signal in it.
+	"""
+	if not available():
+		raise OSError("verilator not found, it is needed for the "
+						"Verilator backend")
+	out = convert(top, name="top", special_overrides=overrides)
+	verilog = str(out)
+	key = _digest(verilog, _read(_harness), flow.tool_version("verilator"))
+	library = os.path.join(store, "cosim", key[:32], "libsim.so")
+	if os.path.exists(library):
+		return library, out.ns
+
+	work = os.path.join(build_dir, "cosim")
+	if os.path.exists(work):
+		shutil.rmtree(work)
+	os.makedirs(work)
+	with open(os.path.join(work, "top.v"), "w") as f:
+		f.write(verilog)
+	cmd = ["verilator", "--cc", "--vpi", "--public-flat-rw", "--exe",
+			"--build", "-j", "0", "-O3", "--x-assign", "fast",
+			"-Wno-fatal", "-Wno-lint", "-Wno-style", "-Mdir", "obj",
+			"-CFLAGS", "-fPIC -O2", "-LDFLAGS", "-shared",
+			"-o", "libsim.so", "top.v", _harness]
+	with open(os.path.join(work, "verilator.log"), "w") as log:
+		result = subprocess.call(cmd, cwd=work, stdout=log,
+									stderr=subprocess.STDOUT)
+	if result != 0:
+		raise OSError(f"Verilator failed, see {work}/verilator.log")
+	_save(os.path.join(work, "obj", "libsim.so"), library)
+	return library, out.ns
+
+class _Values:
+	#
+	# Stands in for the Evaluator's dictionary of signal values, reading
+	# them out of the library as they are asked for. Signals that didn't
+	# make it into the Verilog (nothing uses them) are kept here instead.
+	#
+	def __init__(self, sim):
+		self.sim = sim
+		self.extra = {}
+
+	def __getitem__(self, signal):
+		handle = self.sim.handle(signal)
+		if handle is None:
+			return self.extra[signal]
+		return self.sim.get(handle, signal)
+
+class Simulation:
+	"""
+		A design built by build(), ready to run testbenches against.
+		Use it as a context manager, or call close() when done.
+	"""
+	def __init__(self, library, ns):
+		self.ns = ns
+		self.lib = lib = ctypes.CDLL(os.path.abspath(library))
+		lib.sim_new.restype = ctypes.c_void_p
+		lib.sim_handle.restype = ctypes.c_void_p
+		lib.sim_handle.argtypes = [ctypes.c_void_p, ctypes.c_char_p]
+		for name in ("sim_free", "sim_settle", "sim_clock", "sim_width"):
+			getattr(lib, name).argtypes = [ctypes.c_void_p]
+		lib.sim_get.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int]
+		lib.sim_set.argtypes = lib.sim_get.argtypes
+		lib.sim_pointer.restype = ctypes.c_void_p
+		lib.sim_pointer.argtypes = [ctypes.c_void_p, ctypes.c_char_p,
+									ctypes.c_void_p]
+		lib.sim_until.restype = ctypes.c_int64
+		lib.sim_until.argtypes = [ctypes.c_void_p, ctypes.c_void_p,
+									ctypes.c_void_p, ctypes.c_int, ctypes.c_int64]
+		self.sim = lib.sim_new()
+		self._handles = {}
+		self._watches = {}
+		self.evaluator = Evaluator({}, {})
+		self.evaluator.signal_values = _Values(self)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def close(self):
+		if self.sim is not None:
+			self.lib.sim_free(self.sim)
+			self.sim = None
+
+	def handle(self, signal):
+		"""
+			The library's (handle, width, buffer, pointer, size) for
+			'signal', or None if it isn't in there.
+		"""
+		try:
+			return self._handles[signal]
+		except KeyError:
+			pass
+		# (every signal in the Verilog was named when it was written out)
+		name = self.ns.get_name(signal) if signal in self.ns.sigs else None
+		h = name and self.lib.sim_handle(self.sim, f"TOP.top.{name}".encode())
+		if h:
+			width = self.lib.sim_width(h)
+			size = ctypes.c_int()
+			pointer = self.lib.sim_pointer(self.sim, name.encode(),
+											ctypes.byref(size))
+			handle = (h, width, (ctypes.c_uint32 * ((width + 31) // 32))(),
+						pointer, size.value)
+		else:
+			handle = None
+		self._handles[signal] = handle
+		return handle
+
+	def get(self, handle, signal):
+		h, width, words = handle[:3]
+		self.lib.sim_get(h, words, len(words))
+		value = int.from_bytes(bytes(words), "little")
+		if signal.signed and value >> (width - 1):
+			value -= 1 << width
+		return value
+
+	def _set(self, handle, value):
+		h, width, words = handle[:3]
+		for i in range(len(words)):
+			words[i] = (value >> (32 * i)) & 0xffffffff
+		self.lib.sim_set(h, words, len(words))
+
+	def _clock(self):
+		#
+		# One clock, then the testbench's writes go on top of what the
+		# design did on that edge (the same as the Migen simulator)
+		#
+		self.lib.sim_clock(self.sim)
+		writes = self.evaluator.modifications
+		if writes:
+			for signal, value in writes.items():
+				handle = self.handle(signal)
+				if handle is None:
+					self.evaluator.signal_values.extra[signal] = value
+				else:
+					self._set(handle, value)
+			writes.clear()
+			self.lib.sim_settle(self.sim)
+
+	def _until(self, until):
+		#
+		# If there are writes waiting the first clock goes through
+		# _clock(), the rest run in C. Signals that aren't in the library
+		# can't change so they needn't be watched.
+		#
+		waited = 0
+		if self.evaluator.modifications:
+			watch = Cat(*until.signals) if until.signals else None
+			before = self._eval(watch)
+			self._clock()
+			waited = 1
+			if self._eval(watch) != before:
+				return waited
+			if until.limit is not None and waited >= until.limit:
+				return waited
+		key = tuple(id(s) for s in until.signals)
+		if key not in self._watches:
+			handles = [h for h in map(self.handle, until.signals)
+							if h is not None]
+			if any(h[3] is None for h in handles):
+				raise RuntimeError("Verilator has a signal the testbench "
+									"watches under a name VPI can't see")
+			self._watches[key] = (len(handles),
+				(ctypes.c_void_p * len(handles))(*[h[3] for h in handles]),
+				(ctypes.c_int * len(handles))(*[h[4] for h in handles]))
+		n, pointers, sizes = self._watches[key]
+		left = -1 if until.limit is None else until.limit - waited
+		return waited + self.lib.sim_until(self.sim, pointers, sizes, n, left)
+
+	def _eval(self, request):
+		if request is None:
+			return None
+		if isinstance(request, list):
+			return [self._eval(r) for r in request]
+		if isinstance(request, _Statement):
+			self.evaluator.execute([request])
+			return None
+		return self.evaluator.eval(request)
+
+	def run(self, generator):
+		"""
+			Step the testbench 'generator' until it finishes, the same
+			way run_simulation() would. It can also yield Until()
+			commands (see tools/fastforward.py), as long as they only
+			watch plain Signals.
+		"""
+		reply = None
+		while True:
+			try:
+				request = generator.send(reply)
+			except StopIteration:
+				return
+			if request is None:
+				self._clock()
+				reply = None
+			elif isinstance(request, Until):
+				if not all(isinstance(s, Signal) for s in request.signals):
+					raise TypeError("Until() can only watch Signals with "
+									"the Verilator backend")
+				reply = self._until(request)
+			else:
+				reply = self._eval(request)
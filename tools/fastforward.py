@@ -0,0 +1,210 @@
+#
+# Written for the icebitsy-with-litex examples.
+#
+# Skipping the boring bits of a simulation.
+#
+# Almost every clock in these designs is spent with nothing going on but
+# the TickGenerator's prescaler counting up to its next tick. Blink at
+# 12 MHz does two million of those between LED toggles, and the Migen
+# simulator takes a good fraction of a millisecond for each one.
+#
+# So testbenches can say 'n = yield Until([signals], limit)' instead of
+# stepping one clock at a time, and the Stepper below runs the clock until
+# one of those signals changes. Normally it does that one clock at a time
+# (exactly like a loop of bare yields would). With fast=True, once it sees
+# that nothing but the prescaler changed over a clock (every other
+# register in the design held its value) it knows the next few million
+# clocks will look exactly the same, up until the prescaler reaches the
+# end of its count. So it writes the prescaler straight to the count it
+# would have on the clock before the tick, in a single simulated clock,
+# and carries on from there. The design then sees the tick on the same
+# (counted) clock it would have without the jump.
+# (A TickGenerator can have more than one prescaler, see gateware/ticks.py,
+# then they all move on to the clock before the first of their ticks.)
+#
+# A simulator that can run Until commands itself (the Verilator backend in
+# tools/cosim.py can) gets them handed straight to it when fast is off.
+#
+# It can also record a trace as it goes (see tools/trace.py), it then
+# wakes up for the traced signals as well as the testbench's.
+#
+# The Stepper also keeps a hash of every value the testbench read and the
+# clock it read it on, so a run with fast=True can be checked against one
+# without (tools/simsuite.py does that for every example).
+#
+import hashlib
+
+from migen import Cat
+from migen.fhdl.tools import list_targets
+
+from gateware.ticks import TickGenerator
+
+class Until:
+	"""
+		A testbench command, 'n = yield Until(signals, limit)' runs the
+		clock until one of 'signals' changes (or 'limit' clocks go by)
+		and returns how many clocks that took. With no signals it just
+		runs 'limit' clocks.
+	"""
+	def __init__(self, signals=(), limit=None):
+		self.signals = list(signals)
+		self.limit = limit
+		if not self.signals and limit is None:
+			raise ValueError("Until() needs signals or a limit")
+
+def _tick_generators(module):
+	if isinstance(module, TickGenerator):
+		yield module
+	for name, submodule in module._submodules:
+		yield from _tick_generators(submodule)
+
+class Stepper:
+	"""
+		Runs a testbench generator against 'top' in the simulator (see
+		run()), handling Until commands and counting clocks. 'cycles'
+		is the number of clocks the design went through, 'stepped' the
+		number the simulator actually ran and 'digest' a hash of what
+		the testbench saw. With 'native' the simulator runs Until
+		commands itself (unless 'fast' is on). 'tracer' is a Tracer
+		from tools/trace.py to record to.
+	"""
+	def __init__(self, top, fast=False, native=False, tracer=None):
+		self.top = top
+		self.fast = fast
+		self.native = native
+		self.tracer = tracer
+		self.cycles = 0
+		self.stepped = 0
+		self._hash = hashlib.sha256()
+		self._state = None
+		self._prescalers = []
+
+	@property
+	def digest(self):
+		return self._hash.hexdigest()
+
+	def _setup(self):
+		#
+		# By now the simulator has finalized the design, so the ticks
+		# are built. Every register except the prescalers is 'state'.
+		#
+		self._prescalers = [p for t in _tick_generators(self.top)
+								for p in t.prescalers]
+		counters = {id(count) for count, n in self._prescalers}
+		sync = self.top._fragment.sync.get("sys", [])
+		state = sorted((s for s in list_targets(sync) if id(s) not in counters),
+						key=lambda s: s.duid)
+		self._state = Cat(*state) if state else None
+
+	def run(self, generator):
+		"""
+			Wrap a testbench generator for run_simulation.
+		"""
+		self._setup()
+		if self.tracer is not None:
+			yield from self._trace()
+		reply = None
+		while True:
+			try:
+				command = generator.send(reply)
+			except StopIteration:
+				return
+			if command is None:
+				yield
+				self.cycles += 1
+				self.stepped += 1
+				reply = None
+				if self.tracer is not None:
+					yield from self._trace()
+			elif isinstance(command, Until):
+				if self.tracer is not None:
+					reply = yield from self._traced(command)
+				else:
+					reply = yield from self._wait(command)
+				self._hash.update(f"{self.cycles}+{reply};".encode())
+			else:
+				reply = yield command
+				if isinstance(reply, int):
+					self._hash.update(f"{self.cycles}:{reply};".encode())
+
+	def _wait(self, until):
+		if self.native and not self.fast:
+			n = yield until
+			self.cycles += n
+			self.stepped += n
+			return n
+		return (yield from self._until(until))
+
+	def _trace(self):
+		tracer = self.tracer
+		if tracer.strobe is not None and not (yield tracer.strobe):
+			return
+		values = []
+		for signal in tracer.signals:
+			values.append((yield signal))
+		tracer.sample(self.cycles, values)
+
+	def _traced(self, until):
+		#
+		# An Until that stops to record the trace whenever something
+		# traced changes, then carries on waiting for the testbench's
+		# signals
+		#
+		watch = Cat(*until.signals) if until.signals else None
+		before = (yield watch) if watch is not None else None
+		waited = 0
+		while until.limit is None or waited < until.limit:
+			left = None if until.limit is None else until.limit - waited
+			waited += yield from self._wait(Until(until.signals +
+											self.tracer.watch, left))
+			yield from self._trace()
+			if watch is not None and (yield watch) != before:
+				break
+		return waited
+
+	def _jump(self, left):
+		#
+		# The design is idle, move every prescaler on to the clock before
+		# its next tick (but no further than 'left' clocks), all in one
+		# simulated clock. Returns how many clocks that was.
+		#
+		counts = []
+		for count, n in self._prescalers:
+			counts.append((count, (yield count), n))
+		skip = min((n - 2 - value for count, value, n in counts),
+						default=None)
+		if left is not None:
+			skip = left - 1 if skip is None else min(skip, left - 1)
+		if skip is None:
+			raise AssertionError("the design is idle and has no ticks, "
+									"Until() would wait forever")
+		if skip > 0:
+			for count, value, n in counts:
+				yield count.eq(value + skip + 1)
+			yield
+			return skip + 1
+		yield
+		return 1
+
+	def _until(self, until):
+		watch = Cat(*until.signals) if until.signals else None
+		before = (yield watch) if watch is not None else None
+		waited = 0
+		last = None
+		while until.limit is None or waited < until.limit:
+			left = None if until.limit is None else until.limit - waited
+			state = None
+			if self.fast and self._state is not None:
+				state = yield self._state
+			if state is not None and state == last:
+				n = yield from self._jump(left)
+			else:
+				yield
+				n = 1
+			last = state
+			waited += n
+			self.cycles += n
+			self.stepped += 1
+			if watch is not None and (yield watch) != before:
+				break
+		return waited
@@ -0,0 +1,293 @@
+#
+# Written for the icebitsy-with-litex examples.
+#
+# When you call platform.build(...) LiteX does two things. First it
+# elaborates the design and writes out a bunch of files into the build
+# directory (top.v, top.pcf, top.ys, top_pre_pack.py and build_top.sh).
+# Then it runs build_top.sh which calls yosys, nextpnr and icepack one
+# after another.
+#
+# The helpers in here split those two halves apart. We let LiteX do the
+# first half (with run=False) and then read the commands back out of the
+# generated script so that we can run, skip or tweak each step ourselves.
+#
+import os
+import re
+import json
+import shlex
+import shutil
+import hashlib
+import subprocess
+
+#
+# The three steps of the icestorm flow, in the order they run. They are
+# named after what they do rather than after the program so the names
+# stay the same if a different tool ends up doing the work.
+#
+STAGES = ("synth", "pnr", "pack")
+
+def generate(platform, fragment, build_dir="build", build_name="top", **kwargs):
+	"""
+		Elaborate 'fragment' for 'platform' and write the Verilog,
+		constraints and build script into 'build_dir' without running
+		any of the tools. <name>_names.json maps the Verilog names back
+		to the Migen ones (see migen_names()). Returns Migen's namespace.
+	"""
+	ns = platform.build(fragment, build_dir=build_dir, build_name=build_name,
+							run=False, **kwargs)
+	with open(os.path.join(build_dir, f"{build_name}_names.json"), "w") as f:
+		json.dump(migen_names(ns, fragment), f, indent=1, sort_keys=True)
+	return ns
+
+def migen_names(ns, top):
+	"""
+		Map the name of every signal in the Verilog to where it came
+		from in the Migen design, the module it belongs to and its name
+		in there, like "sevensegmentleddisplay.sel".
+	"""
+	#
+	# A signal's backtrace is the chain of names Migen saw on the way
+	# to it (variables, attributes and the classes of the modules it was
+	# made in), the last one is its own name and the nearest module is
+	# the last of the others that names a class in the design. Pins
+	# (named "obj") and clocks don't belong to a module, they keep their
+	# Verilog names.
+	#
+	classes = set()
+	todo = [top]
+	while todo:
+		m = todo.pop()
+		classes.add(type(m).__name__.lower())
+		todo.extend(sub for name, sub in getattr(m, "_submodules", []))
+	names = {}
+	for signal in ns.sigs:
+		backtrace = getattr(signal, "backtrace", None)
+		if not backtrace:
+			continue
+		name = ns.get_name(signal)
+		owners = [b for b, n in backtrace[:-1] if b in classes]
+		own = backtrace[-1][0]
+		names[name] = f"{owners[-1]}.{own}" if owners and own != "obj" else name
+	return names
+
+def read_script(build_dir="build", build_name="top"):
+	"""
+		Read build_<name>.sh back in and return a dictionary that maps
+		each stage in STAGES to the shell command(s) LiteX wrote for it.
+		nextpnr is also asked for a <name>_report.json.
+	"""
+	steps = {stage: [] for stage in STAGES}
+	with open(os.path.join(build_dir, f"build_{build_name}.sh")) as f:
+		for line in f:
+			line = line.strip()
+			if not line or line.startswith("#") or line == "set -e":
+				continue
+			tool = os.path.basename(shlex.split(line)[0])
+			if tool.startswith("yosys"):
+				steps["synth"].append(line)
+			elif tool.startswith("nextpnr"):
+				#
+				# have nextpnr write its utilization and timing out as
+				# JSON as well, that is a lot easier to read than its log
+				#
+				if "--report" not in line:
+					line += f" --report {build_name}_report.json"
+				steps["pnr"].append(line)
+			else:
+				# icepack, and anything LiteX runs between pnr and the packer
+				steps["pack"].append(line)
+	return steps
+
+#
+# LiteX always synthesizes with the same recipe, "synth_ice40 -dsp" and
+# nextpnr's default placer. A strategy is a different one, written as the
+# options that differ from that joined by "+", like "abc9+nodsp+sa":
+#
+#	abc9       yosys maps the logic with ABC9, which knows the delays
+#	retime     ABC moves flip flops through the logic to balance it
+#	nodsp      don't infer SB_MAC16 DSP blocks for multipliers and adders
+#	noflatten  keep the module hierarchy instead of optimizing across it
+#	sa, static nextpnr's simulated annealing or static placer, not heap
+#
+# "default" is LiteX's own recipe. tools/sweep.py tries them all, bar
+# the ones in INCOMPATIBLE: synth_ice40 refuses -retime with -abc9 ("not
+# currently compatible"), so no strategy has both.
+#
+DEFAULT_STRATEGY = {"abc9": False, "retime": False, "dsp": True,
+					"flatten": True, "placer": "heap"}
+PLACERS = ("heap", "sa", "static")
+INCOMPATIBLE = (("abc9", "retime"),)
+
+def compatible(strategy):
+	"""
+		Whether synth_ice40 takes all the options of 'strategy' at once.
+	"""
+	return not any(strategy[a] and strategy[b] for a, b in INCOMPATIBLE)
+
+def strategy_name(strategy):
+	"""
+		The name of 'strategy' (a dictionary like DEFAULT_STRATEGY).
+	"""
+	parts = [option for option in ("abc9", "retime") if strategy[option]]
+	parts += [f"no{option}" for option in ("dsp", "flatten")
+				if not strategy[option]]
+	if strategy["placer"] != DEFAULT_STRATEGY["placer"]:
+		parts.append(strategy["placer"])
+	return "+".join(parts) or "default"
+
+def parse_strategy(name):
+	"""
+		The strategy dictionary for a name from strategy_name().
+	"""
+	strategy = dict(DEFAULT_STRATEGY)
+	if name == "default":
+		return strategy
+	for part in name.split("+"):
+		if part in ("abc9", "retime"):
+			strategy[part] = True
+		elif part in ("nodsp", "noflatten"):
+			strategy[part[2:]] = False
+		elif part in PLACERS:
+			strategy["placer"] = part
+		else:
+			raise ValueError(f"unknown strategy option '{part}' in '{name}'")
+	for a, b in INCOMPATIBLE:
+		if strategy[a] and strategy[b]:
+			raise ValueError(f"'{name}' has both {a} and {b}, which "
+								f"synth_ice40 won't take together")
+	return strategy
+
+def apply_strategy(strategy, build_dir="build", build_name="top"):
+	"""
+		Rewrite the synth_ice40 line in <name>.ys and the nextpnr
+		command in build_<name>.sh of a generated build directory for
+		'strategy' (a dictionary or a name). The default strategy leaves
+		them as LiteX wrote them, so its builds hit the same cache
+		entries as ever.
+	"""
+	if isinstance(strategy, str):
+		strategy = parse_strategy(strategy)
+	ys = os.path.join(build_dir, f"{build_name}.ys")
+	with open(ys) as f:
+		lines = f.read().split("\n")
+	for i, line in enumerate(lines):
+		args = line.split()
+		if not args or args[0] != "synth_ice40":
+			continue
+		for option, flag in (("abc9", "-abc9"), ("retime", "-retime"),
+								("dsp", "-dsp"), ("flatten", "-noflatten")):
+			want = strategy[option] != (flag == "-noflatten")
+			if want and flag not in args:
+				args.insert(1, flag)
+			elif not want and flag in args:
+				args.remove(flag)
+		lines[i] = " ".join(args)
+	with open(ys, "w") as f:
+		f.write("\n".join(lines))
+
+	if strategy["placer"] == DEFAULT_STRATEGY["placer"]:
+		return
+	script = os.path.join(build_dir, f"build_{build_name}.sh")
+	with open(script) as f:
+		lines = f.read().split("\n")
+	for i, line in enumerate(lines):
+		if not line.startswith("nextpnr"):
+			continue
+		args = shlex.split(line)
+		if "--placer" in args:
+			args[args.index("--placer") + 1] = strategy["placer"]
+		else:
+			args += ["--placer", strategy["placer"]]
+		lines[i] = " ".join(shlex.quote(a) for a in args)
+	with open(script, "w") as f:
+		f.write("\n".join(lines))
+
+def run(cmd, build_dir="build", log=None):
+	"""
+		Run one command from the build script in 'build_dir'. If 'log'
+		is given the output goes there instead of the terminal.
+	"""
+	if log is None:
+		result = subprocess.call(cmd, shell=True, cwd=build_dir)
+	else:
+		with open(log, "a") as f:
+			result = subprocess.call(cmd, shell=True, cwd=build_dir,
+									stdout=f, stderr=subprocess.STDOUT)
+	if result != 0:
+		raise OSError(f"Error running '{cmd}' in {build_dir}")
+
+def run_stage(steps, stage, build_dir="build", log=None):
+	"""
+		Run every command belonging to 'stage' (see read_script)
+	"""
+	for cmd in steps[stage]:
+		run(cmd, build_dir, log)
+
+#
+# Figuring out which version of a tool we have. yosys and nextpnr will
+# tell us, icepack has no version flag so we fingerprint the program
+# itself instead.
+#
+_versions = {}
+
+def tool_version(tool):
+	"""
+		Return a string that changes whenever 'tool' is upgraded.
+	"""
+	if tool in _versions:
+		return _versions[tool]
+	path = shutil.which(tool)
+	if path is None:
+		version = "missing"
+	elif tool == "icepack":
+		with open(path, "rb") as f:
+			version = hashlib.sha256(f.read()).hexdigest()
+	else:
+		flag = "-V" if tool == "yosys" else "--version"
+		out = subprocess.run([path, flag], stdout=subprocess.PIPE,
+								stderr=subprocess.STDOUT)
+		version = out.stdout.decode(errors="replace").strip()
+	_versions[tool] = version
+	return version
+
+def report(build_dir="build", build_name="top"):
+	"""
+		Read the JSON report nextpnr wrote (see read_script) and return
+		it along with the logic cells used and the lowest fmax in MHz.
+	"""
+	with open(os.path.join(build_dir, f"{build_name}_report.json")) as f:
+		rep = json.load(f)
+	lcs = rep["utilization"]["ICESTORM_LC"]["used"]
+	fmax = min((c["achieved"] for c in rep["fmax"].values()), default=None)
+	return rep, lcs, fmax
+
+def synth_stats(build_dir="build", build_name="top"):
+	"""
+		Read the cell counts from the statistics yosys prints at the end
+		of synth_ice40 (LiteX has it log to <name>.rpt). Returns a
+		dictionary of cell type to count, empty if there is no log.
+	"""
+	path = os.path.join(build_dir, f"{build_name}.rpt")
+	if not os.path.exists(path):
+		return {}
+	with open(path, errors="replace") as f:
+		text = f.read()
+	#
+	# Only the last statistics for the top module count, yosys prints
+	# some along the way. Older versions write "SB_LUT4  123", newer
+	# ones "123  SB_LUT4".
+	#
+	start = text.rfind(f"=== {build_name} ===")
+	if start < 0:
+		return {}
+	cells = {}
+	for line in text[start:].splitlines()[1:]:
+		if line.startswith("==="):
+			break
+		m = re.match(r"\s+(SB_\w+|\$\S+)\s+(\d+)\s*$", line)
+		if m is not None:
+			cells[m.group(1)] = int(m.group(2))
+		m = re.match(r"\s+(\d+)\s+(SB_\w+|\$\S+)\s*$", line)
+		if m is not None:
+			cells[m.group(2)] = int(m.group(1))
+	return cells
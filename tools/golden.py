@@ -0,0 +1,294 @@
+#
+# Written for the icebitsy-with-litex examples.
+#
+# Golden models: what the examples should do, worked out with NumPy
+# instead of simulated.
+#
+# Everything here deals in traces, a pair of arrays (cycles, values)
+# with the clock a signal changed on and what it changed to, starting
+# with its value at clock 0. That is how the designs look from the
+# outside anyway, a long run at the real clock is billions of clocks but
+# only a few million changes. Clocks are counted the way the Stepper in
+# tools/fastforward.py counts them, clock n is what a testbench sees after
+# n bare yields.
+#
+# The models are all array operations over every tick at once, no Python
+# loop per tick, so checking a trace of millions of ticks takes a moment
+# and the time goes on simulating it. record() is a testbench that
+# captures a trace to check, and compare() finds the first place a trace
+# and a model disagree.
+#
+# You can check each model against its example from the top of the
+# repository with
+#
+#	python3 -m tools.golden [cylon|display|display_two] [--backend verilator]
+#
+# NumPy is only needed for this module, nothing else in the repository
+# uses it.
+#
+import os
+import sys
+import runpy
+import argparse
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+from migen import Cat
+
+from tools.fastforward import Until
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+								"..", "pmod"))
+from led7segment import SevenSegmentLedDisplay
+
+def _numpy():
+	if np is None:
+		raise ImportError("the golden models need NumPy (pip install numpy)")
+	return np
+
+def tick_cycles(ticks, freq, count):
+	"""
+		The clocks on which tick 'freq' of the TickGenerator 'ticks'
+		(after the design is finalized) is high, for its first 'count'
+		ticks.
+	"""
+	_numpy()
+	if ticks.nco:
+		raise ValueError("the golden models only know counter ticks, not NCOs")
+	#
+	# Each stage of the divider that has a counter registers its strobe,
+	# so it comes a clock after the strobe of the stage it counts. A
+	# stage that counts the clock is high on every clock from the start
+	# if it doesn't divide.
+	#
+	if freq not in ticks.ticks:
+		raise KeyError(f"no {freq} Hz tick")
+	delays = {}
+	for f in sorted(ticks.ticks, reverse=True):
+		source = ticks.source[f]
+		if source is None:
+			n = ticks.cycles[f]
+			delays[f] = 0 if n > 1 else -1
+		else:
+			n = ticks.cycles[f] // ticks.cycles[source]
+			delays[f] = delays[source] + (1 if n > 1 else 0)
+		if f == freq:
+			cycles = ticks.cycles[f]
+			return cycles * np.arange(1, count + 1, dtype=np.int64) + delays[f]
+
+def cylon(steps, width=16):
+	"""
+		The Cylon display after 0 to 'steps' steps, the LED starts at
+		the bottom and bounces between the two ends.
+	"""
+	_numpy()
+	m = np.arange(steps + 1, dtype=np.int64) % (2 * (width - 1))
+	return np.left_shift(1, np.minimum(m, 2 * (width - 1) - m))
+
+def bcd(numbers, digits):
+	"""
+		'numbers' (an array) in BCD, 'digits' digits of it.
+	"""
+	_numpy()
+	numbers = np.asarray(numbers, dtype=np.int64)
+	return sum(((numbers // 10**i) % 10) << (4 * i) for i in range(digits))
+
+def counter(counts, digits):
+	"""
+		A 'digits' digit BCD counter after 0 to 'counts' counts.
+	"""
+	_numpy()
+	return bcd(np.arange(counts + 1) % 10**digits, digits)
+
+def stepped(ticks, freq, values, latency=1):
+	"""
+		The trace of a register that steps through 'values' (starting
+		at values[0]) on tick 'freq', 'latency' clocks after the tick.
+	"""
+	_numpy()
+	cycles = tick_cycles(ticks, freq, len(values) - 1) + latency
+	return np.concatenate([[0], cycles]), np.asarray(values, dtype=np.int64)
+
+#
+# The segment pins for each hex digit, a to g from bit 6 to bit 0, taken
+# from the display itself. They are active low, so 0x7f is dark.
+#
+GLYPHS = [g.value & 0x7f for g in SevenSegmentLedDisplay.glyphs]
+
+def seven_segment(ticks, refresh, value, end, blank=0):
+	"""
+		The trace of the pins of a SevenSegmentLedDisplay at full
+		brightness, as sel << 7 | num, up to clock 'end'. 'value' is
+		the trace of the value it is showing.
+	"""
+	_numpy()
+	glyphs = np.array(GLYPHS, dtype=np.int64)
+	value_cycles, values = value
+	#
+	# The digits swap the clock after each refresh tick, and the segments
+	# stay dark for 'blank' clocks after that. Whatever the display logic
+	# does on a clock shows on the pins (through the output registers)
+	# the clock after.
+	#
+	swaps = tick_cycles(ticks, 2 * refresh, end // ticks.cycles[2 * refresh] + 1) + 1
+	swaps = swaps[swaps < end]
+	t = np.unique(np.concatenate([[0], value_cycles, swaps, swaps + blank]))
+	t = t[t < end - 1]
+	n = np.searchsorted(swaps, t, "right")
+	upper = n % 2
+	shown = values[np.searchsorted(value_cycles, t, "right") - 1]
+	num = glyphs[np.where(upper, shown >> 4, shown) & 0xf]
+	if blank:
+		dark = (n > 0) & (t < swaps[np.maximum(n - 1, 0)] + blank)
+		num = np.where(dark, 0x7f, num)
+	pins = (1 - upper) << 7 | num
+	return changes(np.concatenate([[0], t + 1]), np.concatenate([[0], pins]))
+
+def changes(cycles, values):
+	"""
+		Drop the entries of a trace where the value didn't change (so
+		a trace with one entry for every clock becomes a proper one).
+	"""
+	_numpy()
+	cycles, values = np.asarray(cycles), np.asarray(values)
+	keep = np.concatenate([[True], values[1:] != values[:-1]])
+	return cycles[keep], values[keep]
+
+def compare(expected, trace, end=None):
+	"""
+		Compare a 'trace' with the 'expected' one from a model, up to
+		clock 'end' if given. Returns None if they are the same,
+		otherwise a description of the first difference.
+	"""
+	_numpy()
+	(ec, ev), (tc, tv) = (changes(*expected), changes(*trace))
+	if end is not None:
+		ec, ev = ec[ec < end], ev[ec < end]
+		tc, tv = tc[tc < end], tv[tc < end]
+	n = min(len(ec), len(tc))
+	differ = np.flatnonzero((ec[:n] != tc[:n]) | (ev[:n] != tv[:n]))
+	if len(differ):
+		i = differ[0]
+		return (f"change {i}: expected {ev[i]:#x} on clock {ec[i]}, "
+				f"got {tv[i]:#x} on clock {tc[i]}")
+	if len(ec) > n:
+		return (f"change {n}: expected {ev[n]:#x} on clock {ec[n]}, "
+				f"the trace has no more changes")
+	if len(tc) > n:
+		return (f"change {n}: got {tv[n]:#x} on clock {tc[n]}, the model "
+				f"has no more changes")
+	return None
+
+def record(probes, cycles):
+	"""
+		A testbench (use it with 'yield from') that runs 'cycles' clocks
+		and returns the trace of each of the 'probes', each one a Signal
+		or a list of Signals (which are read as a Cat).
+	"""
+	_numpy()
+	probes = [p if isinstance(p, (list, tuple)) else [p] for p in probes]
+	watch = [s for p in probes for s in p]
+	values = [Cat(*p) for p in probes]
+	traces = []
+	for value in values:
+		traces.append(([0], [(yield value)]))
+	now = 0
+	while now < cycles:
+		now += yield Until(watch, cycles - now)
+		for (c, v), value in zip(traces, values):
+			v.append((yield value))
+			c.append(now)
+	return [changes(c, v) for c, v in traces]
+
+#
+# Checking the models against the examples. The design scripts are loaded
+# the same way tools/simsuite.py loads them, and run with their sped up
+# clock (there are a lot more ticks to check that way).
+#
+def _example(name):
+	from tools.build_all import designs, top
+	for design, directory, script in designs():
+		if design == name:
+			sys.path[:0] = [directory, os.path.join(top, "pmod")]
+			try:
+				return runpy.run_path(script)
+			finally:
+				del sys.path[:2]
+	raise ValueError(f"no example called {name}")
+
+def _latency(counter):
+	# the count register, then the converter pipeline if it has one
+	return 1 + (counter.dabble.latency if hasattr(counter, "dabble") else 0)
+
+def check(name="cylon", backend="migen", ticks=1000, datapath="bcd"):
+	"""
+		Run example 'name' for 'ticks' steps (of the Cylon or the
+		counter) on 'backend' and check the trace against the models.
+		Returns the number of cycles simulated.
+	"""
+	from tools import cli
+
+	script = _example(name)
+	if name == "cylon":
+		platform = script["icebitsy_with_leds"]()
+	else:
+		platform = script["Platform"]()
+	platform.default_clk_period = script["SIM_CLK_PERIOD"]
+	if name == "cylon":
+		top, freq = script["Cylon"](platform, 25), 2 * 25
+	elif name == "display":
+		top, freq = script["Counter"](platform, 5, datapath), 2 * 5
+	else:
+		top, freq = script["Counter"](platform, 10, datapath), 2 * 10
+
+	traces = []
+	def testbench(top):
+		cycles = ticks * top.ticks.cycles[freq]
+		if name == "cylon":
+			probes = [top.display]
+		elif name == "display":
+			pins = top.display.disp
+			probes = [top.count, [pins.num, pins.sel]]
+		else:
+			probes = [top.count]
+		traces.extend((yield from record(probes, cycles)))
+	stepper, seconds = cli.simulate(top, testbench, backend=backend)
+	end = stepper.cycles
+
+	if name == "cylon":
+		models = [stepped(top.ticks, freq, cylon(ticks, len(top.display)))]
+	else:
+		digits = len(top.count) // 4
+		count = stepped(top.ticks, freq, counter(ticks, digits),
+						_latency(top))
+		models = [count]
+		if name == "display":
+			models.append(seven_segment(top.ticks, top.display.refresh,
+											count, end))
+	for model, trace in zip(models, traces):
+		difference = compare(model, trace, end)
+		if difference is not None:
+			raise AssertionError(difference)
+	return end
+
+def main():
+	parser = argparse.ArgumentParser(description="Check the golden models "
+										"against the examples")
+	parser.add_argument("names", nargs="*",
+						default=["cylon", "display", "display_two"])
+	parser.add_argument("--backend", choices=("migen", "verilator"),
+						default="migen")
+	parser.add_argument("--ticks", type=int, default=1000,
+						help="steps of the Cylon or counter to check")
+	parser.add_argument("--datapath", default="bcd",
+						help="counter datapath to build")
+	args = parser.parse_args()
+	for name in args.names:
+		cycles = check(name, args.backend, args.ticks, args.datapath)
+		print(f"{name}: {cycles} cycles match the model")
+
+if __name__ == "__main__":
+	main()
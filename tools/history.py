@@ -0,0 +1,160 @@
+#
+# Written for the icebitsy-with-litex examples.
+#
+# Keeping track of what each change does to the designs once yosys and
+# nextpnr are done with them.
+#
+# All a build hands back is build/top.bin, the numbers that say whether
+# a change was any good (how many logic cells, block RAMs, IOs and PLLs
+# it takes and how fast it will run) are buried in the logs. After each
+# build we read them back out (the yosys cell statistics from top.rpt and
+# nextpnr's top_report.json, see tools/flow.py) into a record, and add it
+# to a history file, one JSON record per line, whenever it is different
+# from the last one for that design. What changed is printed as well:
+#
+#	display_two: +42 LCs, fmax 61.20->58.03 MHz
+#
+# The history lives in build_history.jsonl at the top of the repository
+# (or wherever ICEBITSY_HISTORY points), so 'make clean' doesn't lose it.
+# Both the example scripts and tools/build_all.py add to it, and
+#
+#	python3 -m tools.history [display_two ...] [--cells]
+#
+# prints it, each build against the one before.
+#
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+from tools import flow
+
+top = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+default_history = os.environ.get("ICEBITSY_HISTORY",
+					os.path.join(top, "build_history.jsonl"))
+
+#
+# Short names for the nextpnr resources that matter on the UP5K, the
+# rest are shown as nextpnr calls them.
+#
+RESOURCES = {
+	"ICESTORM_LC": "LCs",
+	"ICESTORM_RAM": "RAM",
+	"ICESTORM_SPRAM": "SPRAM",
+	"ICESTORM_DSP": "DSP",
+	"ICESTORM_PLL": "PLL",
+	"SB_IO": "IO",
+}
+
+def _commit():
+	# the commit the build was made from, with a + if there were changes
+	try:
+		rev = subprocess.run(["git", "describe", "--always", "--dirty=+"],
+								cwd=top, stdout=subprocess.PIPE,
+								stderr=subprocess.DEVNULL)
+	except OSError:
+		return None
+	return rev.stdout.decode().strip() or None
+
+def collect(design, build_dir="build", build_name="top"):
+	"""
+		Read the resource and timing numbers for 'design' out of a
+		finished build. Returns the record, or None if nextpnr left no
+		report.
+	"""
+	if not os.path.exists(os.path.join(build_dir, f"{build_name}_report.json")):
+		return None
+	rep, lcs, fmax = flow.report(build_dir, build_name)
+	return {
+		"design": design,
+		"time": time.strftime("%Y-%m-%d %H:%M:%S"),
+		"commit": _commit(),
+		"utilization": {kind: u["used"] for kind, u in rep["utilization"].items()
+							if u["used"]},
+		"fmax": {clk: round(f["achieved"], 2) for clk, f in rep["fmax"].items()},
+		"cells": flow.synth_stats(build_dir, build_name),
+	}
+
+def read(path=default_history):
+	"""
+		Every record in the history, oldest first.
+	"""
+	if not os.path.exists(path):
+		return []
+	with open(path) as f:
+		return [json.loads(line) for line in f if line.strip()]
+
+def _numbers(record):
+	# the part of a record a new build can change
+	return {key: record[key] for key in ("utilization", "fmax", "cells")}
+
+def diff(old, new, cells=False):
+	"""
+		Describe how record 'new' differs from 'old' (None for the first
+		build of a design), the cell types yosys used too if 'cells'.
+	"""
+	if old is None:
+		parts = [f"{n} {RESOURCES.get(kind, kind)}"
+					for kind, n in sorted(new["utilization"].items())]
+		parts += [f"fmax {f:.2f} MHz" if len(new["fmax"]) == 1
+					else f"fmax {clk} {f:.2f} MHz"
+					for clk, f in sorted(new["fmax"].items())]
+		return f"{new['design']}: {', '.join(parts)} (first build)"
+	parts = []
+	for kind in sorted(old["utilization"].keys() | new["utilization"].keys()):
+		change = new["utilization"].get(kind, 0) - old["utilization"].get(kind, 0)
+		if change:
+			parts.append(f"{change:+d} {RESOURCES.get(kind, kind)}")
+	for clk in sorted(old["fmax"].keys() | new["fmax"].keys()):
+		before, after = old["fmax"].get(clk), new["fmax"].get(clk)
+		if before == after:
+			continue
+		name = "fmax" if len(new["fmax"]) <= 1 else f"fmax {clk}"
+		before = "-" if before is None else f"{before:.2f}"
+		after = "-" if after is None else f"{after:.2f}"
+		parts.append(f"{name} {before}->{after} MHz")
+	if cells:
+		for kind in sorted(old["cells"].keys() | new["cells"].keys()):
+			change = new["cells"].get(kind, 0) - old["cells"].get(kind, 0)
+			if change:
+				parts.append(f"{change:+d} {kind}")
+	return f"{new['design']}: {', '.join(parts) or 'no change'}"
+
+def update(record, path=default_history):
+	"""
+		Add 'record' to the history if it differs from the last one for
+		its design, returns what changed (see diff()).
+	"""
+	last = None
+	for r in read(path):
+		if r["design"] == record["design"]:
+			last = r
+	if last is None or _numbers(last) != _numbers(record):
+		with open(path, "a") as f:
+			f.write(json.dumps(record, sort_keys=True) + "\n")
+	return diff(last, record)
+
+def main():
+	parser = argparse.ArgumentParser(description="Show the build history")
+	parser.add_argument("names", nargs="*",
+						help="designs to show (default: all of them)")
+	parser.add_argument("--cells", action="store_true",
+						help="show the changes in yosys cells as well")
+	parser.add_argument("--history", default=default_history)
+	args = parser.parse_args()
+
+	last = {}
+	for record in read(args.history):
+		design = record["design"]
+		if args.names and design not in args.names:
+			continue
+		print(f"{record['time']}  {record['commit'] or '-':12s}  "
+				f"{diff(last.get(design), record, args.cells)}")
+		last[design] = record
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main())
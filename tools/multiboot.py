@@ -0,0 +1,299 @@
+#
+# Written for the icebitsy-with-litex examples.
+#
+# Putting several examples in the flash at once.
+#
+# The iCE40 boots from a "multiboot" image: five 32 byte headers at the
+# start of the flash, each one saying where a bitstream starts, followed
+# by up to four bitstreams. The FPGA loads the one the first header
+# points at when it powers up, and a design can load any of the four
+# with SB_WARMBOOT (see gateware/warmboot.py), which picks headers 1 to 4.
+# This builds the designs you name (all of them by default, there is room
+# for four) each with a WarmBoot to the next one along, and assembles
+# them into one multiboot.bin the same way icemulti does:
+#
+#	0x000000  header 0 (power on) -> image 0
+#	0x000020  header 1 -> image 0
+#	0x000040  header 2 -> image 1
+#	...
+#	0x010000  image 0 (blink)
+#	0x030000  image 1 (cylon)
+#	...
+#
+# Each image starts on a 64 KiB boundary (an erase block of the flash) by
+# default, and the gaps are 0xff, which is what erased flash reads as. So
+# once it is in the flash, holding the user button for two seconds and
+# letting go switches to the next demo in a few milliseconds.
+#
+# The designs are built in build/multiboot in their directories, through
+# the build cache (see tools/buildcache.py), so they don't disturb their
+# normal builds, and they have to meet timing like any other build (see
+# tools/timing.py). The layout is checked after it is put together, and
+#
+#	python3 -m tools.multiboot --check multiboot.bin
+#
+# checks and prints the layout of any multiboot image, without building
+# anything. The addresses in the headers are flash addresses, so the
+# image has to go at the start of the flash (with iceprog, say), where
+# the Bitsy's DFU bootloader normally lives.
+#
+# Usage (from the top of the repository):
+#
+#	python3 -m tools.multiboot [-j 4] [-o multiboot.bin] [blink cylon ...]
+#
+import os
+import sys
+import time
+import argparse
+from contextlib import redirect_stdout, redirect_stderr
+from concurrent.futures import ProcessPoolExecutor
+
+from tools import buildcache
+from tools import timing
+from tools.build_all import designs, _elaborate
+
+HEADER_SIZE = 32
+HEADERS = 5
+IMAGES = HEADERS - 1
+# what the iCE40 looks for at the start of a header and a bitstream
+PREAMBLE = b"\x7e\xaa\x99\x7e"
+# 24 bit boot addresses
+FLASH_SIZE = 2**24
+ALIGN = 0x10000
+
+def header(address):
+	"""
+		A 32 byte multiboot header that boots the bitstream at flash
+		'address'.
+	"""
+	data = bytearray(PREAMBLE)
+	data += b"\x92\x00\x00"							# boot mode
+	data += b"\x44\x03" + address.to_bytes(3, "big")	# boot address
+	data += b"\x82\x00\x00"							# bank offset
+	data += b"\x01\x08"								# reboot
+	return bytes(data.ljust(HEADER_SIZE, b"\x00"))
+
+def _aligned(offset, align):
+	return (offset + align - 1) // align * align
+
+def assemble(bitstreams, align=ALIGN, power_on=0):
+	"""
+		Put up to four 'bitstreams' (bytes) into a multiboot image, each
+		starting on a multiple of 'align' bytes. Image 'power_on' is the
+		one loaded at power on, the headers for images that aren't there
+		point at it too. Returns the image as bytes.
+	"""
+	if not 1 <= len(bitstreams) <= IMAGES:
+		raise ValueError(f"a multiboot image holds 1 to {IMAGES} bitstreams, "
+							f"not {len(bitstreams)}")
+	addresses = []
+	offset = HEADERS * HEADER_SIZE
+	for bitstream in bitstreams:
+		offset = _aligned(offset, align)
+		addresses.append(offset)
+		offset += len(bitstream)
+	slots = [addresses[power_on]] + [addresses[i] if i < len(addresses)
+										else addresses[power_on]
+										for i in range(IMAGES)]
+	data = bytearray(b"".join(header(a) for a in slots))
+	for address, bitstream in zip(addresses, bitstreams):
+		data += b"\xff" * (address - len(data))
+		data += bitstream
+	return bytes(data)
+
+def layout(data):
+	"""
+		Read the headers of multiboot image 'data' back, returns the
+		boot address in each of them. Raises ValueError if they aren't
+		multiboot headers.
+	"""
+	if len(data) < HEADERS * HEADER_SIZE:
+		raise ValueError(f"{len(data)} bytes is too short for the headers")
+	addresses = []
+	for i in range(HEADERS):
+		h = data[i * HEADER_SIZE:(i + 1) * HEADER_SIZE]
+		if not h.startswith(PREAMBLE) or h[4:7] != b"\x92\x00\x00" or \
+				h[7:9] != b"\x44\x03" or h[12:17] != b"\x82\x00\x00\x01\x08":
+			raise ValueError(f"header {i} isn't a multiboot header")
+		addresses.append(int.from_bytes(h[9:12], "big"))
+	return addresses
+
+def verify(data, align=ALIGN, flash_size=FLASH_SIZE, sizes=None):
+	"""
+		Check multiboot image 'data' offline: the headers, every boot
+		address on an 'align' boundary and after the headers, a
+		bitstream at each one, the bitstreams not running into each
+		other ('sizes' are their lengths, if known) and all of it
+		fitting in 'flash_size' bytes. Returns a list of (start, end)
+		for each image, raises ValueError if anything is wrong.
+	"""
+	if len(data) > flash_size:
+		raise ValueError(f"the image is {len(data)} bytes, the flash is "
+							f"only {flash_size}")
+	addresses = layout(data)
+	images = sorted(set(addresses[1:]))
+	if addresses[0] not in images:
+		raise ValueError(f"the power on header boots {addresses[0]:#x}, "
+							"which no other header does")
+	spans = []
+	for i, start in enumerate(images):
+		if start < HEADERS * HEADER_SIZE or start % align:
+			raise ValueError(f"image at {start:#x} isn't on a {align:#x} "
+								"boundary after the headers")
+		# icepack puts a comment in front of the bitstream
+		if PREAMBLE not in data[start:start + 256]:
+			raise ValueError(f"no bitstream at {start:#x}")
+		end = images[i + 1] if i + 1 < len(images) else len(data)
+		if sizes is not None:
+			if start + sizes[i] > end:
+				raise ValueError(f"image {i} at {start:#x} is {sizes[i]} "
+									f"bytes, it runs into {end:#x}")
+			end = start + sizes[i]
+		else:
+			# the rest up to the next image is padding
+			while end > start and data[end - 1] == 0xff:
+				end -= 1
+		spans.append((start, end))
+	return spans
+
+def check(count=IMAGES):
+	"""
+		Assemble 1 to 'count' made up bitstreams of different sizes and
+		check verify() finds them where they were put, then that it
+		catches a broken header, a missing bitstream and one running
+		into the next. Returns the number of images checked.
+	"""
+	def bitstream(size):
+		# a comment like icepack's, then the preamble
+		return (b"\xff\x00made up\x00\x00\xff" + PREAMBLE).ljust(size, b"\x5a")
+	checked = 0
+	for n in range(1, count + 1):
+		bitstreams = [bitstream(104090 + 40000 * i) for i in range(n)]
+		data = assemble(bitstreams, power_on=n - 1)
+		sizes = [len(b) for b in bitstreams]
+		spans = verify(data, sizes=sizes)
+		if [end - start for start, end in spans] != sizes:
+			raise AssertionError(f"{n} images: found {spans}")
+		addresses = layout(data)
+		if addresses[0] != spans[n - 1][0] or \
+				addresses[1:n + 1] != [start for start, end in spans]:
+			raise AssertionError(f"{n} images: headers point at {addresses}")
+		for start, end in spans:
+			if data[start:end] not in bitstreams:
+				raise AssertionError(f"{n} images: the bitstream at "
+										f"{start:#x} got changed")
+		checked += n
+
+	data = assemble([bitstream(1000), bitstream(2000)], align=0x1000)
+	broken = (data[:HEADER_SIZE + 1] + b"\x00" + data[HEADER_SIZE + 2:],
+				data[:0x1000] + b"\xff" * 1000 + data[0x1000 + 1000:],
+				data)
+	for bad, sizes in zip(broken, (None, None, [0x1001, 2000])):
+		try:
+			verify(bad, align=0x1000, sizes=sizes)
+		except ValueError:
+			continue
+		raise AssertionError("verify() missed a broken image")
+	return checked
+
+def build(name, directory, script, image, count, policy="fail", margin=0.0):
+	"""
+		Build design 'name' as 'image' of 'count' in a multiboot image,
+		with a WarmBoot to the next one. This is what runs in each
+		worker process. Returns (name, the bitstream, seconds).
+	"""
+	build_dir = os.path.join(directory, "build", "multiboot")
+	os.makedirs(build_dir, exist_ok=True)
+	log = os.path.join(build_dir, "multiboot.log")
+	start = time.perf_counter()
+	with open(log, "w", buffering=1) as f, redirect_stdout(f), \
+												redirect_stderr(f):
+		_elaborate(directory, script, ["--verilog", "--build-dir", build_dir,
+										"--warmboot", str((image + 1) % count)])
+		buildcache.run_cached(build_dir, log=log)
+		timing.check(build_dir, policy=policy, margin=margin)
+	with open(os.path.join(build_dir, "top.bin"), "rb") as f:
+		return name, f.read(), time.perf_counter() - start
+
+def describe(data, spans, names=None):
+	"""
+		Print the layout verify() found.
+	"""
+	addresses = layout(data)
+	images = sorted(set(addresses[1:]))
+	print(f"{len(data)} bytes, power on boots image "
+			f"{images.index(addresses[0])}")
+	print(f"{'image':>5s}  {'start':>8s}  {'end':>8s}  {'bytes':>7s}  "
+			f"{'warm boot':9s}  design")
+	for i, (start, end) in enumerate(spans):
+		slots = ",".join(str(s - 1) for s in range(1, HEADERS)
+							if addresses[s] == start)
+		name = names[i] if names else ""
+		print(f"{i:5d}  {start:#08x}  {end:#08x}  {end - start:7d}  "
+				f"{slots:9s}  {name}")
+
+def main():
+	parser = argparse.ArgumentParser(description="Build a multiboot image "
+										"of the examples")
+	parser.add_argument("names", nargs="*",
+						help=f"designs to put in it, in order (default: all "
+								f"of them, up to {IMAGES})")
+	parser.add_argument("-o", "--output", default="multiboot.bin")
+	parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+						help="designs to build at once (default: all cores)")
+	parser.add_argument("--align", type=lambda s: int(s, 0), default=ALIGN,
+						help=f"start each image on a multiple of this "
+								f"(default {ALIGN:#x})")
+	parser.add_argument("--flash-size", type=lambda s: int(s, 0),
+						default=FLASH_SIZE,
+						help=f"bytes of flash (default {FLASH_SIZE:#x})")
+	parser.add_argument("--timing", choices=timing.POLICIES, default="fail",
+						help="what a design short of its slack margin does "
+								"(default fail)")
+	parser.add_argument("--slack-margin", action="append", default=None,
+						metavar="[CLOCK=]NS",
+						help="slack every clock (or CLOCK) needs, in ns")
+	parser.add_argument("--check", metavar="IMAGE",
+						help="only check and show the layout of this image")
+	args = parser.parse_args()
+
+	if args.check:
+		with open(args.check, "rb") as f:
+			data = f.read()
+		try:
+			spans = verify(data, args.align, args.flash_size)
+		except ValueError as e:
+			print(f"{args.check}: {e}")
+			return 1
+		describe(data, spans)
+		return 0
+
+	found = {d[0]: d for d in designs()}
+	names = args.names or list(found)[:IMAGES]
+	unknown = [n for n in names if n not in found]
+	if unknown:
+		parser.error(f"no design {', '.join(unknown)}")
+	if len(names) > IMAGES:
+		parser.error(f"there is only room for {IMAGES} designs")
+	margin = timing.margins(args.slack_margin)
+
+	with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+		jobs = [pool.submit(build, *found[n], i, len(names), args.timing, margin)
+					for i, n in enumerate(names)]
+		bitstreams = []
+		for job in jobs:
+			name, bitstream, seconds = job.result()
+			print(f"{name}: {len(bitstream)} bytes ({seconds:.1f}s)")
+			bitstreams.append(bitstream)
+
+	data = assemble(bitstreams, args.align)
+	spans = verify(data, args.align, args.flash_size,
+					[len(b) for b in bitstreams])
+	with open(args.output, "wb") as f:
+		f.write(data)
+	print(f"wrote {args.output}")
+	describe(data, spans, names)
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,404 @@
+#
+# Written for the icebitsy-with-litex examples.
+#
+# Where the time goes before yosys even starts.
+#
+# Everything up to top.v is Python: the script adds its extensions to
+# the platform and requests pins, constructs the modules, Migen finalizes
+# them into one big fragment and then writes that out as Verilog (and
+# LiteX writes the constraints and build script). For these examples that
+# is a fraction of a second, but every LED8 extension, seven segment
+# display and BCD digit adds to it, and it is easy to write a module that
+# gets slower the more of them there are without noticing.
+#
+# So this runs a design script (the Verilog only, as tools/build_all.py
+# does) with the time split into
+#
+#	request    add_extension() and request() on the platform
+#	construct  the design's modules being constructed (what is left of
+#	           the design() that the script hands to tools/cli.py)
+#	finalize   Module.finalize(), the TickGenerator building its
+#	           counters and every fragment being merged into one
+#	verilog    writing the Verilog (LiteX's writer, on Migen's fragments)
+#	generate   the rest of tools/flow.generate(), LiteX writing the
+#	           constraints and build script and the names file
+#	other      everything else (imports, the command line, ...)
+#
+# and, once the design is finalized, a tree of its submodules with the
+# number of statements (every assignment, If and Case counts, including
+# the ones nested inside), expression nodes in them and signals in each,
+# its submodules included.
+# Each phase only counts its own time, a request() made while a module
+# is being constructed is request time, not construct time.
+#
+#	python3 -m tools.profiling [--cprofile FILE] 04_display_two/display_two.py
+#
+# profiles a script (anything after the script's name is its own command
+# line, with --verilog added), with --cprofile it also runs under
+# cProfile and keeps the statistics (for snakeviz, or python3 -m pstats)
+# and prints the functions that took the longest. And
+#
+#	python3 -m tools.profiling --bench
+#
+# elaborates the designs scaled up (more displays, longer BCD counters,
+# more LED8s on the Cylon, see BENCHES) to twice, four times, ... their
+# size and fits how the time (over what the smallest size takes) grows
+# with the number of nodes at the larger sizes. The
+# nodes rather than the statements, because a design can be meant to grow
+# faster than its statements do (the BCDCounter's carries each AND all
+# the digits below them, so they get longer as well as more numerous),
+# and the Verilog writer has to walk every node. Anything whose time
+# grows faster than a power of 1.3 of that is flagged, and fails the run.
+#
+import os
+import sys
+import math
+import time
+import pstats
+import cProfile
+import argparse
+import tempfile
+from contextlib import contextmanager
+
+from migen import *
+from migen.fhdl.structure import _Statement, If, Case
+from migen.fhdl.tools import list_signals
+from migen.fhdl.visit import NodeVisitor
+from litex.build.generic_platform import GenericPlatform
+
+from litex.gen.fhdl import verilog
+
+from tools import cli
+from tools import flow
+from tools.build_all import top, _elaborate
+
+PHASES = ("request", "construct", "finalize", "verilog", "generate", "other")
+
+class Profiler:
+	"""
+		Splits the time spent while it is active (as a context manager)
+		into the PHASES by wrapping the platform, Migen and tools/cli.py
+		functions that do each of them. 'times' has the seconds each
+		phase took, 'calls' how many times it was entered.
+	"""
+	def __init__(self):
+		self.times = dict.fromkeys(PHASES, 0.0)
+		self.calls = dict.fromkeys(PHASES, 0)
+		self._stack = []
+		self._mark = None
+		self._patched = []
+
+	def _charge(self):
+		now = time.perf_counter()
+		self.times[self._stack[-1]] += now - self._mark
+		self._mark = now
+
+	@contextmanager
+	def phase(self, name):
+		"""
+			Count the time inside the with block as 'name', and not as
+			whatever phase it happened in.
+		"""
+		self._charge()
+		self._stack.append(name)
+		self.calls[name] += 1
+		try:
+			yield
+		finally:
+			self._charge()
+			self._stack.pop()
+
+	def _wrap(self, owner, attr, name, wrapper=None):
+		original = getattr(owner, attr)
+		def timed(*args, **kwargs):
+			with self.phase(name):
+				return original(*args, **kwargs)
+		setattr(owner, attr, wrapper(original) if wrapper else timed)
+		self._patched.append((owner, attr, original))
+
+	def __enter__(self):
+		for attr in ("add_extension", "request", "lookup_request"):
+			self._wrap(GenericPlatform, attr, "request")
+		self._wrap(Module, "finalize", "finalize")
+		self._wrap(verilog, "convert", "verilog")
+		self._wrap(flow, "generate", "generate")
+		# the design() a script hands to cli.run() is the construction
+		def run(original):
+			def timed(platform, design, *args, **kwargs):
+				def construct():
+					with self.phase("construct"):
+						return design()
+				return original(platform, construct, *args, **kwargs)
+			return timed
+		self._wrap(cli, "run", None, run)
+		self._stack = ["other"]
+		self._mark = time.perf_counter()
+		return self
+
+	def __exit__(self, *exc):
+		self._charge()
+		for owner, attr, original in reversed(self._patched):
+			setattr(owner, attr, original)
+		self._patched = []
+
+	@property
+	def total(self):
+		return sum(self.times.values())
+
+	def report(self):
+		"""
+			A line for each phase.
+		"""
+		total = self.total or 1.0
+		return [f"{name:10s}{self.times[name] * 1e3:10.1f} ms "
+				f"{self.times[name] / total:6.1%}  ({self.calls[name]} calls)"
+				for name in PHASES]
+
+def _statements(node):
+	#
+	# Every statement, counting the ones inside Ifs and Cases
+	#
+	if isinstance(node, (list, tuple)):
+		return sum(_statements(n) for n in node)
+	if isinstance(node, If):
+		return 1 + _statements(node.t) + _statements(node.f)
+	if isinstance(node, Case):
+		return 1 + sum(_statements(s) for s in node.cases.values())
+	return 1 if isinstance(node, _Statement) else 0
+
+class _Nodes(NodeVisitor):
+	#
+	# Every statement and expression node, the way the Verilog writer
+	# walks them: an expression used twice is written out (and counted)
+	# twice
+	#
+	def __init__(self):
+		self.count = 0
+
+	def visit(self, node):
+		self.count += 1
+		NodeVisitor.visit(self, node)
+
+def census(module, name="top", depth=None):
+	"""
+		The (path, level, statements, nodes, signals) of 'module' and
+		each of its submodules (down to 'depth' levels), once it is
+		finalized. 'nodes' counts the expressions in the statements as
+		well. The counts include the submodules'.
+	"""
+	module.finalize()
+	f = module._fragment
+	sync = [s for statements in f.sync.values() for s in statements]
+	nodes = _Nodes()
+	nodes.visit(f.comb + sync)
+	rows = [(name, 0, _statements(f.comb) + _statements(sync), nodes.count,
+				len(list_signals(f.comb) | list_signals(sync)))]
+	if depth == 0:
+		return rows
+	seen = {}
+	for sub_name, sub in module._submodules:
+		if sub_name is None:
+			sub_name = type(sub).__name__.lower()
+			seen[sub_name] = seen.get(sub_name, -1) + 1
+			sub_name += str(seen[sub_name])
+		for path, level, *counts in census(
+				sub, sub_name, None if depth is None else depth - 1):
+			rows.append((f"{name}.{path}", level + 1, *counts))
+	return rows
+
+def _print_census(rows):
+	print(f"{'module':40s}{'statements':>12s}{'nodes':>8s}{'signals':>9s}")
+	for path, level, statements, nodes, signals in rows:
+		label = "  " * level + path.rsplit(".", 1)[-1]
+		print(f"{label:40s}{statements:12d}{nodes:8d}{signals:9d}")
+
+def profile(script, argv=(), cprofile=None):
+	"""
+		Run design 'script' with command line 'argv' (and --verilog,
+		unless it is a --sim) under a Profiler, and cProfile too if
+		'cprofile' names a file for the statistics. Returns (profiler,
+		top module).
+	"""
+	argv = list(argv) if "--sim" in argv else ["--verilog"] + list(argv)
+	directory = os.path.dirname(os.path.abspath(script))
+	profiler = Profiler()
+	prof = cProfile.Profile() if cprofile else None
+	with profiler:
+		if prof:
+			prof.enable()
+		try:
+			design = _elaborate(directory, os.path.abspath(script), argv)
+		finally:
+			if prof:
+				prof.disable()
+	if prof:
+		prof.dump_stats(cprofile)
+	return profiler, design
+
+#
+# The benchmark. Each one makes a platform and a top module 'n' times
+# the size of the example it comes from, every extra display or LED8 on a
+# made up PMOD connector (the Verilog doesn't care that the pins don't
+# exist).
+#
+def _platform(n):
+	from litex_boards.platforms.icebreaker_bitsy import Platform
+	platform = Platform()
+	for i in range(n):
+		platform.add_connector((f"BENCH{i}",
+								" ".join(f"X{i}_{p}" for p in range(8))))
+	return platform
+
+def _displays(n):
+	# 03_display, a BCD count on 'n' SevenSegmentLedDisplays
+	from gateware.bcd import BCDCounter
+	from gateware.ticks import TickGenerator
+	sys.path[:0] = [os.path.join(top, "pmod")]
+	try:
+		from led7segment import SevenSegmentLedDisplay
+	finally:
+		del sys.path[:1]
+	platform = _platform(n)
+	m = Module()
+	m.submodules.ticks = ticks = TickGenerator(platform.default_clk_period)
+	m.submodules.bcd = bcd = BCDCounter(2 * n, ce=ticks.tick(10))
+	for i in range(n):
+		m.submodules += SevenSegmentLedDisplay(platform, f"BENCH{i}",
+								bcd.count[8 * i:8 * (i + 1)], ticks=ticks)
+	return platform, m
+
+def _scanner(n):
+	# 04_display_two, a BCD count on 'n' displays with one glyph decoder
+	from gateware.bcd import BCDCounter
+	from gateware.ticks import TickGenerator
+	sys.path[:0] = [os.path.join(top, "pmod")]
+	try:
+		from led7segment import SevenSegmentScanner
+	finally:
+		del sys.path[:1]
+	platform = _platform(n)
+	m = Module()
+	m.submodules.ticks = ticks = TickGenerator(platform.default_clk_period)
+	m.submodules.bcd = bcd = BCDCounter(2 * n, ce=ticks.tick(10))
+	m.submodules.display = SevenSegmentScanner(platform,
+								[f"BENCH{i}" for i in range(n)],
+								[bcd.count[8 * i:8 * (i + 1)] for i in range(n)],
+								ticks=ticks)
+	return platform, m
+
+def _led8(n):
+	# 02_cylon, an LED bouncing along 'n' LED8 extensions
+	sys.path[:0] = [os.path.join(top, "02_cylon")]
+	try:
+		from cylon import Cylon, gen_led8
+	finally:
+		del sys.path[:1]
+	platform = _platform(n)
+	pmods = [f"BENCH{i}" for i in range(n)]
+	for num, pmod_port in enumerate(pmods):
+		platform.add_extension([gen_led8(pmod_port, num)])
+	return platform, Cylon(platform, 25, pmods=pmods)
+
+BENCHES = {"displays": _displays, "scanner": _scanner, "led8": _led8}
+
+def _fit(points):
+	#
+	# The least squares slope of log(seconds) against log(nodes),
+	# the power the time grows with. A difference that came out at
+	# nothing or less (timing noise) can't be fitted.
+	#
+	points = [(s, t) for s, t in points if s > 0 and t > 0]
+	if len(points) < 2:
+		return 0.0
+	xs = [math.log(s) for s, t in points]
+	ys = [math.log(t) for s, t in points]
+	mx, my = sum(xs) / len(xs), sum(ys) / len(ys)
+	sxx = sum((x - mx) ** 2 for x in xs)
+	return sum((x - mx) * (y - my) for x, y in zip(xs, ys)) / sxx if sxx else 0.0
+
+def bench(names=None, scales=(1, 2, 4, 8, 16, 32), repeat=3, limit=1.3):
+	"""
+		Elaborate each benchmark in BENCHES (or 'names') at every scale,
+		the best of 'repeat' runs, and print the time in each phase.
+		Returns {name: exponent}, the power of the number of nodes
+		the time grows with, and prints which are over 'limit'.
+	"""
+	exponents = {}
+	for name in names or BENCHES:
+		make = BENCHES[name]
+		print(f"{name}:")
+		print(f"{'scale':>7s}{'statements':>12s}{'nodes':>8s}" +
+				"".join(f"{p:>11s}" for p in PHASES[:-1]) + f"{'total':>11s}")
+		points = []
+		for n in scales:
+			best = None
+			for _ in range(repeat):
+				with tempfile.TemporaryDirectory() as build_dir:
+					profiler = Profiler()
+					with profiler:
+						with profiler.phase("construct"):
+							platform, design = make(n)
+						flow.generate(platform, design, build_dir)
+				if best is None or profiler.total < best.total:
+					best = profiler
+			path, level, statements, nodes, signals = census(design, depth=0)[0]
+			points.append((nodes, best.total))
+			print(f"{n:7d}{statements:12d}{nodes:8d}" +
+					"".join(f"{best.times[p] * 1e3:9.1f}ms" for p in PHASES[:-1]) +
+					f"{best.total * 1e3:9.1f}ms")
+		# the small scales are mostly fixed costs (the ticks, LiteX's
+		# files), which would flatten the curve, so what the smallest
+		# one costs is taken off the rest and the larger half is fitted
+		s0, t0 = points[0]
+		grown = [(s - s0, t - t0) for s, t in points[1:]]
+		exponents[name] = e = _fit(grown[len(grown) // 2:] if len(grown) > 3
+										else grown)
+		print(f"  time grows as nodes^{e:.2f}" +
+				(f", more than ^{limit}" if e > limit else ""))
+	return exponents
+
+def main():
+	parser = argparse.ArgumentParser(description="Profile the elaboration of "
+										"a design, or benchmark it scaled up")
+	parser.add_argument("script", nargs="?", help="the design script")
+	parser.add_argument("argv", nargs=argparse.REMAINDER,
+						help="its options (--verilog is added)")
+	parser.add_argument("--cprofile", metavar="FILE",
+						help="run under cProfile and keep the statistics")
+	parser.add_argument("--top", type=int, default=15,
+						help="functions to show from --cprofile")
+	parser.add_argument("--depth", type=int, default=None,
+						help="submodule levels to count")
+	parser.add_argument("--bench", action="store_true",
+						help="time the designs scaled up instead")
+	parser.add_argument("--scales", default="1,2,4,8,16,32",
+						help="sizes for --bench (default 1,2,4,8,16,32)")
+	parser.add_argument("--limit", type=float, default=1.3,
+						help="fail --bench if the time grows faster than "
+								"the nodes to this power")
+	parser.add_argument("--only", action="append", choices=list(BENCHES),
+						help="run just this benchmark")
+	args = parser.parse_args()
+
+	if args.bench:
+		scales = [int(s) for s in args.scales.split(",")]
+		exponents = bench(args.only, scales, limit=args.limit)
+		over = [name for name, e in exponents.items() if e > args.limit]
+		return 1 if over else 0
+	if args.script is None:
+		parser.error("name a design script, or --bench")
+
+	profiler, design = profile(args.script, args.argv, args.cprofile)
+	print(f"{args.script}: {profiler.total * 1e3:.1f} ms")
+	for line in profiler.report():
+		print(line)
+	if isinstance(design, Module):
+		print()
+		_print_census(census(design, depth=args.depth))
+	if args.cprofile:
+		print()
+		pstats.Stats(args.cprofile).sort_stats("cumulative").print_stats(args.top)
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,117 @@
+#
+# Written for the icebitsy-with-litex examples.
+#
+# nextpnr uses a random number generator when it places the design, and
+# the 'seed' it starts from can make a surprising difference to how fast
+# the result will run. LiteX always uses seed 1. This runs the same yosys
+# netlist through nextpnr with a bunch of different seeds at the same
+# time (one per core), reads the timing report from each run, and keeps
+# the one with the most slack.
+#
+# Usage (after the design has been generated into build/):
+#
+#	python3 -m tools.seeds -n 16 02_cylon/build
+#
+import os
+import json
+import shlex
+import shutil
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from tools import flow
+
+def _seed_command(cmd, seed, build_name):
+	#
+	# Take the nextpnr command LiteX wrote and point its outputs into a
+	# per seed directory so the runs don't trip over each other.
+	#
+	args = shlex.split(cmd)
+	out = f"seed_{seed}"
+	for opt, value in (("--seed", str(seed)),
+						("--asc", f"{out}/{build_name}.asc"),
+						("--report", f"{out}/report.json"),
+						("--log", f"{out}/nextpnr.log")):
+		if opt in args:
+			args[args.index(opt) + 1] = value
+		else:
+			args += [opt, value]
+	return out, " ".join(shlex.quote(a) for a in args)
+
+def slack(report):
+	"""
+		Worst slack in ns over every constrained clock in a nextpnr
+		report, along with the achieved fmax per clock in MHz.
+	"""
+	worst = None
+	fmax = {}
+	for clk, f in report.get("fmax", {}).items():
+		fmax[clk] = f["achieved"]
+		s = 1e3 / f["constraint"] - 1e3 / f["achieved"]
+		worst = s if worst is None else min(worst, s)
+	return worst, fmax
+
+def _place(build_dir, cmd, seed, build_name):
+	out, cmd = _seed_command(cmd, seed, build_name)
+	os.makedirs(os.path.join(build_dir, out), exist_ok=True)
+	try:
+		flow.run(cmd, build_dir, log=os.path.join(build_dir, out, "stdout.log"))
+	except OSError:
+		return {"seed": seed, "slack": None, "fmax": {}}
+	with open(os.path.join(build_dir, out, "report.json")) as f:
+		worst, fmax = slack(json.load(f))
+	return {"seed": seed, "slack": worst, "fmax": fmax}
+
+def explore(build_dir="build", build_name="top", seeds=8, jobs=None, log=None):
+	"""
+		Place and route build_dir/<build_name>.json with seeds 1..seeds
+		using up to 'jobs' processes (all the cores by default). The best
+		placement is copied to <build_name>.asc, packed, and its seed and
+		timing are written to <build_name>_seed.json.
+	"""
+	steps = flow.read_script(build_dir, build_name)
+	(cmd,) = steps["pnr"]
+	with ProcessPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+		runs = list(pool.map(_place, [build_dir] * seeds, [cmd] * seeds,
+								range(1, seeds + 1), [build_name] * seeds))
+
+	placed = [r for r in runs if r["slack"] is not None]
+	if not placed:
+		raise OSError(f"nextpnr failed for every seed in {build_dir}")
+	best = max(placed, key=lambda r: r["slack"])
+	for r in runs:
+		mhz = ", ".join(f"{m:.2f}" for m in r["fmax"].values()) or "failed"
+		mark = " <--" if r is best else ""
+		print(f"seed {r['seed']:3d}: {mhz} MHz{mark}")
+
+	src = os.path.join(build_dir, f"seed_{best['seed']}")
+	shutil.copyfile(os.path.join(src, f"{build_name}.asc"),
+					os.path.join(build_dir, f"{build_name}.asc"))
+	shutil.copyfile(os.path.join(src, "report.json"),
+					os.path.join(build_dir, f"{build_name}_report.json"))
+	flow.run_stage(steps, "pack", build_dir, log)
+	with open(os.path.join(build_dir, f"{build_name}_seed.json"), "w") as f:
+		json.dump({"seed": best["seed"], "slack": best["slack"],
+					"fmax": best["fmax"], "runs": runs}, f, indent=1)
+	return best
+
+def main():
+	parser = argparse.ArgumentParser(
+				description="Place and route with several nextpnr seeds")
+	parser.add_argument("build_dir", nargs="?", default="build")
+	parser.add_argument("-n", "--seeds", type=int, default=8,
+						help="number of seeds to try (default 8)")
+	parser.add_argument("-j", "--jobs", type=int, default=None,
+						help="parallel nextpnr runs (default: all cores)")
+	parser.add_argument("--build-name", default="top")
+	args = parser.parse_args()
+
+	steps = flow.read_script(args.build_dir, args.build_name)
+	if not os.path.exists(os.path.join(args.build_dir,
+										args.build_name + ".json")):
+		flow.run_stage(steps, "synth", args.build_dir)
+	best = explore(args.build_dir, args.build_name, args.seeds, args.jobs)
+	print(f"kept seed {best['seed']} (worst slack {best['slack']:.2f} ns)")
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,244 @@
+#
+# Written for the icebitsy-with-litex examples.
+#
+# Measuring what a seven segment display really does.
+#
+# The SevenSegmentLedDisplay in pmod/led7segment.py lights one digit at
+# a time, so how bright and steady it looks comes down to timing: how
+# often each digit gets lit, for what fraction of the time, whether the
+# segments ever show the other digit's pattern while a digit is selected
+# (ghosting), and how long a new value takes to show up. This works all
+# of that out from the pins, as recorded by --trace (see tools/trace.py),
+# by running the segment patterns back through the display's glyphs.
+#
+# The measurements, for each digit (upper is sel 0, lower is sel 1):
+#
+#	refresh     times a second the digit is selected
+#	selected    fraction of the time it is selected
+#	lit         fraction of the time it is selected with segments on
+#	shown       the characters it showed and for how long
+#	unknown     clocks its segments were on in a pattern that isn't
+#	            a character
+#	mismatch    clocks its segments showed something other than its
+#	            digit of the value (when the value was traced), or
+#	            still showed the other digit's pattern after sel
+#	            switched (when it wasn't)
+#	latency     clocks from the value changing to the digit showing it
+#
+# Run it on a trace from the top of the repository with
+#
+#	python3 -m tools.segments run.trc [--display 1] [--shift 8]
+#
+# For 03_display that is the sel, num and count probes, for display_two
+# sel1, num1 and count shifted down 8 bits for the upper display.
+#
+import os
+import sys
+import argparse
+from bisect import bisect_right
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+								"..", "pmod"))
+from led7segment import SevenSegmentLedDisplay
+
+# the segment pattern of each character, and back again
+GLYPHS = [g.value & 0x7f for g in SevenSegmentLedDisplay.glyphs]
+CHARACTERS = {glyph: "0123456789AbcdEF"[i] for i, glyph in enumerate(GLYPHS)}
+DARK = 0x7f
+UPPER, LOWER = 0, 1
+
+def _at(trace, cycle):
+	# the value of a (cycles, values) trace on 'cycle'
+	cycles, values = trace
+	i = bisect_right(cycles, cycle) - 1
+	return values[i] if i >= 0 else None
+
+def analyze(sel, num, end, value=None, shift=0, latency=1, clk_period=None):
+	"""
+		Measure a display from the (cycles, values) traces of its 'sel'
+		and 'num' pins up to clock 'end'. 'value' is the trace of what
+		it was asked to show (its 8 bits start 'shift' bits up), the
+		pins are expected to follow it 'latency' clocks later (one for
+		the output registers). Returns a dictionary of measurements for
+		each of UPPER and LOWER, refresh is in Hz if 'clk_period' (in
+		ns) is given and per clock otherwise. The measurements start
+		when sel first switches, before that the output registers are
+		still coming out of reset.
+	"""
+	start = sel[0][1] if len(sel[0]) > 1 else 0
+	# everywhere something can change, value changes show up 'latency' later
+	times = {start} | set(sel[0]) | set(num[0])
+	if value is not None:
+		times |= {c + latency for c in value[0]}
+	times = sorted(t for t in times if start <= t < end)
+	digits = {d: {"selected": 0, "lit": 0, "unknown": 0, "mismatch": 0,
+					"shown": {}, "edges": [], "latency": []}
+				for d in (UPPER, LOWER)}
+
+	def nibble(v, d):
+		return (v >> (shift + (4 if d == UPPER else 0))) & 0xf
+
+	# value changes waiting to show up, for each digit (cycle, glyph)
+	pending = {UPPER: None, LOWER: None}
+	changes = iter(zip(*value)) if value is not None else iter(())
+	change = next(changes, None)
+	last_sel, last_num, stale = None, None, None
+	for i, t in enumerate(times):
+		length = (times[i + 1] if i + 1 < len(times) else end) - t
+		s, n = _at(sel, t), _at(num, t)
+		if s is None or n is None:
+			continue
+		digit = digits[s]
+		# a new value, each digit it changes has to catch up
+		while change is not None and change[0] <= t:
+			c, v = change
+			for d in (UPPER, LOWER):
+				if c == 0 or nibble(v, d) != nibble(_at(value, c - 1), d):
+					pending[d] = (c, GLYPHS[nibble(v, d)])
+			change = next(changes, None)
+		if s != last_sel:
+			digit["edges"].append(t)
+			# what the other digit was showing, until num changes
+			stale = last_num if last_num not in (None, DARK) else None
+		elif n != last_num:
+			stale = None
+		last_sel, last_num = s, n
+
+		digit["selected"] += length
+		if n != DARK:
+			digit["lit"] += length
+			character = CHARACTERS.get(n)
+			if character is None:
+				digit["unknown"] += length
+			else:
+				digit["shown"][character] = digit["shown"].get(character, 0) + length
+			if value is not None:
+				expected = GLYPHS[nibble(_at(value, t - latency), s)]
+				if n != expected:
+					digit["mismatch"] += length
+			elif n == stale:
+				digit["mismatch"] += length
+		if pending[s] is not None and n == pending[s][1]:
+			digit["latency"].append(t - pending[s][0])
+			pending[s] = None
+
+	results = {}
+	for d, digit in digits.items():
+		edges = digit.pop("edges")
+		span = edges[-1] - edges[0] if len(edges) > 1 else None
+		refresh = (len(edges) - 1) / span if span else 0.0
+		if clk_period is not None:
+			refresh *= 1e9 / clk_period
+		lat = digit.pop("latency")
+		results[d] = dict(digit, refresh=refresh,
+			selected=digit["selected"] / (end - start),
+			lit=digit["lit"] / (end - start),
+			latency=(min(lat), sum(lat) / len(lat), max(lat)) if lat else None)
+	return results
+
+def report(results, clk_period=None):
+	"""
+		Print what analyze() found.
+	"""
+	unit = "Hz" if clk_period is not None else "per clock"
+	for d, name in ((UPPER, "upper"), (LOWER, "lower")):
+		r = results[d]
+		print(f"{name} digit: refreshed {r['refresh']:.6g} {unit}, selected "
+				f"{r['selected']:.1%}, lit {r['lit']:.1%} of the time")
+		shown = ", ".join(f"{c} {n}" for c, n in sorted(r["shown"].items()))
+		print(f"  shown (clocks): {shown or 'nothing'}")
+		print(f"  mismatch {r['mismatch']} clocks, unknown patterns "
+				f"{r['unknown']} clocks")
+		if r["latency"] is not None:
+			low, mean, high = r["latency"]
+			line = f"  value to digit {low} / {mean:.1f} / {high} clocks"
+			if clk_period is not None:
+				line += (f" ({low * clk_period / 1e3:.3g} / "
+						f"{mean * clk_period / 1e3:.3g} / "
+						f"{high * clk_period / 1e3:.3g} us)")
+			print(line + " (min / mean / max)")
+
+def check(cycles=4000):
+	"""
+		Simulate a display (with its clock sped up) showing a value that
+		keeps changing, trace it and check the analysis: the refresh it
+		was built with, the segments always matching, and no value
+		taking longer than a refresh period to show. Returns the cycles
+		run.
+	"""
+	import tempfile
+	from migen import Signal
+	from litex_boards.platforms.icebreaker_bitsy import Platform
+	from tools.cli import simulate
+	from tools.trace import Tracer, read
+
+	platform = Platform()
+	# a new digit every 8 clocks
+	platform.default_clk_period = 1e9 / (8 * 2 * 250)
+	value = Signal(8, reset=0x12)
+	dut = SevenSegmentLedDisplay(platform, "PMOD1", value)
+	pins = dut.disp
+
+	def bench(dut):
+		v = value.reset.value
+		for cycle in range(cycles):
+			if cycle % 37 == 20:
+				v = (v * 7 + 0x35) & 0xff
+				yield value.eq(v)
+			yield
+
+	with tempfile.TemporaryDirectory() as directory:
+		path = os.path.join(directory, "display.trc")
+		tracer = Tracer(path, {"sel": pins.sel, "num": pins.num,
+								"value": value})
+		stepper, seconds = simulate(dut, bench, tracer=tracer)
+		tracer.close(stepper.cycles)
+		header, traces = read(path)
+	results = analyze(traces["sel"], traces["num"], header["end"],
+						traces["value"], clk_period=platform.default_clk_period)
+	for d in (UPPER, LOWER):
+		r = results[d]
+		if abs(r["refresh"] - 250) > 1:
+			raise AssertionError(f"refresh {r['refresh']:.1f} Hz, not 250")
+		if r["mismatch"] or r["unknown"]:
+			raise AssertionError(f"{r['mismatch']} mismatched and "
+									f"{r['unknown']} unknown clocks")
+		if r["latency"] is None or r["latency"][2] > 2 * 8 + 1:
+			raise AssertionError(f"value to digit latency {r['latency']}")
+	return cycles
+
+def main():
+	from tools.trace import read
+
+	parser = argparse.ArgumentParser(description="Measure seven segment "
+										"display timing from a trace")
+	parser.add_argument("trace", help="a trace from --trace")
+	parser.add_argument("--display", default="",
+						help="which display, the suffix on its sel and num "
+								"probes (0, 1, ... for display_two)")
+	parser.add_argument("--value", default="count",
+						help="the probe with the value shown (default count)")
+	parser.add_argument("--shift", type=int, default=0,
+						help="where the display's 8 bits start in the value")
+	parser.add_argument("--latency", type=int, default=1,
+						help="clocks the pins are expected to lag the value")
+	args = parser.parse_args()
+
+	header, traces = read(args.trace)
+	if header["strobe"]:
+		parser.error("the trace was sampled on a strobe, timing needs "
+						"every change")
+	sel, num = f"sel{args.display}", f"num{args.display}"
+	if sel not in traces or num not in traces:
+		parser.error(f"the trace has no {sel} and {num}")
+	end = header["end"] or max(max(traces[sel][0]), max(traces[num][0])) + 1
+	value = traces.get(args.value)
+	clk_period = header.get("clk_period")
+	results = analyze(traces[sel], traces[num], end, value, args.shift,
+						args.latency, clk_period)
+	print(f"{args.trace}: {end} clocks" +
+			(f", {end * clk_period / 1e9:.6g} s" if clk_period else ""))
+	report(results, clk_period)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,306 @@
+#
+# Written for the icebitsy-with-litex examples.
+#
+# Run every simulation check in the repository and report how each one
+# went. That is the testbench in each example script (what --sim runs,
+# with the clock slowed down so an LED blink or a full trip round the
+# counter only takes a few thousand clocks, see tools/cli.py) along with
+# the checks in the shared modules.
+#
+# Like tools/build_all.py the examples are found through the DESIGN= line
+# in their Makefiles, and everything runs in a pool of worker processes.
+# At the end there is a table of how many clocks each one simulated and
+# how fast the simulator got through them.
+#
+# With --verilator every design is run on Verilator as well (see
+# tools/cosim.py), including the full length runs at the real clock that
+# would take the Migen simulator hours. Those have to see exactly what the
+# Migen runs saw, and the table shows how many times faster they went.
+#
+# Usage (from the top of the repository):
+#
+#	python3 -m tools.simsuite [-j 4] [--verilator] [blink display ...]
+#
+import io
+import os
+import sys
+import time
+import runpy
+import argparse
+import traceback
+from collections import deque
+from contextlib import redirect_stdout, redirect_stderr
+from concurrent.futures import ProcessPoolExecutor
+
+from tools import cli
+from tools.fastforward import Until
+from tools.build_all import designs, top
+
+#
+# Extra command lines for designs that can be built more than one way,
+# each one gets simulated.
+#
+VARIANTS = {
+	"cylon": [["--pmods", "PMOD1"], ["--pmods", "PMOD1,PMOD2,PMOD3"],
+				["--bounce", "compare"]],
+	"display": [["--datapath", "binary"]],
+	"display_two": [["--datapath", "chain"], ["--datapath", "binary"]],
+}
+
+#
+# Designs that are also simulated at their real clock (with fast forward,
+# see tools/fastforward.py). display_two isn't, a full lap of its counter
+# is over eight minutes of real time.
+#
+REAL_CLOCK = ("blink", "cylon", "display")
+
+#
+# Extra command lines for the real clock runs. Blink's --sys-freq is only
+# seen there: otherwise the simulation clock is the design's slowed down
+# one, whatever the PLL would make (see tools/cli.py).
+#
+REAL_CLOCK_VARIANTS = {
+	"blink": [["--sys-freq", "48"]],
+}
+
+FAST = "fast forward"
+VERILATOR = "verilator"
+DSP = "dsp"
+
+def check_counter(count, digits, per_count, displays=(), counts=None,
+					jitter=0):
+	"""
+		A testbench (use it with 'yield from') for the BCD counters.
+		Checks 'count' goes up by one, in BCD, every 'per_count' clocks
+		and rolls over from 99..9 to 0, and that each display shows the
+		digits it should. 'displays' is a list of (pins, shift) where
+		the display shows the 8 bits of the count starting at 'shift'
+		(see led7segment.shown). By default it follows the count all
+		the way round, 'counts' can make that shorter. If the count's
+		tick is an NCO (see gateware/ticks.py) 'jitter' is how many
+		clocks a count can be early or late.
+	"""
+	from gateware.bcd import to_bcd
+	from led7segment import shown
+
+	counts = counts or 10**digits + 1
+	numbers = {to_bcd(n): n for n in range(10**digits)}
+	watch = [count] + [s for pins, shift in displays
+							for s in (pins.sel, pins.num)]
+	# the display is a clock or two behind the counter
+	recent = deque([(yield count)], 3)
+	cycle, since, seen = 0, None, 0
+	while seen < counts:
+		n = yield Until(watch, 2 * per_count)
+		cycle += n
+		since = None if since is None else since + n
+		value = yield count
+		if value != recent[-1]:
+			if numbers.get(value) != (numbers[recent[-1]] + 1) % 10**digits:
+				raise AssertionError(f"clock {cycle}: count went from "
+										f"{recent[-1]:x} to {value:x}")
+			if since is not None and abs(since - per_count) > 2 * jitter:
+				raise AssertionError(f"clock {cycle}: count changed after "
+										f"{since} clocks, not {per_count:g}")
+			since = 0
+			seen += 1
+		# (the first count can take a bit longer, the binary datapaths
+		# have a converter pipeline to get through)
+		elif (cycle - 64 if since is None else since) > 2 * per_count:
+			raise AssertionError(f"clock {cycle}: count stuck at {value:x}")
+		recent.append(value)
+		# give the display registers a few clocks to be loaded
+		for pins, shift in displays if cycle >= 4 else ():
+			sel, digit = yield from shown(pins)
+			# the select line is low for the upper digit
+			nibble = shift + (4 if sel == 0 else 0)
+			if digit not in [(v >> nibble) & 0xf for v in recent]:
+				raise AssertionError(f"clock {cycle}: display shows {digit} "
+										f"for count {value:x}")
+	if counts > 10**digits and 0 not in recent and value != 0:
+		raise AssertionError("count never rolled over")
+
+def _design(directory, script, argv):
+	#
+	# Run a design script's main() with --sim, the same way build_all
+	# runs it with --verilog. Returns the clocks simulated, the clocks the
+	# simulator stepped, the time it took and the Stepper's digest.
+	#
+	sys.path[:0] = [directory, os.path.join(top, "pmod")]
+	modules = set(sys.modules)
+	cwd = os.getcwd()
+	os.chdir(directory)
+	try:
+		cli.last_sim = None
+		runpy.run_path(script)["main"](["--sim"] + argv)
+		stepper, seconds = cli.last_sim
+		return stepper.cycles, stepper.stepped, seconds, stepper.digest
+	finally:
+		os.chdir(cwd)
+		del sys.path[:2]
+		for name in set(sys.modules) - modules:
+			del sys.modules[name]
+
+def _module(name, *args):
+	#
+	# The checks in the shared modules return the cycles they ran
+	#
+	sys.path[:0] = [os.path.join(top, "pmod")]
+	try:
+		start = time.perf_counter()
+		if name == "led7segment":
+			import led7segment as module
+		elif name == "golden":
+			from tools import golden as module
+		elif name == "segments":
+			from tools import segments as module
+		elif name == "multiboot":
+			from tools import multiboot as module
+		else:
+			module = __import__(f"gateware.{name}", fromlist=["check"])
+		cycles = module.check(*args)
+		return cycles, cycles, time.perf_counter() - start, None
+	finally:
+		del sys.path[:1]
+
+def run(label, function, *args):
+	"""
+		Run one check, this is what runs in each worker process.
+		Returns (label, result, output) where result is the (cycles,
+		stepped, seconds, digest) from the check, or None if it failed.
+	"""
+	out = io.StringIO()
+	with redirect_stdout(out), redirect_stderr(out):
+		try:
+			result = function(*args)
+		except Exception:
+			traceback.print_exc()
+			result = None
+	return label, result, out.getvalue()
+
+def suite(names=(), verilator=False):
+	"""
+		Every check as a (label, function, args...) tuple. Every design
+		is run both stepping every clock and with --fast-forward, and
+		the ones in REAL_CLOCK also with their real clock (and the
+		command lines in REAL_CLOCK_VARIANTS). 'verilator'
+		adds a run of each on Verilator, the real clock ones without
+		fast forward.
+	"""
+	checks = []
+	backend = ["--backend", VERILATOR]
+	for name, directory, script in designs():
+		if names and name not in names:
+			continue
+		for argv in [[]] + VARIANTS.get(name, []):
+			label = " ".join([name] + argv[1:])
+			checks.append((label, _design, directory, script, argv))
+			checks.append((f"{label} {FAST}", _design, directory, script,
+							argv + ["--fast-forward"]))
+			if verilator:
+				checks.append((f"{label} {VERILATOR}", _design, directory,
+								script, argv + backend))
+		if name in REAL_CLOCK:
+			checks.append((f"{name} real clock", _design, directory, script,
+							["--fast-forward", "--real-clock"]))
+			# only the real clock's counters are wide enough for a DSP
+			checks.append((f"{name} real clock {DSP}", _design, directory,
+							script, ["--fast-forward", "--real-clock", "--dsp"]))
+			if verilator:
+				checks.append((f"{name} real clock {VERILATOR}", _design,
+								directory, script, ["--real-clock"] + backend))
+			for argv in REAL_CLOCK_VARIANTS.get(name, []):
+				label = " ".join([name] + argv[1:])
+				checks.append((f"{label} real clock", _design, directory,
+								script, ["--fast-forward", "--real-clock"] + argv))
+	for module, args in (("led7segment", (0,)), ("led7segment", (3,)),
+							("bcd", (3,)), ("dabble", (10,)),
+							("segments", (4000,)), ("crg", (12000000,)),
+							("ticks", (7,)), ("mac16", (5,)),
+							("warmboot", (10,)), ("multiboot", (4,))):
+		if not names or module in names:
+			label = f"{module} {' '.join(str(a) for a in args)}"
+			checks.append((label, _module, module) + args)
+	#
+	# The golden models (they need NumPy) against the Cylon and counters,
+	# a lot further on Verilator
+	#
+	from tools import golden
+	for design in ("cylon", "display", "display_two"):
+		if golden.np is None or names and not {"golden", design} & set(names):
+			continue
+		checks.append((f"golden {design}", _module, "golden", design,
+						"migen", 1000))
+		if verilator:
+			checks.append((f"golden {design} {VERILATOR}", _module, "golden",
+							design, VERILATOR, 100000))
+	return checks
+
+def main():
+	parser = argparse.ArgumentParser(description="Run the simulation checks")
+	parser.add_argument("names", nargs="*",
+						help="designs or modules to check (default: all)")
+	parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+						help="checks to run at once (default: all cores)")
+	parser.add_argument("--verilator", action="store_true",
+						help="also run the designs on Verilator")
+	args = parser.parse_args()
+	if args.verilator:
+		from tools import cosim
+		if not cosim.available():
+			parser.error("--verilator needs verilator on the PATH")
+
+	start = time.perf_counter()
+	with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+		jobs = [pool.submit(run, *check)
+					for check in suite(args.names, args.verilator)]
+		results = [job.result() for job in jobs]
+	wall = time.perf_counter() - start
+
+	#
+	# A fast forwarded run, one on Verilator or one with its counters in
+	# DSP blocks, has to have seen exactly what the testbench saw without
+	#
+	digests = {label: result[3] for label, result, output in results
+					if result is not None}
+	for i, (label, result, output) in enumerate(results):
+		for suffix in (FAST, VERILATOR, DSP):
+			if result is not None and label.endswith(suffix):
+				plain = label[:-len(suffix) - 1]
+				if plain in digests and digests[plain] != result[3]:
+					results[i] = (label, None, "the testbench saw something "
+									"different from the run without it\n")
+
+	#
+	# How much faster Verilator went, against the Migen simulator stepping
+	# every clock of the same design
+	#
+	rates = {label: result[0] / result[2] for label, result, output in results
+				if result is not None}
+	def speedup(label):
+		if not label.endswith(VERILATOR):
+			return ""
+		plain = label[:-len(VERILATOR) - 1].replace(" real clock", "")
+		if plain not in rates:
+			return ""
+		return f"{rates[label] / rates[plain]:8.0f}x"
+
+	print(f"{'check':32s}{'cycles':>12s}{'stepped':>10s}{'time':>9s}"
+			f"{'cycles/s':>13s}  status{'  speedup' if args.verilator else ''}")
+	failed = []
+	for label, result, output in results:
+		if result is None:
+			failed.append((label, output))
+			print(f"{label:32s}{'-':>12s}{'-':>10s}{'-':>9s}{'-':>13s}  FAILED")
+		else:
+			cycles, stepped, seconds, digest = result
+			print(f"{label:32s}{cycles:12d}{stepped:10d}{seconds:8.2f}s"
+					f"{cycles / seconds:13.0f}  ok    {speedup(label)}".rstrip())
+	total = sum(r[1][0] for r in results if r[1] is not None)
+	print(f"\n{total} cycles simulated, wall clock {wall:.2f}s")
+	for label, output in failed:
+		print(f"\n{label} failed:\n{output}")
+	return 1 if failed else 0
+
+if __name__ == "__main__":
+	sys.exit(main())
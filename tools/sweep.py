@@ -0,0 +1,277 @@
+#
+# Written for the icebitsy-with-litex examples.
+#
+# Trying the synthesis options instead of guessing.
+#
+# LiteX synthesizes every design with the same recipe, and yosys and
+# nextpnr have options that can make a design smaller or faster, or
+# neither, depending on the design (see the strategies in tools/flow.py).
+# So this writes a design's Verilog once and builds it every way at once,
+# one combination of
+#
+#	abc9 or not, retime or not, DSP inference or not, and the heap or
+#	sa placer (but not abc9 with retime, which synth_ice40 refuses)
+#
+# per worker process, then prints a table of the LCs, fmax, worst slack
+# and how long yosys and nextpnr took for each:
+#
+#	cylon:
+#	strategy                   LCs      fmax     slack    synth      pnr
+#	default                     59     73.37     69.70    2.58s    1.10s
+#	sa                          59     76.41     70.25    2.34s    1.80s
+#	...
+#
+# The winner is the one with the fewest LCs that meets timing (or with
+# --prefer fmax the fastest), and it is written to synth_strategies.json
+# at the top of the repository (or wherever ICEBITSY_STRATEGIES points)
+# along with its numbers and the tool versions. From then on the example
+# scripts, tools/build_all.py and tools/multiboot.py build that design
+# with it, unless you give them --strategy default (or another one).
+#
+# --vary flatten tries -noflatten as well, but LiteX writes the whole
+# design out as one Verilog module, so there is no hierarchy for yosys
+# to keep and it makes no difference to these examples.
+#
+# Each combination builds in build/sweep/<strategy> in the design's
+# directory without the build cache, so the times are real ones.
+#
+# Usage (from the top of the repository):
+#
+#	python3 -m tools.sweep [-j 4] [--prefer lcs|fmax] [--no-record]
+#			[--vary abc9,retime,dsp,placer] [cylon display_two ...]
+#
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import itertools
+from contextlib import redirect_stdout, redirect_stderr
+from concurrent.futures import ProcessPoolExecutor
+
+from tools import flow
+from tools import timing
+from tools.build_all import top, designs, _elaborate
+
+default_strategies = os.environ.get("ICEBITSY_STRATEGIES",
+						os.path.join(top, "synth_strategies.json"))
+
+#
+# What each option of a strategy can be. nextpnr's static placer is
+# left out as it is meant for much bigger parts than the UP5K.
+#
+CHOICES = {
+	"abc9": (False, True),
+	"retime": (False, True),
+	"dsp": (True, False),
+	"flatten": (True, False),
+	"placer": ("heap", "sa"),
+}
+VARY = ("abc9", "retime", "dsp", "placer")
+PREFER = ("lcs", "fmax")
+
+def strategies(vary=VARY):
+	"""
+		Every combination of the options named in 'vary' that synth_ice40
+		takes, the rest as LiteX has them. The default strategy comes
+		first.
+	"""
+	vary = [option for option in CHOICES if option in vary]
+	found = []
+	for values in itertools.product(*(CHOICES[option] for option in vary)):
+		strategy = dict(flow.DEFAULT_STRATEGY)
+		strategy.update(zip(vary, values))
+		if flow.compatible(strategy):
+			found.append(strategy)
+	return found
+
+def _versions():
+	return {tool: flow.tool_version(tool).splitlines()[0][:80]
+				for tool in ("yosys", "nextpnr-ice40")}
+
+def recorded(design, path=default_strategies):
+	"""
+		The winning strategy the last sweep of 'design' recorded, as
+		its entry in the file ({"strategy": name, ...}), or None.
+	"""
+	if not os.path.exists(path):
+		return None
+	with open(path) as f:
+		return json.load(f).get(design)
+
+def record(design, result, prefer, path=default_strategies):
+	"""
+		Write the winning 'result' of a sweep of 'design' to the file.
+	"""
+	entries = {}
+	if os.path.exists(path):
+		with open(path) as f:
+			entries = json.load(f)
+	entries[design] = {
+		"strategy": result["strategy"],
+		"prefer": prefer,
+		"lcs": result["lcs"],
+		"fmax": result["fmax"],
+		"slack": result["slack"],
+		"time": time.strftime("%Y-%m-%d %H:%M:%S"),
+		"tools": _versions(),
+	}
+	tmp = f"{path}.{os.getpid()}"
+	with open(tmp, "w") as f:
+		json.dump(entries, f, indent=1, sort_keys=True)
+		f.write("\n")
+	os.replace(tmp, path)
+
+def lookup(design, strategy="recorded", path=default_strategies):
+	"""
+		What --strategy means for 'design': "recorded" is the sweep's
+		winner if there is one, otherwise the default. Returns the name
+		of the strategy to build with, and prints where it came from.
+	"""
+	if strategy != "recorded":
+		flow.parse_strategy(strategy)
+		return strategy
+	entry = recorded(design, path)
+	if entry is None:
+		return "default"
+	note = ""
+	if entry.get("tools") != _versions():
+		note = ", with other versions of the tools"
+	print(f"strategy: {entry['strategy']} (the {design} sweep's winner on "
+			f"{entry['prefer']}{note})")
+	return entry["strategy"]
+
+def _build(build_dir, strategy):
+	#
+	# One combination, in a worker process
+	#
+	name = flow.strategy_name(strategy)
+	log = os.path.join(build_dir, "sweep.log")
+	result = {"strategy": name, "lcs": None, "fmax": None, "slack": None,
+				"synth": None, "pnr": None}
+	try:
+		flow.apply_strategy(strategy, build_dir)
+		steps = flow.read_script(build_dir)
+		for stage in ("synth", "pnr"):
+			start = time.perf_counter()
+			flow.run_stage(steps, stage, build_dir, log)
+			if stage == "pnr":
+				flow.run_stage(steps, "pack", build_dir, log)
+			result[stage] = time.perf_counter() - start
+		rep, result["lcs"], result["fmax"] = flow.report(build_dir)
+		slacks = [s for s, achieved, constraint in timing.clocks(rep).values()]
+		result["slack"] = min(slacks, default=None)
+	except OSError as e:
+		result["error"] = str(e)
+	return result
+
+def _prepare(base, build_dir):
+	#
+	# A copy of the generated build directory, with the copy's top.v in
+	# the yosys script
+	#
+	shutil.rmtree(build_dir, ignore_errors=True)
+	shutil.copytree(base, build_dir)
+	ys = os.path.join(build_dir, "top.ys")
+	with open(ys) as f:
+		text = f.read()
+	with open(ys, "w") as f:
+		f.write(text.replace(os.path.abspath(base), os.path.abspath(build_dir)))
+
+def winner(results, prefer="lcs"):
+	"""
+		The result that met timing with the fewest LCs ('prefer' "lcs",
+		then the highest fmax) or the highest fmax ("fmax", then the
+		fewest LCs). None if none of them met timing.
+	"""
+	met = [r for r in results if r["slack"] is not None and r["slack"] >= 0]
+	if prefer == "lcs":
+		key = lambda r: (r["lcs"], -r["fmax"])
+	else:
+		key = lambda r: (-r["fmax"], r["lcs"])
+	return min(met, key=key, default=None)
+
+def sweep(name, directory, script, choices, pool):
+	"""
+		Write the Verilog for design 'name' and build it with every
+		strategy in 'choices' in 'pool'. Returns the results, one
+		dictionary per strategy.
+	"""
+	sweep_dir = os.path.join(directory, "build", "sweep")
+	base = os.path.join(sweep_dir, "verilog")
+	os.makedirs(sweep_dir, exist_ok=True)
+	with open(os.path.join(sweep_dir, "elaborate.log"), "w") as f, \
+			redirect_stdout(f), redirect_stderr(f):
+		_elaborate(directory, script, ["--verilog", "--build-dir", base,
+										"--strategy", "default"])
+	dirs = []
+	for strategy in choices:
+		build_dir = os.path.join(sweep_dir, flow.strategy_name(strategy))
+		_prepare(base, build_dir)
+		dirs.append(build_dir)
+	return list(pool.map(_build, dirs, choices))
+
+def _print(name, results, best):
+	print(f"{name}:")
+	print(f"{'strategy':24s}{'LCs':>5s}{'fmax':>10s}{'slack':>10s}"
+			f"{'synth':>9s}{'pnr':>9s}")
+	for r in results:
+		if "error" in r:
+			print(f"{r['strategy']:24s}  failed, see its sweep.log")
+			continue
+		slack = "-" if r["slack"] is None else f"{r['slack']:.2f}"
+		print(f"{r['strategy']:24s}{r['lcs']:5d}{r['fmax']:10.2f}{slack:>10s}"
+				f"{r['synth']:8.2f}s{r['pnr']:8.2f}s"
+				f"{'  <- best' if r is best else ''}")
+
+def main():
+	parser = argparse.ArgumentParser(description="Build designs with every "
+										"synthesis strategy and keep the best")
+	parser.add_argument("names", nargs="*",
+						help="designs to sweep (default: all of them)")
+	parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+						help="builds to run at once (default: all cores)")
+	parser.add_argument("--vary", default=",".join(VARY),
+						help=f"the options to try both ways, of "
+								f"{','.join(CHOICES)} (default "
+								f"{','.join(VARY)})")
+	parser.add_argument("--prefer", choices=PREFER, default="lcs",
+						help="what the winner has the best of, of the ones "
+								"that meet timing (default lcs)")
+	parser.add_argument("--no-record", action="store_true",
+						help=f"don't write the winners to "
+								f"{os.path.basename(default_strategies)}")
+	args = parser.parse_args()
+
+	vary = args.vary.split(",") if args.vary else []
+	unknown = [option for option in vary if option not in CHOICES]
+	if unknown:
+		parser.error(f"no option {', '.join(unknown)} to vary, there is "
+						f"{', '.join(CHOICES)}")
+	found = {d[0]: d for d in designs()}
+	names = args.names or list(found)
+	missing = [n for n in names if n not in found]
+	if missing:
+		parser.error(f"no design {', '.join(missing)}")
+
+	choices = strategies(vary)
+	failed = []
+	with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+		for name in names:
+			start = time.perf_counter()
+			results = sweep(*found[name], choices, pool)
+			best = winner(results, args.prefer)
+			_print(name, results, best)
+			print(f"{len(results)} builds in {time.perf_counter() - start:.1f}s")
+			if best is None:
+				print(f"{name}: nothing met timing, no winner")
+				failed.append(name)
+			elif not args.no_record:
+				record(name, best, args.prefer)
+				print(f"{name}: recorded {best['strategy']}")
+			print()
+	return 1 if failed else 0
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,144 @@
+#
+# Written for the icebitsy-with-litex examples.
+#
+# A timing gate for the build.
+#
+# LiteX runs nextpnr with --timing-allow-fail, so a design that can't
+# run at the clock it is constrained to still comes out as a top.bin and
+# nothing says so unless you go looking in the log. This reads the
+# report nextpnr writes (see tools/flow.py), works out the slack on each
+# constrained clock (how many ns are left over in each period) and, if
+# any of them has less than the margin asked for, either fails the build
+# or warns about it.
+#
+# For a clock that misses it prints the critical path: the register it
+# starts from and the one it ends at, under their names in the Migen
+# design (flow.generate() writes top_names.json to map them back), and
+# the delay of each step. yosys and nextpnr name the cells and nets they
+# make after the signals they came from (counter_SB_DFFSR_Q is a flip
+# flop in the register 'counter'), which is how we get back there.
+#
+# The example scripts take --timing fail|warn|off and --slack-margin,
+# either a margin in ns for every clock or CLOCK=NS for just one of them
+# (the clock as nextpnr calls it, or the start of its name), and so does
+# tools/build_all.py. The default fails the build on negative slack.
+#
+import os
+import re
+import json
+
+POLICIES = ("fail", "warn", "off")
+
+def margins(specs):
+	"""
+		Parse --slack-margin values, "NS" for every clock or "CLOCK=NS"
+		for one of them, into a dictionary of clock to ns (None is the
+		margin for every other clock).
+	"""
+	result = {}
+	for spec in specs or []:
+		clock, _, ns = spec.rpartition("=")
+		try:
+			result[clock or None] = float(ns)
+		except ValueError:
+			raise ValueError(f"bad slack margin '{spec}', it is NS or CLOCK=NS")
+	return result
+
+def _margin(clock, margin):
+	if not isinstance(margin, dict):
+		return margin
+	for name, ns in margin.items():
+		if name is not None and clock.startswith(name):
+			return ns
+	return margin.get(None, 0.0)
+
+def clocks(report):
+	"""
+		The constrained clocks in a nextpnr 'report' as a dictionary of
+		clock to (slack in ns, achieved MHz, constrained MHz).
+	"""
+	return {clk: (1e3 / f["constraint"] - 1e3 / f["achieved"], f["achieved"],
+					f["constraint"])
+				for clk, f in report.get("fmax", {}).items()}
+
+def _signal(name, names):
+	#
+	# The Migen signal a cell or net is named after. Take off the bit
+	# index and anything yosys or nextpnr added after it, then the
+	# longest Verilog name it starts with is the one.
+	#
+	name = re.sub(r"\[\d+\]", "", name.lstrip("\\"))
+	name = re.split(r"_SB_|\$", name)[0]
+	best = max((n for n in names if name == n or name.startswith(n + "_")),
+				key=len, default=None)
+	return names[best] if best is not None else name
+
+def critical_path(report, clock, names=None):
+	"""
+		The critical path nextpnr found for 'clock' as (start, end,
+		steps), start and end being the signals it goes between and
+		steps a list of (kind, where, ns). None if there isn't one.
+	"""
+	names = names or {}
+	for p in report.get("critical_paths", []):
+		# "from" and "to" are like "posedge sys_clk"
+		if clock in p.get("to", "") or clock in p.get("from", ""):
+			break
+	else:
+		# another clock's path would be the wrong one to blame
+		return None
+	steps = []
+	for step in p.get("path", []):
+		where = step.get("net") or step.get("to", {}).get("cell", "")
+		steps.append((step.get("type", "?"), where, step.get("delay", 0.0)))
+	if not steps:
+		return None
+	path = p["path"]
+	start = path[0].get("from", {}).get("cell") or path[0].get("net", "?")
+	end = path[-1].get("to", {}).get("cell") or path[-1].get("net", "?")
+	return _signal(start, names), _signal(end, names), steps
+
+def check(build_dir="build", build_name="top", policy="fail", margin=0.0):
+	"""
+		Gate a finished build on its timing. 'margin' is the slack (in
+		ns) every constrained clock has to have, or a dictionary from
+		margins(). With policy "fail" a clock short of it raises a
+		RuntimeError, with "warn" it is only printed. Returns the
+		{clock: slack} of the build.
+	"""
+	if policy not in POLICIES:
+		raise ValueError(f"timing policy is one of {', '.join(POLICIES)}")
+	if policy == "off":
+		return {}
+	path = os.path.join(build_dir, f"{build_name}_report.json")
+	if not os.path.exists(path):
+		raise RuntimeError(f"no {path}, nextpnr didn't write a timing report")
+	with open(path) as f:
+		report = json.load(f)
+	try:
+		with open(os.path.join(build_dir, f"{build_name}_names.json")) as f:
+			names = json.load(f)
+	except OSError:
+		names = {}
+
+	failed = []
+	for clk, (s, achieved, constraint) in sorted(clocks(report).items()):
+		need = _margin(clk, margin)
+		ok = s >= need
+		print(f"timing: {clk} {achieved:.2f} MHz for {constraint:.2f} MHz, "
+				f"slack {s:.2f} ns{'' if ok else f' (needs {need:.2f} ns)'}")
+		if ok:
+			continue
+		failed.append(clk)
+		found = critical_path(report, clk, names)
+		if found is not None:
+			start, end, steps = found
+			print(f"timing: critical path {start} -> {end}")
+			for kind, where, ns in steps:
+				print(f"timing:   {ns:6.2f} ns  {kind:10s} {_signal(where, names)}")
+	if failed:
+		message = f"{', '.join(failed)} short of the slack margin"
+		if policy == "fail":
+			raise RuntimeError(f"timing: {message}")
+		print(f"timing: warning, {message}")
+	return {clk: c[0] for clk, c in clocks(report).items()}
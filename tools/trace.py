@@ -0,0 +1,207 @@
+#
+# Written for the icebitsy-with-litex examples.
+#
+# Recording just the signals you care about from a simulation.
+#
+# A VCD from run_simulation() has every signal in the design on every
+# clock it changes, which for these designs is mostly the TickGenerator's
+# counters going round. A few million clocks makes gigabytes. Here you
+# pick the signals (the example scripts have a probes() function with the
+# interesting ones, which --trace records) and they are written when they
+# change, or, with a strobe, only on the clocks the strobe is high (say
+# every count of a counter).
+#
+# The file is written as the simulation goes, so a long run never sits
+# in memory. It starts with a short header naming the signals (and the
+# clock period, if it is known), then each change is three numbers: the
+# clocks since the last change, which signal and its new value. A last
+# entry for one past the last signal marks the clock the run ended. The
+# numbers are written 7 bits to a byte (the high bit says another byte
+# follows), so most changes take three or four bytes. Name the file .gz
+# and it is gzipped as well.
+#
+# The Stepper in tools/fastforward.py does the recording (so it works
+# with fast forward and on Verilator), read() reads a trace back as
+# (cycles, values) lists that tools/golden.py can check, and
+#
+#	python3 -m tools.trace show run.trc
+#	python3 -m tools.trace diff before.trc after.trc
+#
+# print what is in a trace, or where two of them first differ.
+#
+import os
+import sys
+import gzip
+import json
+import argparse
+
+MAGIC = b"ICETRACE1\n"
+
+def _open(path, mode):
+	return (gzip.open if path.endswith(".gz") else open)(path, mode)
+
+def _number(n):
+	#
+	# Unsigned LEB128, signed values are zigzagged first (0, -1, 1, -2,
+	# ... become 0, 1, 2, 3, ...) so small negative numbers stay small
+	#
+	n = (n << 1) if n >= 0 else ((-n << 1) - 1)
+	out = bytearray()
+	while True:
+		byte = n & 0x7f
+		n >>= 7
+		if n:
+			out.append(byte | 0x80)
+		else:
+			out.append(byte)
+			return bytes(out)
+
+def _numbers(data):
+	n, shift = 0, 0
+	for byte in data:
+		n |= (byte & 0x7f) << shift
+		shift += 7
+		if not byte & 0x80:
+			yield (n >> 1) if not n & 1 else -((n + 1) >> 1)
+			n, shift = 0, 0
+
+class Tracer:
+	"""
+		Records 'probes' (a dictionary of name: Signal) to 'path' as a
+		simulation runs, every time they change or, if a 'strobe' Signal
+		is given, on every clock it is high. 'clk_period' (in ns) goes in
+		the header. Hand it to the Stepper (or cli.simulate), and close()
+		it at the end.
+	"""
+	def __init__(self, path, probes, strobe=None, clk_period=None):
+		self.names = list(probes)
+		self.signals = [probes[name] for name in self.names]
+		self.strobe = strobe
+		# what the Stepper has to watch to see every sample
+		self.watch = self.signals if strobe is None else [strobe]
+		self.events = 0
+		self._file = _open(path, "wb")
+		header = json.dumps({
+			"signals": [[name, len(s)] for name, s in probes.items()],
+			"strobe": strobe is not None,
+			"clk_period": clk_period,
+		}).encode()
+		self._file.write(MAGIC + _number(len(header)) + header)
+		self._cycle = 0
+		self._last = [None] * len(self.signals)
+
+	def sample(self, cycle, values):
+		"""
+			Record the probes' 'values' on 'cycle' (the Stepper calls
+			this), only the ones that changed unless there is a strobe.
+		"""
+		out = []
+		for i, value in enumerate(values):
+			if self.strobe is None and value == self._last[i]:
+				continue
+			out.append(_number(cycle - self._cycle) + _number(i) + _number(value))
+			self._cycle = cycle
+			self._last[i] = value
+		self.events += len(out)
+		self._file.write(b"".join(out))
+
+	def close(self, cycle=None):
+		"""
+			Finish the file, 'cycle' is the clock the run ended on.
+		"""
+		if cycle is not None:
+			self._file.write(_number(cycle - self._cycle) +
+								_number(len(self.signals)) + _number(0))
+		self._file.close()
+
+def read(path):
+	"""
+		Read a trace, returns (header, traces) where traces maps each
+		signal's name to a (cycles, values) pair of lists. The header
+		has the clock the run ended on as "end" (None if the run didn't
+		finish).
+	"""
+	with _open(path, "rb") as f:
+		data = f.read()
+	if not data.startswith(MAGIC):
+		raise ValueError(f"{path} is not a trace")
+	numbers = _numbers(data[len(MAGIC):len(MAGIC) + 10])
+	length = next(numbers)
+	start = len(MAGIC) + len(_number(length))
+	header = json.loads(data[start:start + length])
+	names = [name for name, width in header["signals"]]
+	traces = {name: ([], []) for name in names}
+	numbers = _numbers(data[start + length:])
+	cycle = 0
+	header["end"] = None
+	for delta in numbers:
+		cycle += delta
+		index, value = next(numbers), next(numbers)
+		if index == len(names):
+			header["end"] = cycle
+			continue
+		cycles, values = traces[names[index]]
+		cycles.append(cycle)
+		values.append(value)
+	return header, traces
+
+def diff(a, b):
+	"""
+		Compare the traces in files 'a' and 'b', returns a description
+		of the first difference in each signal (empty if they match).
+	"""
+	(ha, ta), (hb, tb) = read(a), read(b)
+	differences = []
+	for name in ta.keys() | tb.keys():
+		if name not in ta or name not in tb:
+			differences.append(f"{name}: only in {a if name in ta else b}")
+			continue
+		ea, eb = list(zip(*ta[name])), list(zip(*tb[name]))
+		for i, (x, y) in enumerate(zip(ea, eb)):
+			if x != y:
+				differences.append(f"{name}: change {i} is {x[1]:#x} on clock "
+									f"{x[0]} in {a}, {y[1]:#x} on clock {y[0]} "
+									f"in {b}")
+				break
+		else:
+			if len(ea) != len(eb):
+				differences.append(f"{name}: {len(ea)} changes in {a}, "
+									f"{len(eb)} in {b}")
+	return sorted(differences)
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Look at simulation traces")
+	commands = parser.add_subparsers(dest="command", required=True)
+	show = commands.add_parser("show", help="summarize a trace")
+	show.add_argument("trace")
+	show.add_argument("--dump", action="store_true",
+						help="print every change as well")
+	compare = commands.add_parser("diff", help="compare two traces")
+	compare.add_argument("a")
+	compare.add_argument("b")
+	args = parser.parse_args(argv)
+
+	if args.command == "diff":
+		differences = diff(args.a, args.b)
+		for line in differences:
+			print(line)
+		return 1 if differences else 0
+
+	header, traces = read(args.trace)
+	size = os.path.getsize(args.trace)
+	events = sum(len(cycles) for cycles, values in traces.values())
+	last = header["end"] or max((cycles[-1] for cycles, values
+									in traces.values() if cycles), default=0)
+	kind = "samples" if header["strobe"] else "changes"
+	print(f"{args.trace}: {events} {kind} over {last} clocks, {size} bytes")
+	for name, width in header["signals"]:
+		print(f"  {name:16s}{width:4d} bits {len(traces[name][0]):10d} {kind}")
+	if args.dump:
+		merged = sorted((c, name, v) for name, (cycles, values) in traces.items()
+							for c, v in zip(cycles, values))
+		for cycle, name, value in merged:
+			print(f"{cycle:12d}  {name} = {value:#x}")
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main())